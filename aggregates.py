@@ -0,0 +1,122 @@
+import re
+
+AGGREGATE_PATTERN = re.compile(r"(COUNT|SUM|AVG|MIN|MAX)\s*\(\s*(\*|\w+(?:\.\w+)?)\s*\)", re.IGNORECASE)
+NUMERIC_TYPES = ("integer", "float", "boolean")
+
+
+def parse_select_list(text, column_types, group_by):
+    """Parse 'name, COUNT(*), AVG(age)' into (label, function, column) items.
+
+    function is None for a plain column, which must be one of the GROUP BY columns.
+    Raises ValueError for unknown columns, unknown functions or a non-numeric SUM/AVG.
+    """
+    items = []
+    for part in text.split(","):
+        part = part.strip()
+        match = AGGREGATE_PATTERN.fullmatch(part)
+        if match:
+            function, column = match.group(1).upper(), match.group(2)
+            if column == "*":
+                if function != "COUNT":
+                    raise ValueError(f"{function}(*) is not supported; use {function}(<column>).")
+                column = None
+            elif column not in column_types:
+                raise ValueError(f"Column '{column}' does not exist.")
+            elif function in ("SUM", "AVG") and column_types[column] not in NUMERIC_TYPES:
+                raise ValueError(f"{function} needs a numeric column, but '{column}' is {column_types[column]}.")
+            items.append((f"{function}({match.group(2)})", function, column))
+        elif part in group_by:
+            items.append((part, None, part))
+        elif re.fullmatch(r"\w+\s*\(.*\)", part):
+            raise ValueError(f"Unsupported aggregate '{part}'. Use COUNT, SUM, AVG, MIN or MAX.")
+        else:
+            raise ValueError(f"Column '{part}' must appear in GROUP BY or inside an aggregate.")
+    return items
+
+
+class Aggregator:
+    """Computes aggregates over a stream of rows in one pass, grouping rows in a hash map.
+
+    Each group keeps one small state per aggregate (a count, a running sum, a min or a
+    max), so memory grows with the number of groups, not the number of rows. SUM of
+    integers and booleans stays an exact integer; AVG is always a float.
+    """
+
+    def __init__(self, items, group_by):
+        self.items = items
+        self.group_by = list(group_by)
+        self.aggregates = [(function, column) for _, function, column in items if function]
+        self.groups = {}
+
+    def initial_state(self):
+        return [[0, None] for _ in self.aggregates]  # [count of values, sum/min/max]
+
+    def add(self, key, values):
+        """Add one row: key is its tuple of GROUP BY values, values are the aggregated columns in order."""
+        state = self.groups.get(key)
+        if state is None:
+            state = self.groups[key] = self.initial_state()
+        for slot, (function, _), value in zip(state, self.aggregates, values):
+            if value is None:
+                continue
+            slot[0] += 1
+            if function in ("SUM", "AVG"):
+                slot[1] = value if slot[1] is None else slot[1] + value
+            elif function == "MIN":
+                if slot[1] is None or value < slot[1]:
+                    slot[1] = value
+            elif function == "MAX":
+                if slot[1] is None or value > slot[1]:
+                    slot[1] = value
+
+    def consume(self, records):
+        """Add (key, values) records; COUNT(*) is passed a constant 1 so it counts every row."""
+        for key, values in records:
+            self.add(key, values)
+
+    def merge(self, groups):
+        """Fold in the groups another Aggregator computed over later rows (e.g. in a worker process)."""
+        for key, other in groups.items():
+            state = self.groups.get(key)
+            if state is None:
+                self.groups[key] = other
+                continue
+            for slot, (function, _), (count, value) in zip(state, self.aggregates, other):
+                if value is None:
+                    slot[0] += count
+                    continue
+                if slot[1] is None:
+                    slot[1] = value
+                elif function in ("SUM", "AVG"):
+                    slot[1] += value
+                elif function == "MIN":
+                    slot[1] = min(slot[1], value)
+                elif function == "MAX":
+                    slot[1] = max(slot[1], value)
+                slot[0] += count
+
+    def finish(self, slot, function):
+        count, value = slot
+        if function == "COUNT":
+            return count
+        if count == 0:
+            return None
+        if function == "AVG":
+            return value / count
+        if function == "SUM" and isinstance(value, bool):
+            return int(value)
+        return value
+
+    def results(self):
+        """Return one tuple per group (in order of first appearance) with the items' values."""
+        groups = self.groups
+        if not groups and not self.group_by:
+            groups = {(): self.initial_state()}  # Aggregates over no rows still give one row
+        results = []
+        for key, state in groups.items():
+            finished = iter([self.finish(slot, function) for slot, (function, _) in zip(state, self.aggregates)])
+            results.append(tuple(
+                next(finished) if function else key[self.group_by.index(column)]
+                for _, function, column in self.items
+            ))
+        return results
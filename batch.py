@@ -0,0 +1,185 @@
+import re
+import sys
+import csv
+import json
+import time
+import argparse
+from main import CommandSession
+from statements import is_statement
+
+OUTPUT_FORMATS = ("text", "csv", "jsonl")
+
+# Statements the parser does not cover, turned into the interactive command and the
+# answers to its prompts
+STATEMENTS = [
+    (re.compile(r"CREATE TABLE\s+(\w+)\s*\((.*)\)(\s+COLUMNAR)?"),
+     lambda name, columns, columnar: (f"CREATE TABLE {name}{' COLUMNAR' if columnar else ''}", [columns])),
+    (re.compile(r"INSERT INTO\s+(\w+)\s+VALUES\s+(<<.*)"),
+     lambda name, values: (f"INSERT INTO {name}", [values])),
+    (re.compile(r"(EXPORT (?:TABLE|DATABASE)\s+.+?)\s+FILE\s+(\S+)"),
+     lambda command, output_file: (command, [output_file])),
+]
+
+
+def translate(statement):
+    """Return the interactive command and prompt answers for a single-line statement."""
+    for pattern, convert in STATEMENTS:
+        match = pattern.fullmatch(statement)
+        if match:
+            return convert(*match.groups())
+    return statement, []
+
+
+class BatchRunner:
+    """Runs a script of single-line statements in one process, one statement per line.
+
+    Statements are the CLI commands, plus single-line forms of those that prompt:
+      CREATE TABLE users (id:integer, name:string) [COLUMNAR]
+      INSERT INTO users VALUES (1, John), (2, Jane)     (or VALUES <<END, rows, END)
+      UPDATE users SET name="Jim", age=30 WHERE id = 1
+      DELETE FROM users WHERE id = 1
+      SELECT id, name FROM users WHERE age > 20 ORDER BY age DESC LIMIT 10 OFFSET 5
+      EXPORT TABLE users TO csv WHERE age > 20 FILE users.csv
+    SELECT, INSERT, UPDATE and DELETE go through the statement parser (statements.py),
+    which keeps each distinct statement prepared, so a script repeating one only parses it once.
+    Blank lines and lines starting with '--' or '#' are skipped, as is a trailing ';'.
+
+    Results are written as text (like the CLI), CSV (query rows only; messages and timing
+    go to the error stream) or JSON lines (one object per statement, with its timing).
+    """
+
+    def __init__(self, db_path="earthdb_data", output_format="text", timing=False, bail=False,
+                 out=sys.stdout, err=sys.stderr):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output format '{output_format}'. Use {', '.join(OUTPUT_FORMATS)}.")
+        self.session = CommandSession(db_path=db_path)
+        self.output_format = output_format
+        self.timing = timing
+        self.bail = bail
+        self.out = out
+        self.err = err
+        self.csv_writer = csv.writer(out)
+        self.executed = 0
+        self.failed = 0
+
+    def use_database(self, db_name):
+        """Select the database the statements run against, like USE DATABASE."""
+        output, _ = self.session.run_scripted(f"USE DATABASE {db_name}")
+        if output.startswith("Error"):
+            raise ValueError(output)
+
+    def run(self, lines):
+        """Run every statement of a script; return the number of statements that failed."""
+        started = time.perf_counter()
+        lines = iter(enumerate(lines, 1))
+        for line_number, line in lines:
+            statement = line.strip()
+            if not statement or statement.startswith(("--", "#")):
+                continue
+            statement = statement.rstrip(";").rstrip()
+
+            command, inputs = translate(statement)
+            if command.startswith("INSERT INTO") and inputs and inputs[0].startswith("<<"):
+                # The rows follow on their own lines, up to the terminator
+                terminator = inputs[0][2:].strip() or "END"
+                for _, row in lines:
+                    inputs.append(row.strip())
+                    if row.strip() == terminator:
+                        break
+
+            statement_started = time.perf_counter()
+            ok, result, keep_going = self.execute(statement, command, inputs)
+            elapsed = time.perf_counter() - statement_started
+            self.executed += 1
+            self.failed += not ok
+            self.report(line_number, statement, ok, result, elapsed)
+            if not keep_going or (self.bail and not ok):
+                break
+
+        if self.timing:
+            total = (time.perf_counter() - started) * 1000
+            self.err.write(f"{self.executed} statement(s) in {total:.3f} ms, {self.failed} failed.\n")
+        self.out.flush()
+        return self.failed
+
+    def execute(self, statement, command, inputs):
+        """Run one statement; return (ok, result, whether to go on).
+
+        result is {'columns', 'rows'} for a query and {'message'} for any other statement.
+        """
+        try:
+            if is_statement(statement) and command == statement:
+                columns, rows, message = self.session.run_statement(statement)
+                if columns is not None:
+                    return True, {"columns": columns, "rows": [tuple(row[column] for column in columns) for row in rows]}, True
+                return not message.startswith("Error"), {"message": message}, True
+            output, keep_going = self.session.run_scripted(command, inputs)
+        except EOFError:
+            return False, {"message": f"Error: Incomplete statement. '{statement}' needs its single-line form."}, True
+        except Exception as e:
+            output, keep_going = str(e) if str(e).startswith("Error:") else f"Error: {e}", True
+        return not output.startswith("Error"), {"message": output}, keep_going
+
+    def report(self, line_number, statement, ok, result, elapsed):
+        """Write the result of one statement in the output format."""
+        milliseconds = elapsed * 1000
+        if self.output_format == "jsonl":
+            record = {"line": line_number, "statement": statement, "ok": ok}
+            if "rows" in result:
+                record["columns"] = result["columns"]
+                record["rows"] = [list(row) for row in result["rows"]]
+            else:
+                record["message"] = result["message"]
+            record["ms"] = round(milliseconds, 3)
+            self.out.write(json.dumps(record) + "\n")
+            return
+
+        if self.output_format == "csv":
+            if "rows" in result:
+                self.csv_writer.writerow(result["columns"])
+                self.csv_writer.writerows(result["rows"])
+            elif result["message"]:
+                self.err.write(result["message"] + "\n")
+            if self.timing:
+                self.err.write(f"Time: {milliseconds:.3f} ms (line {line_number})\n")
+            return
+
+        if "rows" in result:
+            text = "\n".join([", ".join(result["columns"])] + [", ".join(map(str, row)) for row in result["rows"]])
+        else:
+            text = result["message"]
+        if text:
+            self.out.write(text + "\n")
+        if self.timing:
+            self.out.write(f"Time: {milliseconds:.3f} ms\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="main.py", description="Run a script of EarthDB statements, one per line, from a file or stdin."
+    )
+    parser.add_argument("-f", "--file", default="-", help="script to run ('-', the default, reads stdin)")
+    parser.add_argument("-d", "--database", help="database to use from the start")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="text", help="output format (default: text)")
+    parser.add_argument("--timing", action="store_true", help="report the time taken by every statement")
+    parser.add_argument("--bail", action="store_true", help="stop at the first statement that fails")
+    parser.add_argument("--data", default="earthdb_data", help="data directory (default: earthdb_data)")
+    args = parser.parse_args(argv)
+
+    runner = BatchRunner(args.data, args.format, args.timing, args.bail)
+    if args.database:
+        try:
+            runner.use_database(args.database)
+        except ValueError as e:
+            sys.stderr.write(f"{e}\n")
+            return 1
+    if args.file == "-":
+        failed = runner.run(sys.stdin)
+    else:
+        with open(args.file, "r", encoding="utf-8") as f:
+            failed = runner.run(f)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
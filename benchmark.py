@@ -0,0 +1,424 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from create_db import DatabaseManager
+from create_tables import TableManager
+from operation_tables import TableOperations
+from query_tables import QueryTables
+from export_functionality import ExportFunctionality
+from database_cache import database_cache
+
+DB_NAME = "bench"
+TABLE_NAME = "data"
+CHUNK_ROWS = 50000  # Rows generated and inserted at a time, so 10M rows never sit in memory at once
+DEFAULT_THRESHOLD = 0.20  # A case regressed if its median time grew by more than this fraction
+NOISE_SECONDS = 0.001  # ...and by more than this, so sub-millisecond jitter is never a regression
+
+# Every case, in the order it runs; later cases use the table the earlier ones built
+CASES = (
+    "insert_bulk", "insert_single", "load_cold", "load_warm", "select_point", "select_range",
+    "select_ordered", "create_index", "select_point_indexed", "update", "delete",
+    "export_csv", "export_json", "import_csv", "import_json",
+)
+
+
+def parse_columns(text):
+    """Parse a column mix like 'integer=2,string=1' into [(type, count)]."""
+    mix = []
+    for part in text.split(","):
+        col_type, _, count = part.strip().partition("=")
+        if col_type not in TableManager.SUPPORTED_TYPES:
+            raise ValueError(f"Unsupported column type '{col_type}'. Use {', '.join(TableManager.SUPPORTED_TYPES)}.")
+        mix.append((col_type, int(count or 1)))
+    return mix
+
+
+class DataGenerator:
+    """Generates the same rows for the same seed, row count, column mix and skew.
+
+    The first column 'id' numbers the rows from 0. With skew 0 every other value is
+    drawn uniformly; a higher skew makes small integers, the first strings of the
+    vocabulary, small floats and false increasingly common, like real data with hot keys.
+    """
+
+    def __init__(self, rows, column_mix, skew=1.0, seed=42, cardinality=1000):
+        self.rows = rows
+        self.skew = skew
+        self.seed = seed
+        self.cardinality = cardinality  # Distinct values of integer and string columns
+        self.columns = [("id", "integer")]
+        for col_type, count in column_mix:
+            prefix = {"integer": "int", "string": "str", "float": "float", "boolean": "bool"}[col_type]
+            self.columns.extend((f"{prefix}_{i}", col_type) for i in range(1, count + 1))
+        self.vocabulary = [f"value_{i:06d}" for i in range(cardinality)]
+
+    def schema(self):
+        """Return the columns as the 'name:type' strings create_table takes."""
+        return [f"{name}:{col_type}" for name, col_type in self.columns]
+
+    def column(self, col_type):
+        """Return the name of the first generated column of a type, or None."""
+        return next((name for name, kind in self.columns[1:] if kind == col_type), None)
+
+    def skewed(self, rng):
+        """Return a number in [0, 1) biased towards 0 as skew grows."""
+        return rng.random() ** (1 + self.skew)
+
+    def value(self, rng, col_type):
+        if col_type == "integer":
+            return int(self.skewed(rng) * self.cardinality)
+        if col_type == "string":
+            return self.vocabulary[int(self.skewed(rng) * self.cardinality)]
+        if col_type == "float":
+            return round(self.skewed(rng) * 1000, 3)
+        return self.skewed(rng) >= 0.5
+
+    def chunks(self, start=0, count=None, chunk_rows=CHUNK_ROWS):
+        """Yield lists of rows (values in column order) with ids from start."""
+        count = self.rows if count is None else count
+        rng = random.Random(f"{self.seed}:{start}")
+        types = [col_type for _, col_type in self.columns[1:]]
+        for first in range(start, start + count, chunk_rows):
+            last = min(first + chunk_rows, start + count)
+            yield [[row_id] + [self.value(rng, col_type) for col_type in types] for row_id in range(first, last)]
+
+
+class BenchmarkSuite:
+    """Times EarthDB operations on a generated table; each case runs repeat times.
+
+    Cases are named in CASES. A case reports the minimum and median time of its runs and
+    how many operations (rows or queries) one run performs. 'Cold' loads drop EarthDB's own
+    cache first; the operating system may still hold the files in its page cache.
+    """
+
+    def __init__(self, generator, db_path, storage_format="rows", repeat=3, queries=100, log=sys.stderr):
+        self.generator = generator
+        self.db_path = db_path
+        self.storage_format = storage_format
+        self.repeat = repeat
+        self.queries = queries
+        self.log = log
+        self.rng = random.Random(generator.seed + 1)  # Query parameters, independent of the data
+        self.db_manager = DatabaseManager(db_path)
+        self.table_manager = TableManager(db_path)
+        self.table_operations = TableOperations(db_path)
+        self.query_tables = QueryTables(db_path)
+        self.export_path = os.path.join(db_path, "exports")
+        self.export_functionality = ExportFunctionality(db_path, self.export_path)
+        self.next_id = generator.rows  # Id of the next row inserted after the initial load
+
+    def check(self, result):
+        """Fail the case if an operation returned an error message."""
+        if isinstance(result, str) and result.startswith("Error"):
+            raise RuntimeError(result)
+        return result
+
+    def time_case(self, name, operations, run, setup=None):
+        """Run a case repeat times; return its result entry."""
+        times = []
+        for _ in range(self.repeat):
+            arguments = setup() if setup else ()
+            started = time.perf_counter()
+            run(*arguments)
+            times.append(time.perf_counter() - started)
+        median = statistics.median(times)
+        result = {
+            "seconds_min": min(times),
+            "seconds_median": median,
+            "operations": operations,
+            "ops_per_sec": operations / median if median else None,
+        }
+        self.log.write(f"  {name:<22} {median * 1000:12.3f} ms  ({result['ops_per_sec'] or 0:,.0f} ops/s)\n")
+        return result
+
+    def run(self, cases=CASES):
+        """Run the selected cases in CASES order; return {case: result}."""
+        generator = self.generator
+        self.check(self.db_manager.create_database(DB_NAME))
+        self.create_table(TABLE_NAME)
+        results = {}
+
+        # Bulk loading always runs, since every other case needs the table
+        results["insert_bulk"] = self.time_case("insert_bulk", generator.rows, self.insert_bulk, self.reset_table)
+        for name in CASES[1:]:
+            if name in cases:
+                results[name] = getattr(self, "case_" + name)()
+        return {name: result for name, result in results.items() if name in cases}
+
+    def create_table(self, table_name):
+        self.check(self.table_manager.create_table(
+            DB_NAME, table_name, self.generator.schema(), self.storage_format
+        ))
+
+    def reset_table(self):
+        """Recreate the table empty, so every bulk load starts from the same state."""
+        self.check(self.table_manager.drop_table(DB_NAME, TABLE_NAME))
+        self.create_table(TABLE_NAME)
+        return ()
+
+    def insert_bulk(self):
+        for chunk in self.generator.chunks():
+            self.check(self.table_operations.insert_many(DB_NAME, TABLE_NAME, chunk))
+
+    def case_insert_single(self):
+        count = max(1, min(1000, self.generator.rows // 10))
+
+        def setup():
+            rows = next(self.generator.chunks(self.next_id, count, chunk_rows=count))
+            self.next_id += count
+            return (rows,)
+
+        def run(rows):
+            for row in rows:
+                self.check(self.table_operations.insert_into_table(DB_NAME, TABLE_NAME, row))
+
+        return self.time_case("insert_single", count, run, setup)
+
+    def case_load_cold(self):
+        def run():
+            database_cache.clear()
+            self.table_operations.storage.load_table(DB_NAME, TABLE_NAME)
+
+        return self.time_case("load_cold", self.generator.rows, run)
+
+    def case_load_warm(self):
+        self.table_operations.storage.load_table(DB_NAME, TABLE_NAME)
+        return self.time_case(
+            "load_warm", self.generator.rows, lambda: self.table_operations.storage.load_table(DB_NAME, TABLE_NAME)
+        )
+
+    def point_queries(self, name, count):
+        def setup():
+            return ([self.rng.randrange(self.generator.rows) for _ in range(count)],)
+
+        def run(ids):
+            for row_id in ids:
+                self.check(self.query_tables.query_rows(DB_NAME, TABLE_NAME, "*", f"id = {row_id}")[2] or "")
+
+        return self.time_case(name, count, run, setup)
+
+    def case_select_point(self):
+        # Without an index every lookup scans the table, so fewer of them run on big tables
+        return self.point_queries("select_point", max(3, min(self.queries, 10_000_000 // self.generator.rows)))
+
+    def case_select_point_indexed(self):
+        if not self.has_index():
+            self.check(self.table_manager.create_index(DB_NAME, TABLE_NAME, "id", "ordered"))
+        return self.point_queries("select_point_indexed", self.queries)
+
+    def has_index(self):
+        """Return whether the table has an index on 'id'."""
+        entry = self.table_operations.storage.load_catalog(DB_NAME)["tables"][TABLE_NAME]
+        return "id" in entry.get("indexes", {})
+
+    def range_condition(self):
+        """Return a condition matching about 1% of the rows by id."""
+        width = max(1, self.generator.rows // 100)
+        start = self.rng.randrange(max(1, self.generator.rows - width))
+        return f"id >= {start} AND id < {start + width}"
+
+    def case_select_range(self):
+        count = max(1, min(10, self.queries))
+
+        def setup():
+            return ([self.range_condition() for _ in range(count)],)
+
+        def run(conditions):
+            for condition in conditions:
+                self.check(self.query_tables.query_rows(DB_NAME, TABLE_NAME, "*", condition)[2] or "")
+
+        return self.time_case("select_range", count, run, setup)
+
+    def case_select_ordered(self):
+        order_by = self.generator.column("float") or self.generator.column("integer") or "id"
+
+        def run():
+            self.check(self.query_tables.query_rows(
+                DB_NAME, TABLE_NAME, "*", None, order_by, "desc", limit=100
+            )[2] or "")
+
+        return self.time_case("select_ordered", 1, run)
+
+    def case_create_index(self):
+        def setup():
+            if self.has_index():
+                self.check(self.table_manager.drop_index(DB_NAME, TABLE_NAME, "id"))
+            return ()
+
+        return self.time_case(
+            "create_index", self.generator.rows,
+            lambda: self.check(self.table_manager.create_index(DB_NAME, TABLE_NAME, "id", "ordered")), setup
+        )
+
+    def case_update(self):
+        column, col_type = self.generator.columns[-1]
+        value = {"integer": "7", "string": "updated", "float": "0.5", "boolean": "true"}[col_type]
+        return self.time_case(
+            "update", max(1, self.generator.rows // 100),
+            lambda condition: self.check(self.table_operations.update_table(
+                DB_NAME, TABLE_NAME, f"{column}={value}", condition
+            )),
+            lambda: (self.range_condition(),),
+        )
+
+    def case_delete(self):
+        return self.time_case(
+            "delete", max(1, self.generator.rows // 100),
+            lambda condition: self.check(self.table_operations.delete_from_table(DB_NAME, TABLE_NAME, condition)),
+            lambda: (self.range_condition(),),
+        )
+
+    def case_export_csv(self):
+        return self.time_case("export_csv", self.generator.rows, lambda: self.check(
+            self.export_functionality.export_table_to_csv(DB_NAME, TABLE_NAME, "bench.csv")
+        ))
+
+    def case_export_json(self):
+        return self.time_case("export_json", self.generator.rows, lambda: self.check(
+            self.export_functionality.export_table_to_json(DB_NAME, TABLE_NAME, "bench.json")
+        ))
+
+    def export_file(self, name, export):
+        """Return the path of an exported file, exporting it first if its case did not run."""
+        path = os.path.join(self.export_path, name)
+        if not os.path.exists(path):
+            self.check(export(DB_NAME, TABLE_NAME, name))
+        return path
+
+    def import_case(self, name, path, import_file):
+        def setup():
+            if "imported" in self.table_operations.storage.load_catalog(DB_NAME)["tables"]:
+                self.check(self.table_manager.drop_table(DB_NAME, "imported"))
+            return ()
+
+        return self.time_case(name, self.generator.rows, lambda: self.check(import_file(DB_NAME, "imported", path)), setup)
+
+    def case_import_csv(self):
+        path = self.export_file("bench.csv", self.export_functionality.export_table_to_csv)
+        return self.import_case("import_csv", path, self.export_functionality.import_table_from_csv)
+
+    def case_import_json(self):
+        path = self.export_file("bench.json", self.export_functionality.export_table_to_json)
+        return self.import_case("import_json", path, self.export_functionality.import_table_from_json)
+
+
+def git_commit():
+    """Return the short hash of the checked-out commit, or None outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Compare two benchmark reports; return (text table, names of the cases that regressed).
+
+    A case regressed if its median time grew by more than threshold (0.2 = 20%)
+    and by more than NOISE_SECONDS.
+    """
+    lines = []
+    if results["config"] != baseline.get("config"):
+        lines.append("Warning: the baseline ran with a different configuration; times may not be comparable.")
+    lines.append(f"{'case':<22} {'baseline ms':>12} {'current ms':>12} {'change':>8}")
+    regressions = []
+    for name, result in results["results"].items():
+        before = baseline.get("results", {}).get(name)
+        current = result["seconds_median"]
+        if before is None:
+            lines.append(f"{name:<22} {'-':>12} {current * 1000:12.3f} {'new':>8}")
+            continue
+        change = current / before["seconds_median"] - 1 if before["seconds_median"] else 0.0
+        status = ""
+        if change > threshold and current - before["seconds_median"] > NOISE_SECONDS:
+            regressions.append(name)
+            status = "  REGRESSION"
+        lines.append(f"{name:<22} {before['seconds_median'] * 1000:12.3f} {current * 1000:12.3f} {change:+8.1%}{status}")
+    return "\n".join(lines), regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="benchmark.py", description="Time EarthDB operations on generated data and compare runs."
+    )
+    parser.add_argument("--rows", type=int, default=10000, help="rows in the generated table (default: 10000)")
+    parser.add_argument("--columns", default="integer=1,string=1,float=1,boolean=1",
+                        help="column mix besides 'id', e.g. integer=2,string=1 (default: one of each type)")
+    parser.add_argument("--skew", type=float, default=1.0, help="value skew, 0 for uniform (default: 1.0)")
+    parser.add_argument("--seed", type=int, default=42, help="random seed (default: 42)")
+    parser.add_argument("--format", choices=("rows", "columnar"), default="rows", help="table storage format")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the median is compared (default: 3)")
+    parser.add_argument("--queries", type=int, default=100, help="point lookups per run (default: 100)")
+    parser.add_argument("--cases", help=f"comma-separated cases to run (default: all of {', '.join(CASES)})")
+    parser.add_argument("--data", help="directory for the benchmark database (default: a temporary one)")
+    parser.add_argument("--output", help="write the JSON report to this file ('-' for stdout)")
+    parser.add_argument("--compare", help="JSON report of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="slowdown that counts as a regression (default: 0.20, i.e. 20%%)")
+    args = parser.parse_args(argv)
+
+    try:
+        column_mix = parse_columns(args.columns)
+        cases = CASES if not args.cases else [case.strip() for case in args.cases.split(",")]
+        unknown = [case for case in cases if case not in CASES]
+        if unknown:
+            raise ValueError(f"Unknown case(s): {', '.join(unknown)}.")
+        if args.rows < 1:
+            raise ValueError("--rows must be at least 1.")
+    except ValueError as e:
+        parser.error(str(e))
+
+    generator = DataGenerator(args.rows, column_mix, args.skew, args.seed)
+    db_path = args.data or tempfile.mkdtemp(prefix="earthdb-bench-")
+    if os.path.exists(os.path.join(db_path, DB_NAME)):
+        parser.error(f"'{db_path}' already holds a '{DB_NAME}' database; pass an empty --data directory.")
+    sys.stderr.write(f"Benchmarking {args.rows:,} rows ({args.format}) in {db_path}:\n")
+    try:
+        suite = BenchmarkSuite(generator, db_path, args.format, args.repeat, args.queries)
+        results = suite.run(cases)
+    finally:
+        database_cache.clear()
+        if not args.data:
+            shutil.rmtree(db_path, ignore_errors=True)
+
+    report = {
+        "version": 1,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "rows": args.rows, "columns": generator.schema(), "skew": args.skew, "seed": args.seed,
+            "format": args.format, "repeat": args.repeat, "queries": args.queries,
+        },
+        "results": results,
+    }
+    if args.output == "-":
+        sys.stdout.write(json.dumps(report, indent=2) + "\n")
+    elif args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        table, regressions = compare(report, baseline, args.threshold)
+        sys.stderr.write(table + "\n")
+        if regressions:
+            sys.stderr.write(f"{len(regressions)} case(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}\n")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,191 @@
+import json
+import queue
+import socket
+import threading
+import itertools
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 7483
+DEFAULT_POOL_SIZE = 4
+
+
+class EarthDBError(Exception):
+    """Raised for a command the server could not run (e.g. an incomplete request)."""
+
+
+class Connection:
+    """One socket to the server, reading and writing one JSON object per line."""
+
+    def __init__(self, host, port, socket_path, timeout):
+        if socket_path:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.settimeout(timeout)
+            self.socket.connect(socket_path)
+        else:
+            self.socket = socket.create_connection((host, port), timeout)
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.socket.makefile("rb")
+        self.ids = itertools.count(1)
+
+    def encode(self, requests):
+        """Number requests and encode them; return (ids, bytes to send). The server answers in order."""
+        ids = []
+        lines = []
+        for request in requests:
+            request = dict(request, id=next(self.ids))
+            ids.append(request["id"])
+            lines.append(json.dumps(request) + "\n")
+        return ids, "".join(lines).encode("utf-8")
+
+    def exchange(self, requests):
+        """Send requests and return their responses.
+
+        Several requests are sent from a second thread while the responses are read, so
+        neither side stalls with a full socket buffer in the middle of a long pipeline.
+        """
+        ids, payload = self.encode(requests)
+        if len(ids) == 1:
+            self.socket.sendall(payload)
+            return self.receive(ids)
+        sender = threading.Thread(target=self.socket.sendall, args=(payload,), daemon=True)
+        sender.start()
+        responses = self.receive(ids)
+        sender.join()
+        return responses
+
+    def receive(self, ids):
+        """Read the responses to requests sent earlier."""
+        responses = []
+        for request_id in ids:
+            line = self.reader.readline()
+            if not line:
+                raise ConnectionError("The EarthDB server closed the connection.")
+            response = json.loads(line)
+            if response.get("id") != request_id:
+                raise ConnectionError("Response out of order from the EarthDB server.")
+            responses.append(response)
+        return responses
+
+    def close(self):
+        self.reader.close()
+        self.socket.close()
+
+
+class EarthDBClient:
+    """Client for an EarthDB server, keeping a pool of open connections.
+
+    Commands are the CLI's, and inputs answer its prompts in order:
+      client.execute("SELECT FROM users", ["*", "age > 20", ""], database="test")
+    returns the text the CLI would print. pipeline() sends many commands on one
+    connection before reading any response, saving a round trip per command.
+
+    query() runs a SELECT, INSERT, UPDATE or DELETE statement with values for its '?'
+    placeholders, which the server parses and validates only the first time it sees it:
+      client.query("SELECT name FROM users WHERE id = ?", [42], database="test")
+    returns the rows as dicts; query_many() runs one statement for many parameter lists
+    in a single pipeline.
+
+    Connections keep their session on the server, so pass database with each command
+    rather than relying on a USE DATABASE sent over another pooled connection.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, pool_size=DEFAULT_POOL_SIZE, timeout=None):
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(pool_size)  # Connections open or being used
+
+    def request(self, command, inputs=(), database=None):
+        request = {"command": command, "inputs": list(inputs)}
+        if database is not None:
+            request["database"] = database
+        return request
+
+    def acquire(self):
+        """Take an idle connection, or open one while the pool has room (waiting otherwise)."""
+        self.slots.acquire()
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return Connection(self.host, self.port, self.socket_path, self.timeout)
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, connection, broken=False):
+        if broken:
+            connection.close()
+        else:
+            self.idle.put(connection)
+        self.slots.release()
+
+    def send(self, requests, closes=False):
+        """Send requests on one connection and return their responses.
+
+        Raises EarthDBError for the first request the server could not run, after all
+        of them were answered.
+        """
+        connection = self.acquire()
+        try:
+            responses = connection.exchange(requests)
+        except (OSError, ValueError):
+            self.release(connection, broken=True)
+            raise
+        self.release(connection, broken=closes)
+
+        for response in responses:
+            if not response["ok"]:
+                raise EarthDBError(response["output"])
+        return responses
+
+    def pipeline(self, commands, database=None):
+        """Run (command, inputs) pairs in order on one connection; return every output."""
+        requests = [self.request(command, inputs, database) for command, inputs in commands]
+        # The server ends the session after EXIT
+        responses = self.send(requests, closes=any(command.strip().lower() == "exit" for command, _ in commands))
+        return [response["output"] for response in responses]
+
+    def execute(self, command, inputs=(), database=None):
+        """Run one command and return its output."""
+        return self.pipeline([(command, inputs)], database)[0]
+
+    def query_many(self, statement, parameter_lists, database=None):
+        """Run a statement once per parameter list on one connection; return every result.
+
+        A result is a list of row dicts for a SELECT and the message for other statements.
+        """
+        requests = []
+        for parameters in parameter_lists:
+            request = {"statement": statement, "parameters": list(parameters)}
+            if database is not None:
+                request["database"] = database
+            requests.append(request)
+        results = []
+        for response in self.send(requests):
+            if "rows" in response:
+                results.append([dict(zip(response["columns"], row)) for row in response["rows"]])
+            else:
+                results.append(response["output"])
+        return results
+
+    def query(self, statement, parameters=(), database=None):
+        """Run one statement; return its rows as dicts for a SELECT, otherwise its message."""
+        return self.query_many(statement, [parameters], database)[0]
+
+    def close(self):
+        """Close the idle connections."""
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,442 @@
+import os
+import sys
+import json
+import mmap
+import array
+import operator
+
+MAGIC = b"EDBCOL1\n"
+ALIGNMENT = 8  # Buffers start on 8-byte boundaries so they can be read in place
+
+# Array type codes of the fixed-width column types
+TYPECODES = {"integer": "q", "float": "d", "boolean": "b"}
+
+
+def scan_values(values, op, value):
+    """Return the positions of the values for which 'item <op> value' holds."""
+    return [position for position, item in enumerate(values) if op(item, value)]
+
+
+class ArrayColumn:
+    """Integer, float or boolean values packed into an array.array, 1-8 bytes each.
+
+    A column read from a file holds a memoryview cast over the mapped file instead, so
+    values are read in place; it is copied into an array on its first change.
+    """
+
+    encoding = "array"
+
+    def __init__(self, col_type, data=None):
+        self.col_type = col_type
+        self.typecode = TYPECODES[col_type]
+        self.data = data if data is not None else array.array(self.typecode)
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, position):
+        value = self.data[position]
+        return bool(value) if self.col_type == "boolean" else value
+
+    def values(self):
+        return map(bool, self.data) if self.col_type == "boolean" else self.data
+
+    def scan(self, op, value):
+        return scan_values(self.values(), op, value)
+
+    def writable(self):
+        if isinstance(self.data, memoryview):
+            data = array.array(self.typecode)
+            data.frombytes(self.data.cast("B"))
+            self.data = data
+
+    def extend(self, values):
+        # Building the new array first leaves the column untouched if a value does not fit
+        values = array.array(self.typecode, values)
+        self.writable()
+        self.data.extend(values)
+
+    def fits(self, value):
+        try:
+            array.array(self.typecode, [value])
+            return True
+        except (TypeError, OverflowError):
+            return False
+
+    def set(self, position, value):
+        self.writable()
+        self.data[position] = value
+
+    def take(self, positions):
+        """Return a new column holding only the values at the given positions."""
+        data = self.data
+        return ArrayColumn(self.col_type, array.array(self.typecode, [data[position] for position in positions]))
+
+    def copy(self):
+        """Return a column that can be changed independently; a mapped file is shared until written."""
+        return ArrayColumn(self.col_type, self.data if isinstance(self.data, memoryview) else self.data[:])
+
+    def buffers(self):
+        return [self.data]
+
+    @classmethod
+    def from_buffers(cls, col_type, buffers, swap):
+        if not swap:
+            return cls(col_type, buffers[0].cast(TYPECODES[col_type]))
+        data = array.array(TYPECODES[col_type])
+        data.frombytes(buffers[0])
+        data.byteswap()
+        return cls(col_type, data)
+
+
+class StringColumn:
+    """Strings stored as one UTF-8 blob with the start and end offset of each value.
+
+    An update appends the new bytes and leaves the old ones behind; the column is
+    compacted when it is written to disk or when half of the blob is unused. Like
+    ArrayColumn, a column read from a file works on memoryviews of the mapped file
+    until its first change.
+    """
+
+    encoding = "string"
+
+    def __init__(self, col_type="string", starts=None, ends=None, blob=None):
+        self.col_type = col_type
+        self.starts = starts if starts is not None else array.array("q")
+        self.ends = ends if ends is not None else array.array("q")
+        self.blob = blob if blob is not None else bytearray()
+        self.unused = 0  # Bytes no longer referenced by any value
+
+    def __len__(self):
+        return len(self.starts)
+
+    def get(self, position):
+        return str(self.blob[self.starts[position]:self.ends[position]], "utf-8")
+
+    def values(self):
+        blob = self.blob
+        return (str(blob[start:end], "utf-8") for start, end in zip(self.starts, self.ends))
+
+    def scan(self, op, value):
+        """Equality compares the stored UTF-8 bytes directly, without decoding every value."""
+        if op is operator.eq or op is operator.ne:
+            blob = self.blob
+            encoded = value.encode("utf-8")
+            return [
+                position for position, (start, end) in enumerate(zip(self.starts, self.ends))
+                if op(blob[start:end], encoded)
+            ]
+        return scan_values(self.values(), op, value)
+
+    def writable(self):
+        if isinstance(self.blob, memoryview):
+            self.starts = array.array("q", self.starts)
+            self.ends = array.array("q", self.ends)
+            self.blob = bytearray(self.blob)
+
+    def extend(self, values):
+        encoded = [value.encode("utf-8") for value in values]  # Non-strings raise before anything changes
+        self.writable()
+        starts, ends, offset = self.starts, self.ends, len(self.blob)
+        for value in encoded:
+            starts.append(offset)
+            offset += len(value)
+            ends.append(offset)
+        self.blob += b"".join(encoded)
+
+    def fits(self, value):
+        return isinstance(value, str)
+
+    def set(self, position, value):
+        encoded = value.encode("utf-8")
+        self.writable()
+        self.unused += self.ends[position] - self.starts[position]
+        self.starts[position] = len(self.blob)
+        self.blob += encoded
+        self.ends[position] = len(self.blob)
+        if self.unused * 2 > len(self.blob):
+            compacted = self.take(range(len(self)))
+            self.starts, self.ends, self.blob, self.unused = compacted.starts, compacted.ends, compacted.blob, 0
+
+    def take(self, positions):
+        column = StringColumn(self.col_type)
+        blob, starts, ends = self.blob, self.starts, self.ends
+        column.extend_encoded(blob[starts[position]:ends[position]] for position in positions)
+        return column
+
+    def copy(self):
+        if isinstance(self.blob, memoryview):
+            return StringColumn(self.col_type, self.starts, self.ends, self.blob)
+        column = StringColumn(self.col_type, self.starts[:], self.ends[:], self.blob[:])
+        column.unused = self.unused
+        return column
+
+    def extend_encoded(self, values):
+        offset = len(self.blob)
+        for value in values:
+            self.starts.append(offset)
+            self.blob += value
+            offset += len(value)
+            self.ends.append(offset)
+
+    def buffers(self):
+        """Return the offsets (one more than values) and the blob, compacting first if needed."""
+        if self.unused:
+            return self.take(range(len(self))).buffers()
+        offsets = array.array("q", self.starts)
+        offsets.append(len(self.blob))
+        return [offsets, self.blob]
+
+    @classmethod
+    def from_buffers(cls, col_type, buffers, swap):
+        if swap:
+            offsets = array.array("q")
+            offsets.frombytes(buffers[0])
+            offsets.byteswap()
+        else:
+            offsets = buffers[0].cast("q")
+        return cls(col_type, offsets[:-1], offsets[1:], buffers[1])
+
+
+class JsonColumn:
+    """Fallback for values a typed column cannot hold (e.g. integers over 64 bits): a plain list.
+
+    On disk the values are JSON-encoded in the same offsets+blob layout as strings.
+    """
+
+    encoding = "json"
+
+    def __init__(self, col_type, data=None):
+        self.col_type = col_type
+        self.data = data if data is not None else []
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, position):
+        return self.data[position]
+
+    def values(self):
+        return self.data
+
+    def scan(self, op, value):
+        return scan_values(self.data, op, value)
+
+    def extend(self, values):
+        self.data.extend(values)
+
+    def fits(self, value):
+        return True
+
+    def set(self, position, value):
+        self.data[position] = value
+
+    def take(self, positions):
+        data = self.data
+        return JsonColumn(self.col_type, [data[position] for position in positions])
+
+    def copy(self):
+        return JsonColumn(self.col_type, list(self.data))
+
+    def buffers(self):
+        column = StringColumn()
+        column.extend(json.dumps(value) for value in self.data)
+        return column.buffers()
+
+    @classmethod
+    def from_buffers(cls, col_type, buffers, swap):
+        strings = StringColumn.from_buffers("string", buffers, swap)
+        return cls(col_type, [json.loads(value) for value in strings.values()])
+
+
+ENCODINGS = {column.encoding: column for column in (ArrayColumn, StringColumn, JsonColumn)}
+
+
+def create_column(col_type):
+    """Return an empty column in the most compact encoding for its type."""
+    if col_type in TYPECODES:
+        return ArrayColumn(col_type)
+    if col_type == "string":
+        return StringColumn(col_type)
+    return JsonColumn(col_type)
+
+
+class ColumnarRows:
+    """The rows of a columnar table, stored column by column instead of as one dict per row.
+
+    It behaves like the list of row dicts used for row tables: len(), iteration and
+    rows[position] return dicts built on the fly, and extend() appends row dicts. Scans
+    can read a single column through column_values() without building any dicts.
+    """
+
+    def __init__(self, columns, data=None):
+        self.names = list(columns)
+        self.data = data if data is not None else {name: create_column(columns[name]) for name in columns}
+
+    def __len__(self):
+        return len(self.data[self.names[0]]) if self.names else 0
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        return {name: self.data[name].get(position) for name in self.names}
+
+    def __iter__(self):
+        names = self.names
+        for values in zip(*(self.data[name].values() for name in names)):
+            yield dict(zip(names, values))
+
+    def copy(self):
+        """Return rows that can be changed without affecting these (e.g. inside a transaction)."""
+        return ColumnarRows(self.names, {name: column.copy() for name, column in self.data.items()})
+
+    def column(self, name):
+        return self.data[name]
+
+    def column_values(self, name):
+        """Return an iterable over one column's values in row order."""
+        return self.data[name].values()
+
+    def select(self, positions, names):
+        """Build row dicts holding only the given columns, for the rows at positions (all if None)."""
+        if positions is None:
+            return [dict(zip(names, values)) for values in zip(*(self.data[name].values() for name in names))]
+        getters = [(name, self.data[name].get) for name in names]
+        return [{name: get(position) for name, get in getters} for position in positions]
+
+    def extend(self, rows):
+        """Append row dicts; a column whose values no longer fit its encoding becomes a JsonColumn."""
+        if not isinstance(rows, list):
+            rows = list(rows)
+        for name in self.names:
+            values = [row.get(name) for row in rows]
+            column = self.data[name]
+            try:
+                column.extend(values)
+            except (TypeError, OverflowError, AttributeError):
+                column = self.data[name] = JsonColumn(column.col_type, list(column.values()))
+                column.extend(values)
+
+    def update_rows(self, positions, values):
+        """Set columns to new values in the rows at positions (every row if None)."""
+        if positions is None:
+            positions = range(len(self))
+        for name, value in values.items():
+            column = self.data[name]
+            if not column.fits(value):
+                column = self.data[name] = JsonColumn(column.col_type, list(column.values()))
+            for position in positions:
+                column.set(position, value)
+
+    def delete_rows(self, positions):
+        """Remove the rows at positions (every row if None)."""
+        if positions is None:
+            self.data = {name: create_column(self.data[name].col_type) for name in self.names}
+            return
+        deleted = set(positions)
+        keep = [position for position in range(len(self)) if position not in deleted]
+        self.data = {name: column.take(keep) for name, column in self.data.items()}
+
+
+def column_values(rows, column):
+    """Return one column of a table's rows, reading it directly from a columnar table."""
+    if isinstance(rows, ColumnarRows):
+        return rows.column_values(column)
+    return (row[column] for row in rows)
+
+
+def scan_columns(rows, node, positions=None):
+    """Evaluate a condition column by column over a columnar table, without building rows.
+
+    Each comparison reads only its own column, and AND checks later comparisons only
+    against the positions the earlier ones kept. Returns sorted positions.
+    """
+    kind = node[0]
+    if kind == "compare":
+        _, column, op, value = node
+        if positions is None:
+            return rows.column(column).scan(op, value)
+        get = rows.column(column).get
+        return [position for position in positions if op(get(position), value)]
+    if kind == "and":
+        for child in node[1]:
+            positions = scan_columns(rows, child, positions)
+        return positions
+    if kind == "or":
+        matched = set()
+        for child in node[1]:
+            matched.update(scan_columns(rows, child, positions))
+        return sorted(matched)
+    excluded = set(scan_columns(rows, node[1], positions))
+    return [position for position in (range(len(rows)) if positions is None else positions) if position not in excluded]
+
+
+def write_table_file(path, columns, rows):
+    """Write rows (ColumnarRows or row dicts) to a columnar table file.
+
+    Layout: MAGIC, the header length as 8 little-endian bytes, a JSON header giving
+    the encoding and [offset, length] of every column buffer, then the buffers, each
+    starting at a multiple of 8 bytes from the start of the data section.
+    """
+    if not isinstance(rows, ColumnarRows):
+        table_rows = ColumnarRows(columns)
+        table_rows.extend(rows)
+        rows = table_rows
+
+    header = {"byteorder": sys.byteorder, "rows": len(rows), "columns": {}}
+    buffers = []
+    offset = 0
+    for name in rows.names:
+        column = rows.column(name)
+        spans = []
+        for buffer in column.buffers():
+            length = memoryview(buffer).nbytes
+            spans.append([offset, length])
+            buffers.append((offset, buffer))
+            offset += length + (-length % ALIGNMENT)
+        header["columns"][name] = {"type": column.col_type, "encoding": column.encoding, "buffers": spans}
+
+    encoded_header = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    encoded_header += b" " * (-(len(MAGIC) + 8 + len(encoded_header)) % ALIGNMENT)
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(encoded_header).to_bytes(8, "little"))
+        f.write(encoded_header)
+        start = f.tell()
+        for buffer_offset, buffer in buffers:
+            f.write(b"\0" * (start + buffer_offset - f.tell()))
+            f.write(buffer)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_header(data):
+    """Parse the header of a columnar table file; return (header, start of the data section)."""
+    if bytes(data[:len(MAGIC)]) != MAGIC:
+        raise ValueError("Not a columnar table file.")
+    header_length = int.from_bytes(data[len(MAGIC):len(MAGIC) + 8], "little")
+    start = len(MAGIC) + 8 + header_length
+    return json.loads(bytes(data[len(MAGIC) + 8:start])), start
+
+
+def read_table_file(path):
+    """Open a columnar table file as ColumnarRows without reading the column buffers.
+
+    The file is memory-mapped read-only, so values are paged in only when a scan touches
+    them and processes reading the same table share the OS page cache. Windows cannot
+    delete a mapped file, so the file is read into memory there instead.
+    """
+    with open(path, "rb") as f:
+        if os.name == "nt":
+            data = memoryview(f.read())
+        else:
+            data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    header, start = read_header(data)
+    swap = header["byteorder"] != sys.byteorder
+    columns = {}
+    for name, info in header["columns"].items():
+        buffers = [data[start + offset:start + offset + length] for offset, length in info["buffers"]]
+        columns[name] = ENCODINGS[info["encoding"]].from_buffers(info["type"], buffers, swap)
+    return ColumnarRows({name: column.col_type for name, column in columns.items()}, columns)
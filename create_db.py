@@ -1,34 +1,43 @@
 import os
-import json
+from storage import DatabaseStorage
 
 class DatabaseManager:
     def __init__(self, storage_path="earthdb_data"):
         self.storage_path = storage_path
         if not os.path.exists(storage_path):
             os.makedirs(storage_path)
+        self.storage = DatabaseStorage(storage_path)
 
     def create_database(self, db_name):
-        """Creates a new database (JSON file)."""
-        db_file = os.path.join(self.storage_path, f"{db_name}.json")
-        if os.path.exists(db_file):
-            return f"Error: Database '{db_name}' already exists!"
-        with open(db_file, "w") as f:
-            json.dump({"tables": {}}, f) 
-        return f"Database '{db_name}' created successfully."
+        """Creates a new database (directory with a catalog file)."""
+        with self.storage.locked(db_name, exclusive=True):
+            if self.storage.database_exists(db_name):
+                return f"Error: Database '{db_name}' already exists!"
+            self.storage.create_database(db_name)
+            return f"Database '{db_name}' created successfully."
 
     def delete_database(self, db_name):
-        """Deletes a database (JSON file)."""
-        db_file = os.path.join(self.storage_path, f"{db_name}.json")
-        if not os.path.exists(db_file):
-            return f"Error: Database '{db_name}' does not exist!"
-        os.remove(db_file)
-        return f"Database '{db_name}' deleted successfully."
+        """Deletes a database and all of its table files."""
+        with self.storage.locked(db_name, exclusive=True):
+            if not self.storage.database_exists(db_name):
+                return f"Error: Database '{db_name}' does not exist!"
+            self.storage.delete_database(db_name)
+            return f"Database '{db_name}' deleted successfully."
+
+    def migrate_database(self, db_name):
+        """Converts a single-file database ('<name>.json') to the catalog + per-table layout."""
+        if not os.path.exists(self.storage.legacy_file(db_name)):
+            return f"Error: Database '{db_name}' is not stored in the single-file format!"
+        self.storage.migrate_database(db_name)
+        return f"Database '{db_name}' migrated successfully."
+
+    def database_exists(self, db_name):
+        """Checks whether a database exists in either storage format."""
+        return self.storage.database_exists(db_name)
 
     def list_databases(self):
-        """Lists all databases (JSON files)."""
-        databases = [
-            file.replace(".json", "") for file in os.listdir(self.storage_path) if file.endswith(".json")
-        ]
+        """Lists all databases."""
+        databases = self.storage.list_databases()
         if not databases:
             return "No databases found."
         return "\n".join(databases)
@@ -1,65 +1,87 @@
-import os
-import json
+from storage import DatabaseStorage
+from indexes import INDEX_TYPES
 
 class TableManager:
     SUPPORTED_TYPES = ["integer", "string", "float", "boolean"]  # Allowed data types
+    STORAGE_FORMATS = ["rows", "columnar"]  # One JSON object per row, or one typed buffer per column
 
     def __init__(self, db_path="earthdb_data"):
         self.db_path = db_path
+        self.storage = DatabaseStorage(db_path)
 
-    def load_database(self, db_name):
-        """Load the JSON file of the specified database."""
-        db_file = os.path.join(self.db_path, f"{db_name}.json")
-        if not os.path.exists(db_file):
-            raise Exception(f"Error: Database '{db_name}' does not exist!")
-        with open(db_file, "r") as f:
-            return json.load(f), db_file
+    def load_catalog(self, db_name):
+        """Load the catalog (tables and their columns) of the specified database."""
+        return self.storage.load_catalog(db_name)
 
-    def save_database(self, db_data, db_file):
-        """Save changes to the database JSON file."""
-        with open(db_file, "w") as f:
-            json.dump(db_data, f, indent=4)
+    def create_table(self, db_name, table_name, columns_with_types, storage_format="rows"):
+        """Create a new table in the specified database, stored row by row or column by column."""
+        with self.storage.locked(db_name, exclusive=True):
+            catalog = self.load_catalog(db_name)
+            if table_name in catalog["tables"]:
+                return f"Error: Table '{table_name}' already exists in database '{db_name}'!"
+            storage_format = storage_format.lower()
+            if storage_format not in self.STORAGE_FORMATS:
+                return f"Error: Unsupported storage format '{storage_format}'. Supported formats are: {', '.join(self.STORAGE_FORMATS)}"
 
-    def create_table(self, db_name, table_name, columns_with_types):
-        """Create a new table in the specified database."""
-        db_data, db_file = self.load_database(db_name)
-        if table_name in db_data["tables"]:
-            return f"Error: Table '{table_name}' already exists in database '{db_name}'!"
+            # Parse and validate columns and types
+            columns = {}
+            for column_def in columns_with_types:
+                try:
+                    column_name, column_type = column_def.split(":")
+                    column_name = column_name.strip()
+                    column_type = column_type.strip().lower()
+                    if column_type not in self.SUPPORTED_TYPES:
+                        return f"Error: Unsupported data type '{column_type}'. Supported types are: {', '.join(self.SUPPORTED_TYPES)}"
+                    columns[column_name] = column_type
+                except ValueError:
+                    return f"Error: Invalid column definition '{column_def}'. Use format 'column_name:type'."
 
-        # Parse and validate columns and types
-        columns = {}
-        for column_def in columns_with_types:
-            try:
-                column_name, column_type = column_def.split(":")
-                column_name = column_name.strip()
-                column_type = column_type.strip().lower()
-                if column_type not in self.SUPPORTED_TYPES:
-                    return f"Error: Unsupported data type '{column_type}'. Supported types are: {', '.join(self.SUPPORTED_TYPES)}"
-                columns[column_name] = column_type
-            except ValueError:
-                return f"Error: Invalid column definition '{column_def}'. Use format 'column_name:type'."
-
-        # Create table metadata
-        db_data["tables"][table_name] = {
-            "columns": columns,
-            "rows": []
-        }
-        self.save_database(db_data, db_file)
-        return f"Table '{table_name}' created successfully in database '{db_name}'."
+            # Create table metadata and an empty rows file
+            self.storage.write_table(db_name, table_name, columns, [], storage_format)
+            return f"Table '{table_name}' created successfully in database '{db_name}'."
 
     def drop_table(self, db_name, table_name):
         """Drop a table from the specified database."""
-        db_data, db_file = self.load_database(db_name)
-        if table_name not in db_data["tables"]:
-            return f"Error: Table '{table_name}' does not exist in database '{db_name}'!"
-        del db_data["tables"][table_name]
-        self.save_database(db_data, db_file)
-        return f"Table '{table_name}' dropped successfully from database '{db_name}'."
+        with self.storage.locked(db_name, exclusive=True):
+            catalog = self.load_catalog(db_name)
+            if table_name not in catalog["tables"]:
+                return f"Error: Table '{table_name}' does not exist in database '{db_name}'!"
+            self.storage.drop_table(db_name, table_name)
+            return f"Table '{table_name}' dropped successfully from database '{db_name}'."
+
+    def create_index(self, db_name, table_name, column_name, index_type="hash"):
+        """Create an index over a column of the specified table."""
+        with self.storage.locked(db_name, exclusive=True):
+            catalog = self.load_catalog(db_name)
+            if table_name not in catalog["tables"]:
+                return f"Error: Table '{table_name}' does not exist in database '{db_name}'!"
+            table = catalog["tables"][table_name]
+            if column_name not in table["columns"]:
+                return f"Error: Column '{column_name}' does not exist in table '{table_name}'."
+            if column_name in table.get("indexes", {}):
+                return f"Error: Column '{column_name}' of table '{table_name}' is already indexed!"
+            index_type = index_type.lower()
+            if index_type not in INDEX_TYPES:
+                return f"Error: Unsupported index type '{index_type}'. Supported types are: {', '.join(INDEX_TYPES)}"
+
+            self.storage.create_index(db_name, table_name, column_name, index_type)
+            return f"Index on '{table_name}({column_name})' created successfully."
+
+    def drop_index(self, db_name, table_name, column_name):
+        """Drop the index over a column of the specified table."""
+        with self.storage.locked(db_name, exclusive=True):
+            catalog = self.load_catalog(db_name)
+            if table_name not in catalog["tables"]:
+                return f"Error: Table '{table_name}' does not exist in database '{db_name}'!"
+            if column_name not in catalog["tables"][table_name].get("indexes", {}):
+                return f"Error: Column '{column_name}' of table '{table_name}' is not indexed!"
+
+            self.storage.drop_index(db_name, table_name, column_name)
+            return f"Index on '{table_name}({column_name})' dropped successfully."
 
     def list_tables(self, db_name):
         """List all tables in the specified database."""
-        db_data, _ = self.load_database(db_name)
-        tables = db_data["tables"]
+        tables = self.load_catalog(db_name)["tables"]
         if not tables:
             return f"No tables found in database '{db_name}'."
         return "\n".join(tables.keys())
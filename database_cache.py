@@ -0,0 +1,86 @@
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024  # Memory budget, measured in on-disk JSON bytes
+
+
+class DatabaseCache:
+    """Keeps loaded databases in memory so repeated commands skip re-reading their files.
+
+    Each entry is tagged with a signature (mtime and size of the files that can change on
+    disk). A different signature means another process changed the database, and the entry
+    is dropped so it is read again.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> [signature, size, value], oldest first
+        self.total_bytes = 0
+        self.lock = threading.RLock()
+
+    def get(self, key, signature):
+        """Return the cached value, or None when it is missing or stale."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != signature:
+                self.invalidate(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry[2]
+
+    def put(self, key, signature, size, value):
+        """Store a value as most recently used and evict old entries over the budget."""
+        with self.lock:
+            self.invalidate(key)
+            self.entries[key] = [signature, size, value]
+            self.total_bytes += size
+            self.evict()
+
+    def refresh(self, key, signature):
+        """Record that the cached value matches the files again after writing them ourselves."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry[0] = signature
+
+    def resize(self, key, size):
+        """Update the memory cost of an entry that grew, e.g. when one more table was loaded."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.total_bytes += size - entry[1]
+                entry[1] = size
+                self.evict()
+
+    def evict(self):
+        """Evict least recently used entries, but always keep the most recent one."""
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, evicted_size, _) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+
+    def invalidate(self, key):
+        """Drop an entry from the cache (e.g. after its database was deleted)."""
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry[1]
+
+    def set_max_bytes(self, max_bytes):
+        """Change the memory budget, evicting entries if the new budget is smaller."""
+        with self.lock:
+            self.max_bytes = max_bytes
+            while self.total_bytes > self.max_bytes and self.entries:
+                _, (_, evicted_size, _) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def clear(self):
+        """Drop every cached entry."""
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+
+# Shared by every manager in the process
+database_cache = DatabaseCache()
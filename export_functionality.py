@@ -1,118 +1,349 @@
 import os
+import re
 import json
 import csv
+import time
+import gzip
+import itertools
+from storage import DatabaseStorage
+from query_tables import QueryTables
+from operation_tables import CONVERTERS
+
+DEFAULT_CHUNK_SIZE = 10000  # Rows converted and written at a time by CSV imports, and between export progress reports
+DEFAULT_SAMPLE_SIZE = 1000  # Rows read to infer column types when no schema is given
+
+INTEGER_PATTERN = re.compile(r"[+-]?\d+")
+FLOAT_PATTERN = re.compile(r"[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+
+# Type candidates for inference, narrowest first; a column no candidate fits is a string
+TYPE_CHECKS = [
+    ("integer", INTEGER_PATTERN.fullmatch),
+    ("float", FLOAT_PATTERN.fullmatch),
+    ("boolean", lambda value: value.lower() in ("true", "false")),
+]
+
+
+def narrow_types(candidates, header, row):
+    """Drop the type candidates of each column that a row's value does not fit."""
+    for column, value in zip(header, row):
+        checks = candidates.get(column)
+        if checks:
+            candidates[column] = [(name, check) for name, check in checks if check(value)]
+
+
+def parse_schema(schema):
+    """Turn a 'col:type, ...' string (or a dict) into a {column: type} dict."""
+    if not schema:
+        return {}
+    if isinstance(schema, str):
+        parsed = {}
+        for part in schema.split(","):
+            column, separator, column_type = part.partition(":")
+            if not separator or not column.strip() or not column_type.strip():
+                raise ValueError(f"Invalid schema entry '{part.strip()}'. Use 'column:type'.")
+            parsed[column.strip()] = column_type.strip().lower()
+        schema = parsed
+    for column, column_type in schema.items():
+        if column_type not in CONVERTERS:
+            raise ValueError(f"Unsupported column type '{column_type}' for column '{column}'.")
+    return dict(schema)
+
+
+def with_progress(rows, progress, every=DEFAULT_CHUNK_SIZE):
+    """Yield rows, calling progress(rows so far, rows_per_sec) after every `every` rows and at the end."""
+    started = time.perf_counter()
+    done = 0
+    for done, row in enumerate(rows, 1):
+        yield row
+        if done % every == 0:
+            progress(done, done / max(time.perf_counter() - started, 1e-9))
+    progress(done, done / max(time.perf_counter() - started, 1e-9))
+
+
+class InvalidValue(ValueError):
+    """A CSV value that does not convert to its column's type."""
+
+    def __init__(self, message, column):
+        super().__init__(message)
+        self.column = column
+
+
+def convert_rows(chunk, names, positions, converters):
+    """Convert (line number, values) records into row dicts, naming the line of a bad value."""
+    try:
+        return [
+            {name: converter(values[position]) for name, position, converter in zip(names, positions, converters)}
+            for _, values in chunk
+        ]
+    except (ValueError, TypeError):
+        for line, values in chunk:
+            for name, position, converter in zip(names, positions, converters):
+                try:
+                    converter(values[position])
+                except (ValueError, TypeError):
+                    raise InvalidValue(
+                        f"Line {line}: invalid value '{values[position]}' for column '{name}'.", name
+                    ) from None
+        raise
 
 class ExportFunctionality:
     def __init__(self, db_path="earthdb_data", export_path="exports"):
         self.db_path = db_path
         self.export_path = export_path
+        self.storage = DatabaseStorage(db_path)
+        self.query_tables = QueryTables(db_path)
 
         # Ensure the export folder exists
         if not os.path.exists(self.export_path):
             os.makedirs(self.export_path)
 
-    def load_database(self, db_name):
-        """Load the JSON file of the specified database."""
-        db_file = os.path.join(self.db_path, f"{db_name}.json")
-        if not os.path.exists(db_file):
-            raise Exception(f"Error: Database '{db_name}' does not exist!")
-        with open(db_file, "r") as f:
-            return json.load(f), db_file
-
-    def export_table_to_csv(self, db_name, table_name, output_file):
-        """Export a specific table to a CSV file."""
-        db_data, _ = self.load_database(db_name)
-        if table_name not in db_data["tables"]:
-            return f"Error: Table '{table_name}' does not exist in database '{db_name}'!"
+    def open_output(self, output_file, compress=False):
+        """Open a file in the exports folder for writing text, gzip-compressed if requested."""
+        if compress and not output_file.endswith(".gz"):
+            output_file += ".gz"
+        output_path = os.path.join(self.export_path, output_file)
+        if compress:
+            return output_path, gzip.open(output_path, "wt", newline="")
+        return output_path, open(output_path, "w", newline="")
 
-        table = db_data["tables"][table_name]
-        rows = table["rows"]
-        columns = list(table["columns"].keys())
+    def export_rows(self, db_name, table_name, columns="*", condition=None, order_by=None, sort_order="asc"):
+        """Return (column types, iterator over the rows, error) for a table or the result of a query on it.
 
-        if not rows:
-            return f"Error: Table '{table_name}' is empty!"
+        Rows are projected to the selected columns. Without ORDER BY they come straight from
+        the rows file; sorting has to load the table (and returns a list, made an iterator here).
+        """
+        selected, rows, error = self.query_tables.query_rows(
+            db_name, table_name, columns, condition, order_by, sort_order, stream=True
+        )
+        if error:
+            return None, None, error
+        column_types = self.storage.load_catalog(db_name)["tables"][table_name]["columns"]
+        if columns != "*":
+            rows = ({column: row[column] for column in selected} for row in rows)
+        return {column: column_types[column] for column in selected}, iter(rows), None
 
-        # Ensure the output file is in the exports folder
-        output_path = os.path.join(self.export_path, output_file)
+    def export_table_to_csv(self, db_name, table_name, output_file, compress=False,
+                            columns="*", condition=None, order_by=None, sort_order="asc", progress=None):
+        """Export a table, or the rows a query selects from it, to a CSV file.
 
-        # Write to CSV
-        with open(output_path, "w", newline="") as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=columns)
-            writer.writeheader()
-            writer.writerows(rows)
+        progress(rows, rows_per_sec) is called every DEFAULT_CHUNK_SIZE rows; if it raises,
+        the export stops and its file is removed.
+        """
+        column_types, rows, error = self.export_rows(db_name, table_name, columns, condition, order_by, sort_order)
+        if error:
+            return error
+        if progress:
+            rows = with_progress(rows, progress)
 
-        return f"Table '{table_name}' exported successfully to '{output_path}'."
+        first_row = next(rows, None)
+        if first_row is None and condition is None:
+            return f"Error: Table '{table_name}' is empty!"
 
-    def export_table_to_json(self, db_name, table_name, output_file):
-        """Export a specific table to a JSON file."""
-        db_data, _ = self.load_database(db_name)
-        if table_name not in db_data["tables"]:
-            return f"Error: Table '{table_name}' does not exist in database '{db_name}'!"
+        output_path, csvfile = self.open_output(output_file, compress)
+        try:
+            with csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=list(column_types))
+                writer.writeheader()
+                if first_row is not None:
+                    writer.writerow(first_row)
+                    writer.writerows(rows)
+        except BaseException:
+            os.remove(output_path)  # Leave no partial export behind
+            raise
 
-        table = db_data["tables"][table_name]
+        return f"Table '{table_name}' exported successfully to '{output_path}'."
 
-        # Ensure the output file is in the exports folder
-        output_path = os.path.join(self.export_path, output_file)
+    def export_table_to_json(self, db_name, table_name, output_file, compress=False, ndjson=False,
+                             columns="*", condition=None, order_by=None, sort_order="asc", progress=None):
+        """Export a table, or the rows a query selects from it, to a JSON or NDJSON file.
 
-        # Write to JSON
-        with open(output_path, "w") as jsonfile:
-            json.dump(table, jsonfile, indent=4)
+        NDJSON writes one row object per line and leaves out the column types. progress
+        works as for export_table_to_csv.
+        """
+        column_types, rows, error = self.export_rows(db_name, table_name, columns, condition, order_by, sort_order)
+        if error:
+            return error
+        if progress:
+            rows = with_progress(rows, progress)
 
-        return f"Table '{table_name}' exported successfully to '{output_path}'."
+        output_path, jsonfile = self.open_output(output_file, compress)
+        try:
+            with jsonfile:
+                if ndjson:
+                    for row in rows:
+                        jsonfile.write(json.dumps(row))
+                        jsonfile.write("\n")
+                else:
+                    jsonfile.write("{\n")
+                    self.write_json_table(jsonfile, column_types, rows, "")
+                    jsonfile.write("\n}\n")
+        except BaseException:
+            os.remove(output_path)  # Leave no partial export behind
+            raise
 
-    def export_database_to_json(self, db_name, output_file):
-        """Export the entire database to a JSON file."""
-        db_data, _ = self.load_database(db_name)
+        return f"Table '{table_name}' exported successfully to '{output_path}'."
 
-        # Ensure the output file is in the exports folder
-        output_path = os.path.join(self.export_path, output_file)
+    def export_database_to_json(self, db_name, output_file, compress=False):
+        """Export the entire database to a JSON file, one table at a time."""
+        catalog = self.storage.load_catalog(db_name)
 
-        # Write to JSON
-        with open(output_path, "w") as jsonfile:
-            json.dump(db_data, jsonfile, indent=4)
+        output_path, jsonfile = self.open_output(output_file, compress)
+        with jsonfile:
+            jsonfile.write('{\n    "tables": {')
+            for i, table_name in enumerate(catalog["tables"]):
+                jsonfile.write("," if i else "")
+                jsonfile.write(f"\n        {json.dumps(table_name)}: {{\n")
+                self.write_json_table(
+                    jsonfile, catalog["tables"][table_name]["columns"],
+                    self.storage.iter_rows(db_name, table_name), " " * 8
+                )
+                jsonfile.write("\n        }")
+            jsonfile.write("\n    }\n}\n" if catalog["tables"] else "}\n}\n")
 
         return f"Database '{db_name}' exported successfully to '{output_path}'."
 
+    def write_json_table(self, jsonfile, columns, rows, margin):
+        """Write the '"columns": ..., "rows": [...]' members of a table object, a row at a time."""
+        jsonfile.write(f'{margin}    "columns": {json.dumps(columns)},\n{margin}    "rows": [')
+        separator = "\n"
+        for row in rows:
+            jsonfile.write(f"{separator}{margin}        {json.dumps(row)}")
+            separator = ",\n"
+        jsonfile.write(f"\n{margin}    ]" if separator == ",\n" else "]")
+
+    def open_input(self, input_file):
+        """Open a file for reading text, decompressing it if it ends with '.gz'."""
+        if input_file.endswith(".gz"):
+            return gzip.open(input_file, "rt", newline="")
+        return open(input_file, "r", newline="")
+
     def import_table_from_json(self, db_name, table_name, input_file):
         """Import a table from a JSON file."""
-        db_data, db_file = self.load_database(db_name)
+        self.storage.load_catalog(db_name)  # Fail early if the database does not exist
 
         # Load JSON data
-        with open(input_file, "r") as jsonfile:
+        with self.open_input(input_file) as jsonfile:
             table_data = json.load(jsonfile)
 
         if "rows" not in table_data or "columns" not in table_data:
             return "Error: Invalid JSON file format for table import."
 
-        db_data["tables"][table_name] = table_data
-        
-        # Save database
-        with open(db_file, "w") as f:
-            json.dump(db_data, f, indent=4)
+        # Save the table to its own rows file
+        self.storage.write_table(db_name, table_name, table_data["columns"], table_data["rows"])
 
         return f"Table '{table_name}' imported successfully from '{input_file}'."
 
-    def import_table_from_csv(self, db_name, table_name, input_file):
-        """Import a table from a CSV file."""
-        db_data, db_file = self.load_database(db_name)
+    def import_table_from_csv(self, db_name, table_name, input_file, schema=None, append=False,
+                              chunk_size=DEFAULT_CHUNK_SIZE, sample_size=DEFAULT_SAMPLE_SIZE, progress=None):
+        """Import a table from a CSV file, streaming it in chunks of rows.
 
-        # Read CSV data
-        with open(input_file, "r") as csvfile:
-            reader = csv.DictReader(csvfile)
-            rows = [row for row in reader]
+        Column types come from the existing table when appending, then from schema (a dict or
+        'col:type, ...' string) and otherwise are inferred from the first sample_size rows
+        (None reads the whole file once to infer). If a later value does not fit a type
+        inferred from the sample, the import starts over with the whole file inferred; a
+        file without rows makes every inferred column a string. progress(rows,
+        rows_per_sec) is called after every chunk.
+        """
+        catalog = self.storage.load_catalog(db_name)  # Fail early if the database does not exist
+        if append and table_name not in catalog["tables"]:
+            return f"Error: Table '{table_name}' does not exist in database '{db_name}'!"
+        original_schema = schema
+        try:
+            schema = parse_schema(schema)
+        except ValueError as e:
+            return f"Error: {e}"
 
-        if not rows:
-            return "Error: CSV file is empty."
+        with self.open_input(input_file) as csvfile:
+            reader = csv.reader(csvfile)
+            header = next(reader, None)
+            if not header:
+                return "Error: CSV file is empty."
+            if len(set(header)) != len(header):
+                return "Error: CSV header contains duplicate column names."
 
-        columns = {col: "string" for col in rows[0].keys()}  # Assume all columns are strings for simplicity
+            sample = []
+            sampled = set()  # Columns typed from a sample only, which later rows may not fit
+            if append:
+                columns = catalog["tables"][table_name]["columns"]
+                if set(columns) != set(header):
+                    return (f"Error: CSV columns do not match table '{table_name}' "
+                            f"(expected {', '.join(columns)}).")
+            else:
+                unknown = [column for column in schema if column not in header]
+                if unknown:
+                    return f"Error: Schema column '{unknown[0]}' is not in the CSV header."
+                inferred = [column for column in header if column not in schema]
+                if inferred:
+                    candidates = {column: list(TYPE_CHECKS) for column in inferred}
+                    if sample_size is None:
+                        rows = self.read_rows(reader, header)
+                    else:
+                        sample = list(itertools.islice(self.read_rows(reader, header), sample_size))
+                        rows = sample
+                    seen = 0
+                    try:
+                        for line, row in rows:
+                            narrow_types(candidates, header, row)
+                            seen += 1
+                    except ValueError as e:
+                        return f"Error: {e}"
+                    if not seen:
+                        candidates = {column: [] for column in inferred}  # Nothing to go by
+                    elif sample_size is not None and seen == sample_size:
+                        sampled = set(inferred)
+                    if sample_size is None:
+                        # Start over after the inference pass
+                        csvfile.seek(0)
+                        reader = csv.reader(csvfile)
+                        next(reader)
+                    schema = {**schema, **{
+                        column: checks[0][0] if checks else "string" for column, checks in candidates.items()
+                    }}
+                columns = {column: schema[column] for column in header}
 
-        db_data["tables"][table_name] = {
-            "columns": columns,
-            "rows": rows
-        }
+            # Build rows in the table's column order, whatever the order in the file
+            names = list(columns)
+            positions = [header.index(name) for name in names]
+            converters = [CONVERTERS[columns[name]] for name in names]
 
-        # Save database
-        with open(db_file, "w") as f:
-            json.dump(db_data, f, indent=4)
+            writer = self.storage.open_table_writer(db_name, table_name, columns, append=append)
+            started = time.perf_counter()
+            imported = 0
+            try:
+                rows = itertools.chain(sample, self.read_rows(reader, header))
+                while True:
+                    chunk = list(itertools.islice(rows, chunk_size))
+                    if not chunk:
+                        break
+                    writer.write_rows(convert_rows(chunk, names, positions, converters))
+                    imported += len(chunk)
+                    if progress:
+                        progress(imported, imported / max(time.perf_counter() - started, 1e-9))
+            except InvalidValue as e:
+                writer.abort()
+                if e.column in sampled:
+                    # The sample did not show every kind of value: infer from the whole file
+                    return self.import_table_from_csv(
+                        db_name, table_name, input_file, original_schema, append, chunk_size, None, progress
+                    )
+                return f"Error: {e} Nothing was imported."
+            except ValueError as e:
+                writer.abort()
+                return f"Error: {e} Nothing was imported."
+            except BaseException:
+                writer.abort()
+                raise
+            writer.commit()
 
-        return f"Table '{table_name}' imported successfully from '{input_file}'."
+        rate = imported / max(time.perf_counter() - started, 1e-9)
+        return (f"Table '{table_name}' imported successfully from '{input_file}' "
+                f"({imported} rows, {rate:,.0f} rows/sec).")
+
+    def read_rows(self, reader, header):
+        """Yield (line number, values) for each non-blank CSV record."""
+        for row in reader:
+            if not row:
+                continue
+            if len(row) != len(header):
+                raise ValueError(f"Line {reader.line_num}: expected {len(header)} values, found {len(row)}.")
+            yield reader.line_num, row
@@ -1,11 +1,496 @@
 import os
-import json
+import time
+import queue
+import threading
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
+from tkinter import ttk, messagebox, simpledialog, filedialog
+from concurrent.futures import ThreadPoolExecutor
 from create_db import DatabaseManager
 from create_tables import TableManager
 from operation_tables import TableOperations
 from query_tables import QueryTables
+from export_functionality import ExportFunctionality
+from collections import OrderedDict
+from contextlib import contextmanager
+from metrics import metrics
+
+WINDOW_ROWS = 100  # Result rows fetched from a query cursor at a time
+MAX_CACHED_WINDOWS = 8  # Fetched windows kept while scrolling, least recently shown dropped first
+DEFAULT_ROW_HEIGHT = 20  # Pixels per row until the data view has drawn one
+SORT_MARKERS = {"asc": " \u25b2", "desc": " \u25bc"}
+GUI_WORKERS = 4  # Threads running database operations for the GUI
+FRAME_MS = 16  # How often the event loop picks up finished work and progress (about 60 times a second)
+FRAME_BUDGET_S = 0.008  # Longest the event loop spends on finished work per frame
+
+
+class ReadWriteLock:
+    """Lets any number of readers in at once, or a single writer (the threaded twin of the server's).
+
+    A waiting writer keeps new readers out, so scrolling cannot starve it.
+    """
+
+    def __init__(self):
+        self.readers = 0
+        self.writer_active = False
+        self.waiting_writers = 0
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def reading(self):
+        with self.condition:
+            self.condition.wait_for(lambda: not self.writer_active and not self.waiting_writers)
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                self.condition.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self.condition:
+            self.waiting_writers += 1
+            self.condition.wait_for(lambda: not self.writer_active and not self.readers)
+            self.waiting_writers -= 1
+            self.writer_active = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writer_active = False
+                self.condition.notify_all()
+
+
+class Worker:
+    """Runs functions on background threads and hands their results to the Tk event loop.
+
+    Tk may only be used from the thread running mainloop, so worker threads never touch a
+    widget: each finished call is queued with its callback, and the event loop runs the
+    callbacks once a frame, for at most FRAME_BUDGET_S so drawing never waits long.
+
+    Reads run side by side, but a write runs alone: a read scans the rows and indexes of
+    a loaded table after the storage lock is released, while a write changes them in place.
+    Workers that share a database must share the lock, too.
+    """
+
+    def __init__(self, root, threads=GUI_WORKERS, lock=None):
+        self.root = root
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="earthdb-gui")
+        self.finished = queue.SimpleQueue()
+        self.lock = lock if lock is not None else ReadWriteLock()
+        self.root.after(FRAME_MS, self.poll)
+
+    def submit(self, work, done=None, failed=None, write=False):
+        """Run work() on a worker thread, then done(result) or failed(exception) on the event loop.
+
+        Without failed, an exception is shown in an error box. Pass write=True for work
+        that changes a database, so no read runs while it does.
+        """
+        def run():
+            try:
+                with self.lock.writing() if write else self.lock.reading():
+                    result = work()
+            except Exception as e:
+                self.finished.put((failed or show_error, e))
+            else:
+                if done:
+                    self.finished.put((done, result))
+
+        return self.executor.submit(run)
+
+    def poll(self):
+        deadline = time.perf_counter() + FRAME_BUDGET_S
+        while time.perf_counter() < deadline:
+            try:
+                callback, value = self.finished.get_nowait()
+            except queue.Empty:
+                break
+            callback(value)
+        self.root.after(FRAME_MS, self.poll)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+def show_error(error):
+    messagebox.showerror("Error", str(error))
+
+
+class Cancelled(Exception):
+    """Raised in a worker thread by Task.report once the user has cancelled the task."""
+
+
+class Task:
+    """Progress of a long operation, shared by the worker thread running it and the status bar."""
+
+    def __init__(self, description, cancellable=True, on_cancel=None):
+        self.description = description
+        self.cancellable = cancellable
+        self.on_cancel = on_cancel  # Called on the event loop when the task is cancelled
+        self.cancelled = threading.Event()
+        self.done = 0
+        self.total = None  # Unknown until the operation reports one
+
+    def report(self, done, total=None):
+        """Record progress from the worker thread; raises Cancelled to stop the operation if it was cancelled."""
+        if self.cancelled.is_set():
+            raise Cancelled()
+        self.done, self.total = done, total
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.on_cancel:
+            self.on_cancel()
+
+
+class VirtualTable(tk.Frame):
+    """Shows a query result in a Treeview that only ever holds the rows on screen.
+
+    The query runs in a cursor of QueryTables on the view's own worker thread; rows are
+    fetched from it a window at a time as the view scrolls, and the windows on either side
+    of the visible rows are fetched ahead. Rows not fetched yet show blank until they
+    arrive, so scrolling never waits for the database. Clicking a column heading sorts by
+    that column and right-clicking one filters it. Both run the query again in the query
+    engine, which counts the matching rows without building them.
+    """
+
+    def __init__(self, master, query_tables, worker):
+        super().__init__(master)
+        self.query_tables = query_tables
+        self.storage = query_tables.storage
+        self.worker = worker  # A single thread, so the view's cursor is only used by one at a time
+        self.tree = ttk.Treeview(self, show="headings", selectmode="browse")
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.on_scroll)
+        self.status = tk.Label(self, anchor="w")
+        self.status.pack(side="bottom", fill="x")
+        self.scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+
+        self.tree.bind("<Configure>", self.on_resize)
+        self.tree.bind("<MouseWheel>", lambda event: self.scroll_by(-3 if event.delta > 0 else 3))
+        self.tree.bind("<Button-4>", lambda event: self.scroll_by(-3))  # Mouse wheel on X11
+        self.tree.bind("<Button-5>", lambda event: self.scroll_by(3))
+        self.tree.bind("<Prior>", lambda event: self.scroll_by(-self.visible))
+        self.tree.bind("<Next>", lambda event: self.scroll_by(self.visible))
+        self.tree.bind("<Control-Home>", lambda event: self.scroll_to(0))
+        self.tree.bind("<Control-End>", lambda event: self.scroll_to(self.total))
+        self.tree.bind("<Up>", lambda event: self.on_arrow(-1))
+        self.tree.bind("<Down>", lambda event: self.on_arrow(1))
+        self.tree.bind("<Button-3>", self.on_heading_right_click)
+
+        self.token = None  # Cursor of the query shown
+        self.query = None  # Query shown: db_name, table_name, columns, condition, filters, order_by, sort_order
+        self.columns = []
+        self.total = 0
+        self.offset = 0  # Result position of the first visible row
+        self.visible = 20  # Rows that fit in the view
+        self.windows = OrderedDict()  # Window number -> rows, least recently shown first
+        self.pending = set()  # Windows being fetched
+        self.version = None  # Database version the count and the fetched windows belong to
+        self.generation = 0  # Increased by every new query, so results of older ones are ignored
+        self.shown = []  # Values of the Treeview items, so only changed rows are redrawn
+        self.loading = False  # Whether a query is running for the view
+
+    def show(self, db_name, table_name, columns="*", condition=None, done=None):
+        """Show a table (or the columns and rows of a query on it) from the top, unsorted and unfiltered.
+
+        The query runs in the background; done(error or None) is called once it has.
+        """
+        self.load({
+            "db_name": db_name, "table_name": table_name, "columns": columns, "condition": condition,
+            "filters": {}, "order_by": None, "sort_order": "asc",
+        }, done)
+
+    def load(self, query, done=None):
+        """Run a query in the background, then show its rows in place of the current ones."""
+        self.generation += 1
+        generation = self.generation
+        self.loading = True
+
+        def finished(result):
+            token, columns, total, version, error = result
+            if generation != self.generation:  # Cancelled, or replaced by a newer query
+                if token:
+                    self.worker.submit(lambda: self.query_tables.close_cursor(token))
+                return
+            self.loading = False
+            if error:
+                self.render()
+                (done or show_error)(error)
+                return
+            if self.token:
+                old_token = self.token
+                self.worker.submit(lambda: self.query_tables.close_cursor(old_token))
+            self.token, self.query, self.total, self.version = token, query, total, version
+            self.offset = 0
+            self.windows.clear()
+            self.pending.clear()
+            if columns != self.columns:
+                self.tree.delete(*self.tree.get_children())
+                self.shown = []
+                self.columns = columns
+                self.tree["columns"] = columns
+            for col in columns:
+                self.tree.heading(col, text=self.heading_text(col), command=lambda col=col: self.sort_by(col))
+                self.tree.column(col, width=100, anchor="center")
+            self.render()
+            if done:
+                done(None)
+
+        self.status.config(text="Running query...")
+        self.worker.submit(lambda: self.open_query(query), finished)
+
+    def open_query(self, query):
+        """Open a cursor on a query and count its rows; runs on the worker thread.
+
+        Returns (token, columns, total, version, None) or (None, None, None, None, error).
+        """
+        try:
+            token, error = self.query_tables.open_cursor(
+                query["db_name"], query["table_name"], query["columns"], self.query_condition(query),
+                query["order_by"], query["sort_order"], page_size=WINDOW_ROWS
+            )
+        except ValueError as e:  # A condition that does not parse
+            token, error = None, f"Error: {e}"
+        if error:
+            return None, None, None, None, error
+        # The GUI's workers share one lock, so none of its writes runs during this read and
+        # the count belongs to this version (another process's changes show in the next one)
+        version = self.storage.version(query["db_name"])
+        columns, _, error = self.query_tables.fetch_window(token, 0, 0)
+        total = None
+        if not error:
+            total, error = self.query_tables.count_matches(token)
+        if error:
+            self.query_tables.close_cursor(token)
+            return None, None, None, None, error
+        return token, columns, total, version, None
+
+    def cancel(self):
+        """Stop waiting for the query being run and keep showing the previous one.
+
+        The query engine cannot stop a scan halfway, so the query still finishes on the
+        worker thread, but its result is dropped.
+        """
+        self.generation += 1
+        self.loading = False
+        self.render()
+
+    def clear(self):
+        """Show nothing and close the query cursor."""
+        self.generation += 1
+        self.loading = False
+        if self.token:
+            token = self.token
+            self.worker.submit(lambda: self.query_tables.close_cursor(token))
+        self.token = self.query = None
+        self.total = 0
+        self.windows.clear()
+        self.pending.clear()
+        self.tree.delete(*self.tree.get_children())
+        self.shown = []
+        self.columns = []
+        self.tree["columns"] = ()
+        self.status.config(text="")
+
+    def refresh(self):
+        """Bring the view up to date after a change to its database.
+
+        The sort, filters and scroll position stay; only the count and the rows on screen
+        are fetched again, and only the rows whose values changed are redrawn.
+        """
+        if not self.token:
+            return
+        token, generation, db_name = self.token, self.generation, self.query["db_name"]
+        numbers = range(self.offset // WINDOW_ROWS, (self.offset + self.visible - 1) // WINDOW_ROWS + 1)
+
+        def work():
+            version = self.storage.version(db_name)
+            if version == self.version:
+                return version, None, None, None
+            # Fetch the rows on screen with the count, so the view never shows blanks meanwhile
+            total, error = self.query_tables.count_matches(token)
+            windows = {}
+            for number in numbers:
+                if error:
+                    break
+                _, windows[number], error = self.query_tables.fetch_window(token, number * WINDOW_ROWS, WINDOW_ROWS)
+            return version, total, windows, error
+
+        def finished(result):
+            version, total, windows, error = result
+            if generation != self.generation or version == self.version:
+                return
+            if error:
+                self.status.config(text=error)
+                return
+            self.version, self.total = version, total
+            self.windows = OrderedDict(windows)
+            self.pending.clear()
+            self.render()
+
+        self.worker.submit(work, finished)
+
+    def query_condition(self, query):
+        """Combine a query's condition with its column filters."""
+        parts = [query["condition"]] if query["condition"] else []
+        for column, condition in query["filters"].items():
+            # A filter like '> 20' applies to its column; anything else is a condition of its own
+            parts.append(f"{column} {condition}" if condition[0] in "=!<>" else condition)
+        if len(parts) < 2:
+            return parts[0] if parts else None
+        return " AND ".join(f"({part})" for part in parts)
+
+    def heading_text(self, column):
+        text = column + (SORT_MARKERS[self.query["sort_order"]] if column == self.query["order_by"] else "")
+        if column in self.query["filters"]:
+            text += f" [{self.query['filters'][column]}]"
+        return text
+
+    def sort_by(self, column):
+        """Sort by a column, or reverse the order if the view is already sorted by it."""
+        if not self.query or self.loading:
+            return
+        if self.query["order_by"] == column:
+            sort_order = "desc" if self.query["sort_order"] == "asc" else "asc"
+        else:
+            sort_order = "asc"
+        self.load({**self.query, "order_by": column, "sort_order": sort_order})
+
+    def on_heading_right_click(self, event):
+        """Ask for a filter on the column whose heading was right-clicked."""
+        if not self.query or self.loading or self.tree.identify_region(event.x, event.y) != "heading":
+            return
+        column = self.columns[int(self.tree.identify_column(event.x)[1:]) - 1]
+        condition = simpledialog.askstring(
+            "Filter", f"Condition on {column} (e.g. > 20 or = John), blank to clear:",
+            initialvalue=self.query["filters"].get(column, ""),
+        )
+        if condition is None:
+            return
+        filters = dict(self.query["filters"])
+        if condition.strip():
+            filters[column] = condition.strip()
+        else:
+            filters.pop(column, None)
+        self.load({**self.query, "filters": filters})
+
+    def request(self, number):
+        """Fetch a window of the result in the background, unless it is cached or on its way."""
+        if number in self.windows or number in self.pending or not 0 <= number * WINDOW_ROWS < self.total:
+            return
+        self.pending.add(number)
+        token, generation, db_name = self.token, self.generation, self.query["db_name"]
+
+        def work():
+            # The GUI's workers share one lock, so none of its writes runs during this read and
+            # the rows belong to this version (another process's changes show in the next one)
+            version = self.storage.version(db_name)
+            with metrics.timed("gui.fetch page"):
+                _, rows, error = self.query_tables.fetch_window(token, number * WINDOW_ROWS, WINDOW_ROWS)
+            return version, rows, error
+
+        def finished(result):
+            if generation != self.generation or number not in self.pending:
+                return
+            self.pending.discard(number)
+            version, rows, error = result
+            if error:
+                self.status.config(text=error)
+                return
+            if version != self.version:
+                self.refresh()  # The database changed: the count and cached rows are out of date
+                return
+            self.windows[number] = rows
+            while len(self.windows) > MAX_CACHED_WINDOWS:
+                self.windows.popitem(last=False)
+            first = self.offset // WINDOW_ROWS
+            if first <= number <= (self.offset + self.visible - 1) // WINDOW_ROWS:
+                self.render()
+
+        self.worker.submit(work, finished)
+
+    def render(self):
+        """Fill the view with the visible rows that have been fetched, and request the others."""
+        if not self.token:
+            self.status.config(text="")
+            return
+        self.offset = max(0, min(self.offset, self.total - self.visible))
+        count = min(self.visible, self.total - self.offset)
+        rows = []
+        loading = False
+        for number in range(self.offset // WINDOW_ROWS, (self.offset + count - 1) // WINDOW_ROWS + 1):
+            start = number * WINDOW_ROWS
+            first, last = max(self.offset - start, 0), min(self.offset + count - start, WINDOW_ROWS)
+            window = self.windows.get(number)
+            if window is None:
+                self.request(number)
+                loading = True
+                rows.extend([[""] * len(self.columns)] * (last - first))  # Blank until fetched
+            else:
+                self.windows.move_to_end(number)
+                rows.extend([row[col] for col in self.columns] for row in window[first:last])
+
+        # Reuse the items on screen, redrawing only the rows whose values changed
+        items = self.tree.get_children()
+        for i, values in enumerate(rows):
+            if i >= len(items):
+                self.tree.insert("", "end", iid=str(i), values=values)
+            elif i >= len(self.shown) or self.shown[i] != values:
+                self.tree.item(items[i], values=values)
+        if len(items) > len(rows):
+            self.tree.delete(*items[len(rows):])
+        self.shown = rows
+
+        if self.total:
+            self.scrollbar.set(self.offset / self.total, (self.offset + len(rows)) / self.total)
+            shown = f"Rows {self.offset + 1:,}-{self.offset + len(rows):,} of {self.total:,}"
+        else:
+            self.scrollbar.set(0, 1)
+            shown = "No rows"
+        if self.query["filters"]:
+            shown += " matching " + self.query_condition(self.query)
+        self.status.config(text=shown + (" (loading...)" if loading else ""))
+
+        # Fetch the windows just before and after the visible rows, so scrolling on needs no wait
+        self.request((self.offset - WINDOW_ROWS) // WINDOW_ROWS)
+        self.request((self.offset + count + WINDOW_ROWS - 1) // WINDOW_ROWS)
+
+    def scroll_to(self, offset):
+        offset = max(0, min(offset, self.total - self.visible))
+        if offset != self.offset:
+            self.offset = offset
+            self.render()
+        return "break"
+
+    def scroll_by(self, rows):
+        return self.scroll_to(self.offset + rows)
+
+    def on_scroll(self, action, amount, unit=None):
+        """Handle the scrollbar: dragging moves to a fraction of the result, clicks by rows or pages."""
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * self.total))
+        else:
+            self.scroll_by(int(amount) * (self.visible if unit == "pages" else 1))
+
+    def on_arrow(self, step):
+        """Scroll when the arrow keys move the selection past the first or last visible row."""
+        items = self.tree.get_children()
+        if not items or self.tree.focus() != items[0 if step < 0 else -1]:
+            return None  # The Treeview moves the selection itself
+        self.scroll_by(step)
+        return "break"
+
+    def on_resize(self, event):
+        """Show as many rows as fit in the view's new height."""
+        items = self.tree.get_children()
+        box = self.tree.bbox(items[0]) if items else None
+        top, row_height = (box[1], box[3]) if box else (DEFAULT_ROW_HEIGHT, DEFAULT_ROW_HEIGHT)
+        visible = max(1, (event.height - top) // row_height)
+        if visible != self.visible:
+            self.visible = visible
+            self.render()
 
 
 class EarthDBGUI:
@@ -19,6 +504,16 @@ class EarthDBGUI:
         self.table_manager = TableManager()
         self.table_operations = TableOperations()
         self.query_tables = QueryTables()
+        self.export_functionality = ExportFunctionality()
+
+        # Background threads: one pool for operations, one thread for the data view's queries
+        # Both workers take turns on one lock, so no read of either overlaps a write
+        self.lock = ReadWriteLock()
+        self.worker = Worker(root, lock=self.lock)
+        self.view_worker = Worker(root, threads=1, lock=self.lock)
+        self.tasks = []  # Long operations running, shown in the status bar (newest last)
+        self.query_task = None  # Task of the query the data view is running
+        self.progress_scheduled = False  # Whether the status bar updates every frame
 
         # Paths
         self.db_path = "earthdb_data"
@@ -29,6 +524,7 @@ class EarthDBGUI:
 
         # GUI Layout
         self.create_gui()
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
 
     def create_gui(self):
         # Top Frame: Database Selection
@@ -40,6 +536,16 @@ class EarthDBGUI:
         self.selected_db_label.pack(side="left", padx=5)
         tk.Button(frame_top, text="Change Database", command=self.select_database).pack(side="left", padx=5)
 
+        # Bottom Frame: progress of long operations
+        frame_status = tk.Frame(self.root)
+        frame_status.pack(side="bottom", fill="x", padx=10, pady=5)
+        self.cancel_button = tk.Button(frame_status, text="Cancel", command=self.cancel_task, state="disabled")
+        self.cancel_button.pack(side="right", padx=5)
+        self.progress_bar = ttk.Progressbar(frame_status, length=200)
+        self.progress_bar.pack(side="right", padx=5)
+        self.progress_label = tk.Label(frame_status, text="Ready", anchor="w")
+        self.progress_label.pack(side="left", fill="x", expand=True)
+
         # Left Panel: Operations
         frame_left = tk.Frame(self.root)
         frame_left.pack(side="left", fill="y", padx=10, pady=10)
@@ -54,7 +560,11 @@ class EarthDBGUI:
 
         tk.Button(frame_left, text="Insert Data", command=self.insert_data).pack(fill="x", pady=5)
         tk.Button(frame_left, text="Query Data", command=self.query_data).pack(fill="x", pady=5)
+        tk.Button(frame_left, text="Next Page", command=self.next_page).pack(fill="x", pady=5)
         tk.Button(frame_left, text="Delete Record", command=self.delete_record).pack(fill="x", pady=5)  # New Button
+        tk.Button(frame_left, text="Import Table", command=self.import_table).pack(fill="x", pady=5)
+        tk.Button(frame_left, text="Export Table", command=self.export_table).pack(fill="x", pady=5)
+        tk.Button(frame_left, text="Metrics", command=self.show_metrics).pack(fill="x", pady=5)
 
         # Right Panel: Output
         frame_right = tk.Frame(self.root)
@@ -72,25 +582,131 @@ class EarthDBGUI:
         self.table_tree.pack(fill="x", padx=5)
         self.table_tree.bind("<<TreeviewSelect>>", self.on_table_select)
 
-        # Table Data Treeview
-        self.data_tree = ttk.Treeview(frame_right, show="headings")
-        self.data_tree.pack(fill="both", expand=True, padx=5)
+        # Table Data view, holding only the rows on screen
+        self.data_view = VirtualTable(frame_right, self.query_tables, self.view_worker)
+        self.data_view.pack(fill="both", expand=True, padx=5)
 
         # Populate Databases
         self.populate_databases()
 
+    def start_task(self, description, cancellable=True, on_cancel=None):
+        """Show a long operation in the status bar, with Cancel if it is cancellable."""
+        task = Task(description, cancellable, on_cancel)
+        self.tasks.append(task)
+        if not self.progress_scheduled:
+            self.update_progress()
+        return task
+
+    def finish_task(self, task, message="Ready"):
+        if task in self.tasks:
+            self.tasks.remove(task)
+        self.progress_label.config(text=message)
+
+    def run_task(self, description, work, done, cancellable=True, write=False):
+        """Run work(task) in the background with its progress in the status bar, then done(result).
+
+        work stops with Cancelled at its next task.report() once Cancel is pressed.
+        """
+        task = self.start_task(description, cancellable)
+
+        def finished(result):
+            self.finish_task(task)
+            done(result)
+
+        def failed(error):
+            if isinstance(error, Cancelled):
+                self.finish_task(task, f"{description}: cancelled.")
+            else:
+                self.finish_task(task, f"{description}: failed.")
+                show_error(error)
+
+        self.worker.submit(lambda: work(task), finished, failed, write)
+
+    def update_progress(self):
+        """Show the newest running task's progress; repeats every frame while any task runs."""
+        self.progress_scheduled = False
+        if not self.tasks:
+            self.progress_bar.stop()
+            self.progress_bar.config(mode="determinate", value=0)
+            self.cancel_button.config(state="disabled")
+            return
+        task = self.tasks[-1]
+        text = task.description + ("... cancelling" if task.cancelled.is_set() else "...")
+        if task.total:
+            text += f" {task.done:,} of {task.total:,} rows"
+            self.progress_bar.stop()
+            self.progress_bar.config(mode="determinate", maximum=task.total, value=task.done)
+        else:
+            if task.done:
+                text += f" {task.done:,} rows"
+            if str(self.progress_bar.cget("mode")) != "indeterminate":
+                self.progress_bar.config(mode="indeterminate")
+                self.progress_bar.start(FRAME_MS)
+        if len(self.tasks) > 1:
+            text += f" (+{len(self.tasks) - 1} more)"
+        self.progress_label.config(text=text)
+        cancellable = task.cancellable and not task.cancelled.is_set()
+        self.cancel_button.config(state="normal" if cancellable else "disabled")
+        self.progress_scheduled = True
+        self.root.after(FRAME_MS, self.update_progress)
+
+    def cancel_task(self):
+        """Cancel the newest running task."""
+        if self.tasks:
+            self.tasks[-1].cancel()
+
+    def close(self):
+        """Cancel whatever still runs and close the window."""
+        for task in list(self.tasks):
+            task.cancel()
+        self.worker.shutdown()
+        self.view_worker.shutdown()
+        self.root.destroy()
+
+    def show_query(self, db_name, table_name, columns="*", condition=None, done=None):
+        """Run a query in the data view, with Cancel in the status bar while it runs."""
+        started = time.perf_counter()
+        if self.query_task:
+            self.finish_task(self.query_task)  # The new query replaces the one still running
+        task = None
+
+        def shown(error):
+            self.finish_task(task)
+            self.query_task = None
+            metrics.observe("gui.show table", time.perf_counter() - started)
+            if error:
+                messagebox.showerror("Error", error)
+            elif done:
+                done()
+
+        def cancelled():
+            self.data_view.cancel()
+            self.finish_task(task, f"Query on '{table_name}' cancelled.")
+            self.query_task = None
+
+        task = self.query_task = self.start_task(f"Querying '{table_name}'", on_cancel=cancelled)
+        self.data_view.show(db_name, table_name, columns, condition, done=shown)
+
+    def after_change(self, db_name, result):
+        """Show the result of a change and refresh the rows on screen if it was to their database."""
+        if self.data_view.query and self.data_view.query["db_name"] == db_name:
+            self.data_view.refresh()
+        messagebox.showinfo("Success", result)
+
     def populate_databases(self):
         """Populate the database list in the Treeview."""
-        databases = [
-            db.replace(".json", "") for db in os.listdir(self.db_path) if db.endswith(".json")
-        ]
-        self.db_tree.delete(*self.db_tree.get_children())  # Clear existing data
-        for db in databases:
-            self.db_tree.insert("", "end", values=(db,))
+        def fill(databases):
+            self.db_tree.delete(*self.db_tree.get_children())  # Clear existing data
+            for db in databases:
+                self.db_tree.insert("", "end", values=(db,))
+
+        self.worker.submit(self.db_manager.storage.list_databases, fill)
 
     def on_database_select(self, event):
         """Handle database selection and populate tables."""
         selected_item = self.db_tree.focus()
+        if not selected_item:
+            return
         self.selected_db = self.db_tree.item(selected_item, "values")[0]  # Extract database name
         self.selected_db_label.config(text=self.selected_db)
         self.populate_tables()
@@ -99,109 +715,116 @@ class EarthDBGUI:
         """Populate the table list for the selected database."""
         if not self.selected_db:
             return
-        db_file = os.path.join(self.db_path, f"{self.selected_db}.json")
-        try:
-            with open(db_file, "r") as f:
-                db_data = json.load(f)
-            tables = list(db_data["tables"].keys())
+        db_name = self.selected_db
+
+        def fill(tables):
+            if db_name != self.selected_db:
+                return  # Another database was selected meanwhile
             self.table_tree.delete(*self.table_tree.get_children())  # Clear existing data
             for table in tables:
                 self.table_tree.insert("", "end", values=(table,))
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load tables: {str(e)}")
+
+        self.worker.submit(
+            lambda: list(self.table_manager.load_catalog(db_name)["tables"].keys()), fill,
+            lambda e: messagebox.showerror("Error", f"Failed to load tables: {str(e)}"),
+        )
 
     def on_table_select(self, event):
         """Handle table selection and display data."""
         selected_item = self.table_tree.focus()
+        if not selected_item:
+            return
         self.selected_table = self.table_tree.item(selected_item, "values")[0]  # Extract table name
         self.populate_table_data()
 
     def populate_table_data(self):
-        """Populate the data for the selected table."""
+        """Show the rows of the selected table in the data view."""
         if not self.selected_db or not self.selected_table:
             return
-        db_file = os.path.join(self.db_path, f"{self.selected_db}.json")
-        try:
-            with open(db_file, "r") as f:
-                db_data = json.load(f)
-            table_data = db_data["tables"][self.selected_table]
-            rows = table_data["rows"]
-            columns = list(table_data["columns"].keys())
-
-            # Clear existing data
-            self.data_tree.delete(*self.data_tree.get_children())
-            self.data_tree["columns"] = columns
-            self.data_tree["show"] = "headings"
-
-            # Set column headings
-            for col in columns:
-                self.data_tree.heading(col, text=col)
-                self.data_tree.column(col, width=100, anchor="center")
-
-            # Insert rows
-            for row in rows:
-                self.data_tree.insert("", "end", values=[row[col] for col in columns])
-
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load table data: {str(e)}")
+        self.show_query(self.selected_db, self.selected_table)
 
     def select_database(self):
         """Allow the user to manually select a database."""
         db_name = simpledialog.askstring("Select Database", "Enter database name:")
-        if db_name and db_name in self.db_manager.list_databases():
-            self.selected_db = db_name
-            self.selected_db_label.config(text=db_name)
-            self.populate_tables()
-        else:
-            messagebox.showerror("Error", f"Database '{db_name}' does not exist.")
+        if not db_name:
+            return
+
+        def selected(exists):
+            if exists:
+                self.selected_db = db_name
+                self.selected_db_label.config(text=db_name)
+                self.populate_tables()
+            else:
+                messagebox.showerror("Error", f"Database '{db_name}' does not exist.")
+
+        self.worker.submit(lambda: self.db_manager.database_exists(db_name), selected)
 
     def create_database(self):
         db_name = simpledialog.askstring("Create Database", "Enter new database name:")
         if db_name:
-            result = self.db_manager.create_database(db_name)
-            self.populate_databases()
-            messagebox.showinfo("Success", result)
+            def done(result):
+                self.populate_databases()
+                messagebox.showinfo("Success", result)
+
+            self.worker.submit(lambda: self.db_manager.create_database(db_name), done, write=True)
 
     def delete_database(self):
         db_name = simpledialog.askstring("Delete Database", "Enter database name to delete:")
         if db_name:
-            result = self.db_manager.delete_database(db_name)
-            self.populate_databases()
-            messagebox.showinfo("Success", result)
+            if self.data_view.query and self.data_view.query["db_name"] == db_name:
+                self.data_view.clear()
+
+            def done(result):
+                self.populate_databases()
+                messagebox.showinfo("Success", result)
+
+            self.worker.submit(lambda: self.db_manager.delete_database(db_name), done, write=True)
 
     def create_table(self):
         if not self.selected_db:
             messagebox.showerror("Error", "No database selected.")
             return
+        db_name = self.selected_db
         table_name = simpledialog.askstring("Create Table", "Enter table name:")
         if table_name:
             columns = simpledialog.askstring("Create Table", "Enter columns (e.g., id:integer, name:string):")
             if columns:
-                result = self.table_manager.create_table(self.selected_db, table_name, columns.split(","))
-                self.populate_tables()
-                messagebox.showinfo("Success", result)
+                def done(result):
+                    self.populate_tables()
+                    messagebox.showinfo("Success", result)
+
+                self.worker.submit(lambda: self.table_manager.create_table(db_name, table_name, columns.split(",")), done, write=True)
 
     def drop_table(self):
         if not self.selected_db:
             messagebox.showerror("Error", "No database selected.")
             return
+        db_name = self.selected_db
         table_name = simpledialog.askstring("Drop Table", "Enter table name:")
         if table_name:
-            result = self.table_manager.drop_table(self.selected_db, table_name)
-            self.populate_tables()
-            messagebox.showinfo("Success", result)
+            query = self.data_view.query
+            if query and (query["db_name"], query["table_name"]) == (db_name, table_name):
+                self.data_view.clear()
+
+            def done(result):
+                self.populate_tables()
+                messagebox.showinfo("Success", result)
+
+            self.worker.submit(lambda: self.table_manager.drop_table(db_name, table_name), done, write=True)
 
     def insert_data(self):
         if not self.selected_db:
             messagebox.showerror("Error", "No database selected.")
             return
+        db_name = self.selected_db
         table_name = simpledialog.askstring("Insert Data", "Enter table name:")
         if table_name:
             values = simpledialog.askstring("Insert Data", "Enter values (comma-separated):")
             if values:
-                result = self.table_operations.insert_into_table(self.selected_db, table_name, values.split(","))
-                self.populate_table_data()
-                messagebox.showinfo("Success", result)
+                self.worker.submit(
+                    lambda: self.table_operations.insert_into_table(db_name, table_name, values.split(",")),
+                    lambda result: self.after_change(db_name, result), write=True,
+                )
 
     def query_data(self):
         if not self.selected_db:
@@ -211,12 +834,109 @@ class EarthDBGUI:
         if table_name:
             columns = simpledialog.askstring("Query Data", "Enter columns (* for all):")
             condition = simpledialog.askstring("Query Data", "Enter condition (or leave blank):")
-            result = self.query_tables.select_from_table(self.selected_db, table_name, columns or "*", condition or None)
-            if result:
-                self.populate_table_data()
-                messagebox.showinfo("Success", "Query executed successfully.")
-            else:
-                messagebox.showinfo("Info", "No results found.")
+
+            def done():
+                if not self.data_view.total:
+                    messagebox.showinfo("Info", "No results found.")
+
+            self.show_query(self.selected_db, table_name, columns or "*", condition or None, done)
+
+    def next_page(self):
+        """Scroll the data view down by a page."""
+        view = self.data_view
+        if not view.token or view.offset + view.visible >= view.total:
+            messagebox.showinfo("Info", "No more results.")
+            return
+        view.scroll_by(view.visible)
+
+    def import_table(self):
+        """Import a CSV or JSON file into a table, in the background with progress and Cancel."""
+        if not self.selected_db:
+            messagebox.showerror("Error", "No database selected.")
+            return
+        db_name = self.selected_db
+        file_path = filedialog.askopenfilename(
+            title="Import Table", filetypes=[("CSV or JSON", "*.csv *.json *.csv.gz *.json.gz"), ("All files", "*")]
+        )
+        if not file_path:
+            return
+        default_name = os.path.basename(file_path).split(".")[0]
+        table_name = simpledialog.askstring("Import Table", "Enter table name:", initialvalue=default_name)
+        if not table_name:
+            return
+
+        def done(result):
+            self.populate_tables()
+            self.after_change(db_name, result)
+
+        if ".json" in os.path.basename(file_path):
+            # A JSON file is read whole, so its import can be neither followed nor cancelled
+            self.run_task(
+                f"Importing '{table_name}'",
+                lambda task: self.export_functionality.import_table_from_json(db_name, table_name, file_path),
+                done, cancellable=False, write=True,
+            )
+        else:
+            self.run_task(
+                f"Importing '{table_name}'",
+                lambda task: self.export_functionality.import_table_from_csv(
+                    db_name, table_name, file_path, progress=lambda rows, rate: task.report(rows)
+                ),
+                done, write=True,
+            )
+
+    def export_table(self):
+        """Export the rows the data view shows, with its filters and sort, to a CSV or JSON file."""
+        query = self.data_view.query
+        if not query:
+            messagebox.showerror("Error", "No table shown. Select a table or run a query first.")
+            return
+        output_file = filedialog.asksaveasfilename(
+            title="Export Table", initialfile=f"{query['table_name']}.csv", defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("JSON", "*.json"), ("Compressed", "*.gz")],
+        )
+        if not output_file:
+            return
+        compress = output_file.endswith(".gz")
+        export = (
+            self.export_functionality.export_table_to_json if ".json" in os.path.basename(output_file)
+            else self.export_functionality.export_table_to_csv
+        )
+        total = self.data_view.total
+
+        self.run_task(
+            f"Exporting '{query['table_name']}'",
+            lambda task: export(
+                query["db_name"], query["table_name"], output_file, compress,
+                columns=query["columns"], condition=self.data_view.query_condition(query),
+                order_by=query["order_by"], sort_order=query["sort_order"],
+                progress=lambda rows, rate: task.report(rows, total),
+            ),
+            lambda result: messagebox.showinfo("Success", result),
+        )
+
+    def show_metrics(self):
+        """Show the process-wide counters and latencies in a window, with Refresh and Reset."""
+        window = tk.Toplevel(self.root)
+        window.title("EarthDB - Metrics")
+        text = tk.Text(window, width=100, height=30, font=("Courier", 10))
+
+        def refresh():
+            text.config(state="normal")
+            text.delete("1.0", "end")
+            text.insert("end", metrics.report())
+            text.config(state="disabled")
+
+        def reset():
+            metrics.reset()
+            refresh()
+
+        buttons = tk.Frame(window)
+        buttons.pack(fill="x", pady=5)
+        tk.Button(buttons, text="Refresh", command=refresh).pack(side="left", padx=5)
+        tk.Button(buttons, text="Reset", command=reset).pack(side="left", padx=5)
+        text.pack(fill="both", expand=True, padx=5, pady=5)
+        refresh()
 
     def delete_record(self):
         """Delete a record from the selected table."""
@@ -226,11 +946,13 @@ class EarthDBGUI:
         if not self.selected_table:
             messagebox.showerror("Error", "No table selected.")
             return
+        db_name, table_name = self.selected_db, self.selected_table
         condition = simpledialog.askstring("Delete Record", "Enter condition to match records to delete:")
         if condition:
-            result = self.table_operations.delete_from_table(self.selected_db, self.selected_table, condition)
-            self.populate_table_data()
-            messagebox.showinfo("Success", result)
+            self.worker.submit(
+                lambda: self.table_operations.delete_from_table(db_name, table_name, condition),
+                lambda result: self.after_change(db_name, result), write=True,
+            )
 
 
 if __name__ == "__main__":
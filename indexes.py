@@ -0,0 +1,242 @@
+import bisect
+import math
+import operator
+from columnar import column_values
+
+
+def shift_positions(positions, deleted, deleted_set):
+    """Drop deleted positions and shift each remaining one down by the deletions before it."""
+    return [
+        position - bisect.bisect_left(deleted, position)
+        for position in positions if position not in deleted_set
+    ]
+
+
+class HashIndex:
+    """Maps each value of a column to the sorted positions of the rows holding it."""
+
+    kind = "hash"
+
+    def __init__(self, column):
+        self.column = column
+        self.buckets = {}
+
+    def build(self, rows):
+        """Rebuild the index from scratch, e.g. after rows were deleted and positions shifted."""
+        buckets = {}
+        for position, value in enumerate(column_values(rows, self.column)):
+            buckets.setdefault(value, []).append(position)
+        self.buckets = buckets
+
+    def copy(self):
+        """Return an index that can be changed without affecting this one."""
+        index = HashIndex(self.column)
+        index.buckets = {value: list(positions) for value, positions in self.buckets.items()}
+        return index
+
+    def add(self, value, position):
+        bucket = self.buckets.setdefault(value, [])
+        if not bucket or bucket[-1] < position:
+            bucket.append(position)
+        else:
+            bisect.insort(bucket, position)
+
+    def discard(self, value, position):
+        bucket = self.buckets.get(value)
+        if not bucket:
+            return
+        i = bisect.bisect_left(bucket, position)
+        if i < len(bucket) and bucket[i] == position:
+            del bucket[i]
+            if not bucket:
+                del self.buckets[value]
+
+    def compact(self, deleted):
+        """Drop deleted positions (sorted) and shift the positions after them down."""
+        buckets = {}
+        deleted_set = set(deleted)
+        for value, positions in self.buckets.items():
+            remaining = shift_positions(positions, deleted, deleted_set)
+            if remaining:
+                buckets[value] = remaining
+        self.buckets = buckets
+
+    def lookup(self, op, value, row_count):
+        """Return the sorted positions matching 'column <op> value', or None if op is unsupported."""
+        if op is operator.eq:
+            return list(self.buckets.get(value, ()))
+        if op is operator.ne:
+            excluded = set(self.buckets.get(value, ()))
+            return [position for position in range(row_count) if position not in excluded]
+        return None
+
+    def to_json(self):
+        return [[value, positions] for value, positions in self.buckets.items()]
+
+    def load_json(self, data):
+        self.buckets = {value: positions for value, positions in data}
+
+
+class OrderedIndex:
+    """Keeps (value, position) entries of a column in sorted order for range scans and ORDER BY.
+
+    Entries are stored B-tree style as a list of sorted chunks, so an insert or delete only
+    shifts one small chunk instead of the whole index.
+    """
+
+    kind = "ordered"
+    CHUNK_SIZE = 512
+
+    def __init__(self, column):
+        self.column = column
+        self.chunks = []
+        self.maxes = []  # Largest entry of each chunk, used to find the chunk for an entry
+
+    def build(self, rows):
+        self.load_entries(sorted((value, position) for position, value in enumerate(column_values(rows, self.column))))
+
+    def load_entries(self, entries):
+        """Replace the index with already sorted entries."""
+        size = self.CHUNK_SIZE
+        self.chunks = [entries[i:i + size] for i in range(0, len(entries), size)]
+        self.maxes = [chunk[-1] for chunk in self.chunks]
+
+    def copy(self):
+        """Return an index that can be changed without affecting this one."""
+        index = OrderedIndex(self.column)
+        index.chunks = [list(chunk) for chunk in self.chunks]
+        index.maxes = list(self.maxes)
+        return index
+
+    def entries(self):
+        for chunk in self.chunks:
+            yield from chunk
+
+    def add(self, value, position):
+        entry = (value, position)
+        if not self.chunks:
+            self.chunks.append([entry])
+            self.maxes.append(entry)
+            return
+
+        i = bisect.bisect_left(self.maxes, entry)
+        if i == len(self.chunks):
+            i -= 1
+        chunk = self.chunks[i]
+        bisect.insort(chunk, entry)
+        self.maxes[i] = chunk[-1]
+
+        # Split chunks that grew too large so inserts stay cheap
+        if len(chunk) > 2 * self.CHUNK_SIZE:
+            self.chunks[i:i + 1] = [chunk[:self.CHUNK_SIZE], chunk[self.CHUNK_SIZE:]]
+            self.maxes[i:i + 1] = [chunk[self.CHUNK_SIZE - 1], chunk[-1]]
+
+    def discard(self, value, position):
+        entry = (value, position)
+        i = bisect.bisect_left(self.maxes, entry)
+        if i == len(self.chunks):
+            return
+        chunk = self.chunks[i]
+        j = bisect.bisect_left(chunk, entry)
+        if j < len(chunk) and chunk[j] == entry:
+            del chunk[j]
+            if chunk:
+                self.maxes[i] = chunk[-1]
+            else:
+                del self.chunks[i]
+                del self.maxes[i]
+
+    def compact(self, deleted):
+        """Drop deleted positions (sorted) and shift the positions after them down.
+
+        The shift keeps the relative order of positions, so entries stay sorted.
+        """
+        deleted_set = set(deleted)
+        self.load_entries([
+            (value, position - bisect.bisect_left(deleted, position))
+            for value, position in self.entries() if position not in deleted_set
+        ])
+
+    def locate(self, key):
+        """Return the (chunk, offset) of the first entry not smaller than key."""
+        i = bisect.bisect_left(self.maxes, key)
+        if i == len(self.chunks):
+            return i, 0
+        return i, bisect.bisect_left(self.chunks[i], key)
+
+    def slice(self, start, stop):
+        """Return the entries between two (chunk, offset) locations."""
+        (i, j), (k, l) = start, stop
+        if i == k:
+            return self.chunks[i][j:l] if i < len(self.chunks) else []
+        entries = self.chunks[i][j:]
+        for chunk in self.chunks[i + 1:k]:
+            entries.extend(chunk)
+        if k < len(self.chunks):
+            entries.extend(self.chunks[k][:l])
+        return entries
+
+    def scan(self, op, value):
+        """Return the entries matching 'column <op> value' in index order, or None if op is unsupported."""
+        # Positions are never negative, so (value, -1) sorts before every entry holding value
+        first = (0, 0)
+        end = (len(self.chunks), 0)
+        low = self.locate((value, -1))
+        high = self.locate((value, math.inf))
+
+        if op is operator.eq:
+            return self.slice(low, high)
+        if op is operator.ne:
+            return self.slice(first, low) + self.slice(high, end)
+        if op is operator.lt:
+            return self.slice(first, low)
+        if op is operator.le:
+            return self.slice(first, high)
+        if op is operator.gt:
+            return self.slice(high, end)
+        if op is operator.ge:
+            return self.slice(low, end)
+        return None
+
+    def lookup(self, op, value, row_count):
+        """Return the sorted positions matching 'column <op> value', or None if op is unsupported."""
+        entries = self.scan(op, value)
+        if entries is None:
+            return None
+        return sorted(position for _, position in entries)
+
+    def ordered_positions(self, entries=None, descending=False):
+        """Return positions in value order, with equal values kept in table order (like sorted())."""
+        if entries is None:
+            entries = self.entries()
+        if not descending:
+            return [position for _, position in entries]
+
+        # Walking backwards reverses ties too, so each run of equal values is flipped back
+        positions = []
+        run = []
+        run_value = None
+        for value, position in reversed(list(entries)):
+            if run and value != run_value:
+                positions.extend(reversed(run))
+                run = []
+            run.append(position)
+            run_value = value
+        positions.extend(reversed(run))
+        return positions
+
+    def to_json(self):
+        return [list(entry) for entry in self.entries()]
+
+    def load_json(self, data):
+        self.load_entries([tuple(entry) for entry in data])
+
+
+INDEX_TYPES = {"hash": HashIndex, "ordered": OrderedIndex}
+
+
+def create_index(kind, column):
+    """Return an empty index of the given kind."""
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unsupported index type '{kind}'. Supported types are: {', '.join(INDEX_TYPES)}")
+    return INDEX_TYPES[kind](column)
@@ -0,0 +1,397 @@
+import heapq
+import operator
+import itertools
+from columnar import ColumnarRows, column_values
+from aggregates import Aggregator, AGGREGATE_PATTERN, NUMERIC_TYPES, parse_select_list
+from predicates import Predicate
+from metrics import access_path, count, phase
+
+
+class JoinSide:
+    """One table of a join, as named in the statement."""
+
+    def __init__(self, table, alias, column_types):
+        self.table = table
+        self.alias = alias
+        self.name = alias or table  # Prefix of its columns in the result, e.g. 'o.amount'
+        self.column_types = column_types
+
+
+def resolve(name, sides):
+    """Return (side number, column) for a column as written, e.g. 'o.amount' or 'amount'.
+
+    Raises ValueError for an unknown column, or one both tables have that is not qualified.
+    """
+    if "." in name:
+        prefix, column = name.split(".", 1)
+        matches = [i for i, side in enumerate(sides) if prefix in (side.name, side.table)]
+        if len(matches) > 1:
+            matches = [i for i in matches if sides[i].name == prefix]
+        if len(matches) != 1:
+            raise ValueError(f"Table '{prefix}' in '{name}' is not part of the query.")
+        if column not in sides[matches[0]].column_types:
+            raise ValueError(f"Column '{name}' does not exist.")
+        return matches[0], column
+    matches = [i for i, side in enumerate(sides) if name in side.column_types]
+    if not matches:
+        raise ValueError(f"Column '{name}' does not exist in table '{sides[0].table}' or '{sides[1].table}'.")
+    if len(matches) > 1:
+        raise ValueError(
+            f"Column '{name}' is ambiguous; write {sides[0].name}.{name} or {sides[1].name}.{name}."
+        )
+    return matches[0], name
+
+
+def rename_columns(node, rename):
+    """Return a condition tree with every column name replaced by rename(name)."""
+    if node[0] == "compare":
+        return ("compare", rename(node[1]), node[2], node[3])
+    if node[0] == "not":
+        return ("not", rename_columns(node[1], rename))
+    return (node[0], [rename_columns(child, rename) for child in node[1]])
+
+
+def conjunction(trees):
+    """Combine condition trees with AND; None if there are none."""
+    if not trees:
+        return None
+    return trees[0] if len(trees) == 1 else ("and", trees)
+
+
+def plan_join(select, sides):
+    """Validate a SELECT ... JOIN against both tables; return (plan, None) or (None, error).
+
+    Every column is resolved to its table. The top-level AND terms of the WHERE condition
+    that only use one table filter that table before the join; the rest (and, for a LEFT
+    JOIN, those on the right table, which must not turn matches into unmatched rows) are
+    checked on the joined rows.
+    """
+    if sides[0].name == sides[1].name:
+        return None, f"Error: Table '{sides[0].name}' is joined with itself; give it an alias, e.g. JOIN {sides[1].table} b."
+    join = select.join
+    try:
+        keys = [resolve(join.left_column, sides), resolve(join.right_column, sides)]
+        if keys[0][0] == keys[1][0]:
+            raise ValueError("JOIN ... ON must compare a column of each table.")
+        keys = [column for _, column in sorted(keys)]
+        types = [side.column_types[key] for side, key in zip(sides, keys)]
+        # Numbers join with numbers (1 = 1.0), anything else only with its own type
+        if types[0] != types[1] and not (types[0] in NUMERIC_TYPES and types[1] in NUMERIC_TYPES):
+            raise ValueError(f"Cannot join {types[0]} column '{keys[0]}' with {types[1]} column '{keys[1]}'.")
+
+        def qualified(name):
+            side, column = resolve(name, sides)
+            return f"{sides[side].name}.{column}"
+
+        # Every column of the result under its qualified name, for the joined rows
+        joined_types = {
+            f"{side.name}.{column}": column_type for side in sides for column, column_type in side.column_types.items()
+        }
+        used = set()  # Qualified columns the joined rows need
+
+        filters, residual = [[], []], []
+        if select.condition:
+            _, tree = select.condition
+            for term in (list(tree[1]) if tree[0] == "and" else [tree]):
+                term_sides = {resolve(column, sides)[0] for column in Predicate(None, term).columns}
+                if len(term_sides) == 1 and not (join.kind == "left" and term_sides == {1}):
+                    filters[term_sides.pop()].append(rename_columns(term, lambda name: resolve(name, sides)[1]))
+                else:
+                    term = rename_columns(term, qualified)
+                    used.update(Predicate(None, term).columns)
+                    residual.append(term)
+
+        plan = {
+            "sides": sides, "kind": join.kind, "keys": keys, "joined_types": joined_types,
+            "filters": [conjunction(trees) for trees in filters], "residual": conjunction(residual),
+            "group_by": [qualified(column) for column in select.group_by],
+        }
+        if select.aggregate:
+            # Aggregate over qualified names, but label the result columns as written
+            rewritten = []
+            for item in select.items:
+                match = AGGREGATE_PATTERN.fullmatch(item)
+                if match and match.group(2) != "*":
+                    rewritten.append(f"{match.group(1)}({qualified(match.group(2))})")
+                else:
+                    rewritten.append(item if match else qualified(item))
+            items = parse_select_list(", ".join(rewritten), joined_types, plan["group_by"])
+            plan["items"] = [(label, function, column) for label, (_, function, column) in zip(select.items, items)]
+            plan["columns"] = list(select.items)
+            used.update(column for _, _, column in plan["items"] if column)
+            if select.order_by and select.order_by not in plan["columns"]:
+                raise ValueError(f"Column '{select.order_by}' is not part of the result.")
+        else:
+            if select.items == ["*"]:
+                sources = list(joined_types)
+                plan["columns"] = sources
+            else:
+                sources = [qualified(item) for item in select.items]
+                plan["columns"] = list(select.items)
+            plan["sources"] = sources
+            used.update(sources)
+            plan["order_by"] = qualified(select.order_by) if select.order_by else None
+            if plan["order_by"]:
+                used.add(plan["order_by"])
+    except ValueError as e:
+        return None, f"Error: {e}"
+
+    # The columns each table contributes to the joined rows
+    plan["needed"] = [
+        [column for column in side.column_types if f"{side.name}.{column}" in used] for side in sides
+    ]
+    return plan, None
+
+
+def row_getter(rows, columns):
+    """Return a function giving the row at a position, with at least the given columns."""
+    if isinstance(rows, ColumnarRows):
+        getters = [(column, rows.column(column).get) for column in columns]
+        return lambda position: {column: get(position) for column, get in getters}
+    return rows.__getitem__
+
+
+class JoinedPredicate(Predicate):
+    """A predicate over joined rows, where a LEFT JOIN leaves None in an unmatched table's columns.
+
+    As in SQL, a comparison with None is unknown (None) rather than false: NOT keeps it
+    unknown, AND and OR only decide on it when another term settles the result, and a
+    row matches only when the whole condition is true. So both 'WHERE o.amount > 10'
+    and 'WHERE NOT o.amount > 10' drop the unmatched rows.
+    """
+
+    def bind(self, column_types, parameters=()):
+        super().bind(column_types, parameters)
+        test = self.matches
+        self.matches = lambda row: test(row) is True
+        return self
+
+    def build(self, node):
+        kind = node[0]
+        if kind == "compare":
+            _, column, op, value = node
+            return lambda row: None if row[column] is None else op(row[column], value)
+        if kind == "not":
+            inner = self.build(node[1])
+
+            def negate(row):
+                result = inner(row)
+                return None if result is None else not result
+
+            return negate
+
+        parts = [self.build(child) for child in node[1]]
+        decisive = kind == "or"  # The value that settles the result: True for OR, False for AND
+
+        def combine(row):
+            unknown = False
+            for part in parts:
+                result = part(row)
+                if result is None:
+                    unknown = True
+                elif bool(result) is decisive:
+                    return decisive
+            return None if unknown else not decisive
+
+        return combine
+
+
+class HashJoin:
+    """Runs a planned SELECT ... JOIN as a hash join.
+
+    Each table is first narrowed down by the WHERE terms on it alone, with its indexes
+    where it has them. The rows of one side then go in a hash table keyed by the join
+    column, and the other side's rows look up their matches in it. The side put in the
+    hash table is the one that makes this cheapest: usually the smaller, or a table with
+    no WHERE terms of its own whose join column has an index, since the index already
+    maps values to rows and nothing has to be built.
+    """
+
+    def __init__(self, query_tables, db_name, plan):
+        self.query_tables = query_tables
+        self.storage = query_tables.storage
+        self.db_name = db_name
+        self.plan = plan
+
+    def bind(self, parameters=()):
+        """Convert the conditions' literals and parameters; return (per-table predicates, residual predicate)."""
+        plan = self.plan
+        filters = [
+            Predicate(None, tree).bind(side.column_types, parameters) if tree else None
+            for side, tree in zip(plan["sides"], plan["filters"])
+        ]
+        residual = plan["residual"]
+        return filters, JoinedPredicate(None, residual).bind(plan["joined_types"], parameters) if residual else None
+
+    def select(self, filters, residual, descending=False, limit=None, offset=0):
+        """Return (columns, rows as dicts, None) of the joined rows, ordered and windowed."""
+        plan = self.plan
+        stop = None if limit is None else offset + limit
+        rows = self.joined_rows(filters, residual)
+        with phase("join"):
+            order_by = plan["order_by"]
+            if order_by:
+                def key(row):
+                    return (row[order_by] is not None, row[order_by])  # Unmatched (None) values first
+
+                if stop is not None:
+                    rows = (heapq.nlargest if descending else heapq.nsmallest)(stop, rows, key=key)
+                else:
+                    rows = sorted(rows, key=key, reverse=descending)
+            rows = list(itertools.islice(rows, offset, stop))
+        with phase("project"):
+            rows = [{label: row[source] for label, source in zip(plan["columns"], plan["sources"])} for row in rows]
+        count("rows.returned", len(rows))
+        return plan["columns"], rows, None
+
+    def aggregate(self, filters, residual):
+        """Return one tuple per group of the planned aggregates over the joined rows."""
+        plan = self.plan
+        aggregator = Aggregator(plan["items"], plan["group_by"])
+        group_by = plan["group_by"]
+        columns = [column for _, column in aggregator.aggregates]
+        rows = self.joined_rows(filters, residual)
+        with phase("aggregate"):
+            aggregator.consume(
+                (tuple(row[column] for column in group_by), tuple(1 if column is None else row[column] for column in columns))
+                for row in rows
+            )
+        return aggregator.results()
+
+    def side_rows(self, number, predicate):
+        """Load one table and find its rows that pass its own WHERE terms; return (table, positions or None, size)."""
+        side = self.plan["sides"][number]
+        with phase("load"):
+            table = self.storage.load_table(self.db_name, side.table)
+        if predicate is None:
+            access_path("scan", f"every row of {side.name}")
+            count("rows.scanned", len(table["rows"]))
+            return table, None, len(table["rows"])
+        with phase("filter"):
+            positions = self.query_tables.match_positions(table, predicate)
+        return table, positions, len(positions)
+
+    def joined_rows(self, filters, residual):
+        """Yield the joined rows as dicts of the qualified columns the query uses."""
+        plan = self.plan
+        sides, keys = plan["sides"], plan["keys"]
+        tables = [self.side_rows(number, filters[number]) for number in (0, 1)]
+        indexes = [table["indexes"].get(key) for (table, _, _), key in zip(tables, keys)]
+
+        # Look matches up on the side that costs least: building its hash table (nothing when
+        # an index covers the whole table) plus one lookup per row of the other side
+        def cost(number):
+            _, positions, size = tables[number]
+            built = 0 if indexes[number] is not None and positions is None else size
+            return built + tables[1 - number][2], size
+
+        build = min((0, 1), key=cost)
+        probe = 1 - build
+        columns = [list(dict.fromkeys([key] + needed)) for key, needed in zip(keys, plan["needed"])]
+        probe_table, probe_positions, probe_size = tables[probe]
+        build_table, build_positions, build_size = tables[build]
+
+        if indexes[build] is not None and build_positions is None:
+            lookup, found = self.index_lookup(build_table, indexes[build])
+            how = f"{indexes[build].kind} index on {sides[build].name}.{keys[build]}"
+
+            def unmatched():
+                rows = build_table["rows"]
+                for position in range(len(rows)):
+                    if position not in found:
+                        yield rows[position]
+        else:
+            with phase("build"):
+                build_rows = self.query_tables.project(build_table["rows"], build_positions, columns[build])
+                lookup = self.hash_table(build_rows, keys[build])
+            how = f"hash table of {build_size} {sides[build].name} rows"
+
+            def unmatched():
+                return (row for row in build_rows if id(row) not in matched)
+        access_path("join", f"{plan['kind']} hash join: {probe_size} {sides[probe].name} rows probe the {how}")
+
+        # Build the joined rows from the columns each side contributes
+        accessors = [
+            [(f"{side.name}.{column}", column) for column in needed] for side, needed in zip(sides, plan["needed"])
+        ]
+        unmatched_right = {name: None for name, _ in accessors[1]}
+        matched = set()  # Ids of the hash table's rows that found a match, for a LEFT JOIN
+
+        def joined(left, right):
+            row = {name: left[column] for name, column in accessors[0]}
+            if right is None:
+                row.update(unmatched_right)
+            else:
+                row.update({name: right[column] for name, column in accessors[1]})
+            return row
+
+        left_join = plan["kind"] == "left"
+
+        def probe_matches():
+            """Yield (probe row, its matches); a row of the whole table is only built when it has some."""
+            rows = probe_table["rows"]
+            if probe_positions is not None:
+                for row in self.query_tables.project(rows, probe_positions, columns[probe]):
+                    yield row, lookup(row[keys[probe]])
+                return
+            row_at = row_getter(rows, columns[probe])
+            keep_unmatched = left_join and probe == 0
+            for position, value in enumerate(column_values(rows, keys[probe])):
+                matches = lookup(value)
+                if matches or keep_unmatched:
+                    yield row_at(position), matches
+
+        def pairs():
+            if probe == 0:
+                for row, matches in probe_matches():
+                    if matches:
+                        for match in matches:
+                            yield joined(row, match)
+                    elif left_join:
+                        yield joined(row, None)
+                return
+
+            # The left table is the one looked up in: a LEFT JOIN adds the rows no right row matched at the end
+            for row, matches in probe_matches():
+                for match in matches or ():
+                    if left_join:
+                        matched.add(id(match))
+                    yield joined(match, row)
+            if left_join:
+                for row in unmatched():
+                    yield joined(row, None)
+
+        rows = pairs()
+        if residual is not None:
+            rows = filter(residual.matches, rows)
+        return rows
+
+    def hash_table(self, rows, key):
+        """Group rows by their join column; return the lookup function of the hash table."""
+        buckets = {}
+        for row in rows:
+            value = row[key]
+            bucket = buckets.get(value)
+            if bucket is None:
+                buckets[value] = [row]
+            else:
+                bucket.append(row)
+        return buckets.get
+
+    def index_lookup(self, table, index):
+        """Return (lookup function, matched rows by position) finding the rows with a join value through an existing index."""
+        rows = table["rows"]
+        row_count = len(rows)
+        found = {}  # Position -> row, so a row matched many times is built once
+
+        def lookup(value):
+            matches = index.lookup(operator.eq, value, row_count)
+            result = []
+            for position in matches:
+                row = found.get(position)
+                if row is None:
+                    row = found[position] = rows[position]
+                result.append(row)
+            return result
+
+        return lookup, found
@@ -0,0 +1,81 @@
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl; locks then only coordinate threads of one process
+    fcntl = None
+
+
+class FileLock:
+    """Advisory fcntl lock on a lock file: shared for readers, exclusive for writers.
+
+    Any number of processes can hold the shared lock at once, while the exclusive lock
+    waits for every other holder and keeps everyone else out. The lock is reentrant
+    within a process: nested acquisitions only count, and asking for the exclusive lock
+    while holding the shared one upgrades it until the matching release.
+
+    fcntl locks belong to the process, so callers must serialize their threads around
+    acquire() and release() (the storage does this with the database's thread_lock).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = None
+        self.modes = []  # Mode of every nested acquisition, True while exclusive
+
+    def acquire(self, exclusive=False):
+        current = self.modes[-1] if self.modes else None
+        if current is None or (exclusive and not current):
+            if self.handle is None:
+                self.handle = open(self.path, "a+")
+            if fcntl is not None:
+                # Upgrading drops the shared lock first, so anything read under it must be
+                # read again (the storage re-checks its cache every time it is used)
+                fcntl.flock(self.handle.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        self.modes.append(exclusive or bool(current))
+
+    def release(self):
+        exclusive = self.modes.pop()
+        if fcntl is None:
+            return
+        if not self.modes:
+            fcntl.flock(self.handle.fileno(), fcntl.LOCK_UN)
+        elif exclusive and not self.modes[-1]:
+            fcntl.flock(self.handle.fileno(), fcntl.LOCK_SH)  # Back to the outer holder's shared lock
+
+
+file_locks = {}  # Absolute lock file path -> FileLock, one per process so nested locks share it
+thread_locks = {}  # Key -> RLock, e.g. one per database
+file_locks_guard = threading.Lock()
+
+
+def reset_after_fork():
+    # A forked child shares its parent's open lock files, and flock() sees both as one
+    # owner; the child must open its own. Thread locks held by parent threads would
+    # never be released in the child
+    file_locks.clear()
+    thread_locks.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_after_fork)
+
+
+def thread_lock(key):
+    """Return the process-wide reentrant lock for a key, so threads using one thing take turns."""
+    with file_locks_guard:
+        lock = thread_locks.get(key)
+        if lock is None:
+            lock = thread_locks[key] = threading.RLock()
+        return lock
+
+
+def file_lock(path):
+    """Return the process-wide FileLock for a lock file."""
+    path = os.path.abspath(path)
+    with file_locks_guard:
+        lock = file_locks.get(path)
+        if lock is None:
+            lock = file_locks[path] = FileLock(path)
+        return lock
@@ -1,26 +1,66 @@
-import os
+import io
+import re
+import sys
+import csv
+import json
+import time
 from create_db import DatabaseManager
 from create_tables import TableManager
 from operation_tables import TableOperations
 from query_tables import QueryTables
 from export_functionality import ExportFunctionality  # Import the export functionality module
+from storage import in_transaction
+from statements import StatementExecutor, is_single_line, is_statement
+from metrics import metrics, profiling
 
-def print_help():
-    print("""
+# Commands that change what a transaction is about (the schema or the selected database)
+NOT_IN_TRANSACTION = (
+    "CREATE DATABASE", "DELETE DATABASE", "MIGRATE DATABASE", "USE DATABASE", "EXIT DATABASE",
+    "CREATE TABLE", "DROP TABLE", "CREATE INDEX", "DROP INDEX", "IMPORT TABLE",
+)
+
+# First words of the commands, for naming their latency histograms
+COMMAND_WORDS = {
+    "CREATE", "DELETE", "LIST", "MIGRATE", "USE", "EXIT", "DROP", "INSERT", "UPDATE", "SELECT", "EXPORT",
+    "IMPORT", "NEXT", "BEGIN", "COMMIT", "ROLLBACK", "HELP", "PROFILE", "EXPLAIN", "METRICS",
+}
+
+
+def command_type(command):
+    """Return the name a command's latency is recorded under, e.g. 'SELECT' or 'CREATE TABLE'."""
+    words = command.upper().split()[:2]
+    if not words or words[0] not in COMMAND_WORDS:
+        return "OTHER"
+    if words[0] in ("CREATE", "DROP", "LIST", "MIGRATE", "USE") or words[1:] == ["DATABASE"]:
+        return " ".join(words)
+    return words[0]
+
+
+def print_help(write=print):
+    write("""
 Available commands:
   CREATE DATABASE <name> - Creates a new database.
   DELETE DATABASE <name> - Deletes a database.
   LIST DATABASES         - Lists all existing databases.
+  MIGRATE DATABASE <name> - Converts a single-file database (<name>.json) to per-table storage.
   USE DATABASE <name>    - Selects a database to work with.
   EXIT DATABASE          - Exits the currently selected database.
-  CREATE TABLE <name>    - Creates a new table in the selected database.
+  CREATE TABLE <name> [COLUMNAR]
+                         - Creates a new table in the selected database.
                            Specify columns and types as 'column_name:type', separated by commas.
                            Supported types: integer, string, float, boolean.
+                           COLUMNAR stores the table column by column in typed arrays.
   DROP TABLE <name>      - Deletes a table from the selected database.
   LIST TABLES            - Lists all tables in the selected database.
+  CREATE INDEX <table>(<column>) [USING <type>]
+                         - Indexes a column so conditions on it skip the full scan.
+                           Supported types: hash (=, !=), ordered (=, !=, <, <=, >, >=, ORDER BY).
+  DROP INDEX <table>(<column>) - Drops the index over a column.
   INSERT INTO <name>     - Inserts data into a table in the selected database.
                            Example: INSERT INTO users
                                     Enter values: 1, John, 25.5, true
+                           Several rows: (1, John, 25.5, true), (2, Jane, 31.0, false)
+                           or '<<END', then one row per line, then 'END'.
   DELETE FROM <name>     - Deletes rows from a table in the selected database.
                            Example: DELETE FROM users
                                     Enter condition (or press Enter to delete all rows): id = 1
@@ -28,201 +68,525 @@ Available commands:
                            Example: UPDATE users
                                     Enter updates: name="John", age=30
                                     Enter condition (or press Enter to update all rows): id=1
-  SELECT FROM <name>     - Queries data from a table in the selected database.
-                           Example: SELECT FROM users
+  SELECT FROM <name> [LIMIT <n>] [OFFSET <n>]
+                         - Queries data from a table in the selected database.
+                           LIMIT shows n rows at a time; type NEXT for the following page.
+                           Example: SELECT FROM users LIMIT 50
                                     Enter condition (or press Enter for no condition): id=1
-  EXPORT TABLE <name> TO <format> - Exports a table to JSON or CSV.
-                                    Example: EXPORT TABLE users TO csv
-  EXPORT DATABASE <name> TO JSON  - Exports the entire database to a JSON file.
-                                    Example: EXPORT DATABASE testdb TO backup.json
-  IMPORT TABLE <name> FROM <file> - Imports a table from a JSON or CSV file.
-                                    Example: IMPORT TABLE users FROM data.json
+                           Conditions support =, !=, <, <=, >, >= with AND, OR, NOT and parentheses,
+                           e.g. age > 20 AND (name = 'John' OR NOT is_active = true)
+  EXPORT TABLE <name> TO <format> [GZIP] [COLUMNS <columns>] [WHERE <condition>] [ORDER BY <column> [ASC|DESC]]
+                                  - Exports a table, or the rows a query selects, to CSV,
+                                    JSON or NDJSON (one row per line). GZIP compresses the file.
+                                    Example: EXPORT TABLE users TO csv WHERE age > 20
+  EXPORT DATABASE <name> TO JSON [GZIP]
+                                  - Exports the entire database to a JSON file.
+                                    Example: EXPORT DATABASE testdb TO json
+  IMPORT TABLE <name> FROM <file> [APPEND] [SCHEMA col:type, ...]
+                                  - Imports a table from a JSON or CSV file. CSV files are
+                                    streamed in chunks; column types are inferred unless given
+                                    with SCHEMA, and APPEND adds the rows to an existing table.
+                                    Example: IMPORT TABLE users FROM data.csv SCHEMA id:integer
+  SELECT <columns|aggregates|*> FROM <name> [[LEFT] JOIN <name> ON <column> = <column>]
+         [WHERE <condition>] [GROUP BY <columns>] [ORDER BY <column> [ASC|DESC]] [LIMIT <n>] [OFFSET <n>]
+                         - Runs a query on one line. Aggregates are COUNT(*), COUNT, SUM, AVG,
+                           MIN and MAX.
+                           Example: SELECT is_active, COUNT(*), AVG(age) FROM users GROUP BY is_active
+                           Example: SELECT u.name, o.total FROM orders o JOIN users u ON o.user_id = u.id
+  INSERT INTO <name> [(<columns>)] VALUES (<values>), ...
+  UPDATE <name> SET <column>=<value>, ... [WHERE <condition>]
+  DELETE FROM <name> WHERE <condition>
+                         - Single-line forms of INSERT INTO, UPDATE and DELETE FROM.
+                           Example: UPDATE users SET age = 31 WHERE name = 'John'
+  NEXT                   - Shows the next page of the last SELECT FROM ... LIMIT.
+  BEGIN                  - Starts a transaction in the selected database. INSERT, UPDATE and
+                           DELETE FROM are held back (and seen only by this session) until
+                           COMMIT saves them all with one write; ROLLBACK discards them.
+  COMMIT                 - Saves the changes of the open transaction.
+  ROLLBACK               - Discards the changes of the open transaction.
+  PROFILE <command>      - Runs a command, then shows how its rows were found (access path), the
+                           time of each phase, rows scanned, matched and returned, and bytes read
+                           and written. Example: PROFILE SELECT name FROM users WHERE id = 1
+  EXPLAIN <statement>    - Shows the same report for a SELECT, INSERT, UPDATE or DELETE. The
+                           statement runs in full (in an open transaction, on what it sees), but
+                           its rows are not printed and its changes are rolled back.
+  METRICS [RESET|JSON]   - Shows counters and latency histograms for everything this process ran.
   EXIT                   - Exits the CLI.
     """)
 
-def main():
-    db_manager = DatabaseManager()
-    table_manager = TableManager()
-    table_operations = TableOperations()
-    query_tables = QueryTables()
-    export_functionality = ExportFunctionality()
-    selected_db = None
+def print_page(query_tables, page_token, write=print):
+    """Print the next page of a paginated SELECT; return the token for NEXT, or None at the end."""
+    columns, rows, error = query_tables.fetch_page(page_token)
+    if error:
+        write(error)
+        return None
+    write(query_tables.format_rows(columns, rows))
+    if page_token not in query_tables.cursors:
+        return None
+    write("-- More rows available. Type NEXT for the next page. --")
+    return page_token
 
-    print("Welcome to EarthDB CLI!")
-    print("Type 'help' for available commands.")
+def split_value_tuples(text):
+    """Split '(1, a), (2, b)' into the text inside each pair of parentheses."""
+    groups = []
+    start = None
+    quote = None
+    for i, char in enumerate(text):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == "(" and start is None:
+            start = i + 1
+        elif char == ")" and start is not None:
+            groups.append(text[start:i])
+            start = None
+    if quote or start is not None:
+        raise ValueError("Unbalanced quotes or parentheses in values.")
+    return groups
 
-    while True:
-        command = input(f"earthdb ({selected_db if selected_db else 'no database selected'})> ").strip()
 
+def parse_values(text):
+    """Split one row of comma-separated values; double-quoted values may contain commas."""
+    return [value.strip() for value in next(csv.reader([text], skipinitialspace=True))]
+
+
+def read_insert_rows(values, read_input=input):
+    """Return the rows entered at the 'Values:' prompt.
+
+    Accepts a single row, several '(...), (...)' tuples, or '<<END' followed by one row
+    per line and a closing 'END' line.
+    """
+    if values.startswith("<<"):
+        terminator = values[2:].strip() or "END"
+        rows = []
+        while True:
+            line = read_input("... ").strip()
+            if line == terminator:
+                return rows
+            if line:
+                rows.extend(read_insert_rows(line, read_input))
+    if values.startswith("("):
+        return [parse_values(group) for group in split_value_tuples(values)]
+    return [parse_values(values)]
+
+
+class CommandSession:
+    """Runs CLI commands against the databases and remembers the selected database.
+
+    Prompts are answered by read_input and results written with write (input and print
+    by default), so the same commands can be run from the terminal or another front end.
+    """
+
+    def __init__(self, read_input=input, write=print, db_path="earthdb_data"):
+        self.input = read_input
+        self.print = write
+        self.db_manager = DatabaseManager(db_path)
+        self.table_manager = TableManager(db_path)
+        self.table_operations = TableOperations(db_path)
+        self.query_tables = QueryTables(db_path)
+        self.export_functionality = ExportFunctionality(db_path)
+        self.statements = StatementExecutor(db_path, self.query_tables, self.table_operations)
+        self.selected_db = None
+        self.page_token = None  # Cursor of the last paginated SELECT, for NEXT
+        self.transaction = None  # Open transaction started with BEGIN
+
+    def prompt(self):
+        transaction = " [transaction]" if self.transaction else ""
+        return f"earthdb ({self.selected_db if self.selected_db else 'no database selected'}){transaction}> "
+
+    def execute(self, command):
+        """Run one command; return False once the session should end (EXIT)."""
+        command = command.strip()
+        if self.transaction and command.upper().startswith(NOT_IN_TRANSACTION):
+            self.print(f"Error: {command} cannot run inside a transaction. COMMIT or ROLLBACK first.")
+            return True
+        # Commands of an open transaction see its changes and add theirs to it
+        started = time.perf_counter()
+        try:
+            with in_transaction(self.transaction):
+                return self.run(command)
+        finally:
+            metrics.observe("command." + command_type(command), time.perf_counter() - started)
+
+    def run_scripted(self, command, inputs=()):
+        """Run one command with its prompts answered from inputs; return (printed text, whether to go on).
+
+        Raises EOFError if the command asks for more answers than given. The instructions
+        printed before each prompt are left out of the text.
+        """
+        output = io.StringIO()
+        answers = iter(inputs)
+
+        def read_input(prompt=""):
+            output.seek(0)
+            output.truncate()
+            try:
+                return next(answers)
+            except StopIteration:
+                raise EOFError(f"missing input for prompt '{prompt.strip()}'")
+
+        read_input_before, write_before = self.input, self.print
+        self.input = read_input
+        self.print = lambda *values, **options: print(*values, file=output, **options)
+        try:
+            keep_going = self.execute(command)
+        finally:
+            self.input, self.print = read_input_before, write_before
+        return output.getvalue().rstrip("\n"), keep_going
+
+    def run_statement(self, statement, parameters=()):
+        """Run a SELECT, INSERT, UPDATE or DELETE statement with values for its '?' placeholders.
+
+        Returns (columns, rows, None) for a SELECT and (None, None, message) otherwise.
+        """
+        if not self.selected_db:
+            return None, None, "Error: No database selected. Use 'USE DATABASE <name>' first."
+        with in_transaction(self.transaction):
+            return self.statements.execute(self.selected_db, statement, parameters)
+
+    def profile(self, command):
+        """Run PROFILE <command> or EXPLAIN <statement>; return False once the session should end."""
+        prefix, _, command = command.partition(" ")
+        command = command.strip()
+        if prefix.upper() == "PROFILE":
+            with profiling() as profile:
+                started = time.perf_counter()
+                keep_going = self.execute(command)
+                elapsed = time.perf_counter() - started
+            self.print(profile.report(elapsed))
+            return keep_going
+
+        if not is_statement(command):
+            self.print("Error: EXPLAIN takes a SELECT, INSERT, UPDATE or DELETE statement.")
+        elif not self.selected_db:
+            self.print("Error: No database selected. Use 'USE DATABASE <name>' first.")
+        else:
+            # The statement runs in a transaction of its own that is always rolled back; inside
+            # an open transaction it starts from that transaction's changes
+            if self.transaction:
+                transaction = self.transaction.savepoint()
+            else:
+                transaction = self.table_operations.storage.begin(self.selected_db)
+            with profiling() as profile, in_transaction(transaction):
+                started = time.perf_counter()
+                columns, _, message = self.statements.execute(self.selected_db, command)
+                elapsed = time.perf_counter() - started
+            transaction.rollback()
+            if columns is None and message.startswith("Error"):
+                self.print(message)
+            else:
+                self.print(profile.report(elapsed))
+        return True
+
+    def run(self, command):
         if command.lower() == "exit":
-            print("Exiting EarthDB CLI. Goodbye!")
-            break
+            if self.transaction:
+                self.transaction.rollback()
+                self.print("The open transaction was rolled back.")
+            self.print("Exiting EarthDB CLI. Goodbye!")
+            return False
         elif command.lower() == "help":
-            print_help()
+            print_help(self.print)
+        elif command.upper().startswith(("PROFILE ", "EXPLAIN ")):
+            return self.profile(command)
+        elif command.upper() in ("METRICS", "METRICS RESET", "METRICS JSON"):
+            if command.upper() == "METRICS JSON":
+                self.print(json.dumps(metrics.snapshot()))
+            elif command.upper() == "METRICS RESET":
+                metrics.reset()
+                self.print("Metrics reset.")
+            else:
+                self.print(metrics.report())
+        elif is_single_line(command):
+            columns, rows, message = self.run_statement(command)
+            self.print(message if columns is None else self.query_tables.format_rows(columns, rows))
         elif command.startswith("CREATE DATABASE"):
             try:
                 _, _, db_name = command.split(" ", 2)
-                print(db_manager.create_database(db_name))
+                self.print(self.db_manager.create_database(db_name))
             except ValueError:
-                print("Error: Invalid syntax. Usage: CREATE DATABASE <name>")
+                self.print("Error: Invalid syntax. Usage: CREATE DATABASE <name>")
         elif command.startswith("DELETE DATABASE"):
             try:
                 _, _, db_name = command.split(" ", 2)
-                print(db_manager.delete_database(db_name))
+                self.print(self.db_manager.delete_database(db_name))
+            except ValueError:
+                self.print("Error: Invalid syntax. Usage: DELETE DATABASE <name>")
+        elif command.startswith("MIGRATE DATABASE"):
+            try:
+                _, _, db_name = command.split(" ", 2)
+                self.print(self.db_manager.migrate_database(db_name))
             except ValueError:
-                print("Error: Invalid syntax. Usage: DELETE DATABASE <name>")
+                self.print("Error: Invalid syntax. Usage: MIGRATE DATABASE <name>")
         elif command.lower() == "list databases":
-            print("Available databases:")
-            print(db_manager.list_databases())
+            self.print("Available databases:")
+            self.print(self.db_manager.list_databases())
         elif command.startswith("USE DATABASE"):
             try:
                 _, _, db_name = command.split(" ", 2)
-                if os.path.exists(f"earthdb_data/{db_name}.json"):
-                    selected_db = db_name
-                    print(f"Now using database '{selected_db}'.")
+                if self.db_manager.database_exists(db_name):
+                    self.selected_db = db_name
+                    self.print(f"Now using database '{self.selected_db}'.")
                 else:
-                    print(f"Error: Database '{db_name}' does not exist!")
+                    self.print(f"Error: Database '{db_name}' does not exist!")
             except ValueError:
-                print("Error: Invalid syntax. Usage: USE DATABASE <name>")
+                self.print("Error: Invalid syntax. Usage: USE DATABASE <name>")
         elif command.lower() == "exit database":
-            if selected_db:
-                print(f"Exited from database '{selected_db}'.")
-                selected_db = None
+            if self.selected_db:
+                self.print(f"Exited from database '{self.selected_db}'.")
+                self.selected_db = None
             else:
-                print("Error: No database is currently selected.")
+                self.print("Error: No database is currently selected.")
         elif command.startswith("CREATE TABLE"):
-            if not selected_db:
-                print("Error: No database selected. Use 'USE DATABASE <name>' first.")
+            if not self.selected_db:
+                self.print("Error: No database selected. Use 'USE DATABASE <name>' first.")
             else:
                 try:
                     _, _, table_name = command.split(" ", 2)
-                    print("Enter columns and types in the format 'column_name:type', separated by commas.")
-                    print("Supported types: integer, string, float, boolean.")
-                    columns_with_types = input("Columns: ").strip().split(",")
-                    print(table_manager.create_table(selected_db, table_name, columns_with_types))
+                    table_name, _, storage_format = table_name.partition(" ")
+                    self.print("Enter columns and types in the format 'column_name:type', separated by commas.")
+                    self.print("Supported types: integer, string, float, boolean.")
+                    columns_with_types = self.input("Columns: ").strip().split(",")
+                    self.print(self.table_manager.create_table(
+                        self.selected_db, table_name, columns_with_types, storage_format.strip() or "rows"
+                    ))
                 except ValueError:
-                    print("Error: Invalid syntax. Usage: CREATE TABLE <name>")
+                    self.print("Error: Invalid syntax. Usage: CREATE TABLE <name>")
         elif command.startswith("DROP TABLE"):
-            if not selected_db:
-                print("Error: No database selected. Use 'USE DATABASE <name>' first.")
+            if not self.selected_db:
+                self.print("Error: No database selected. Use 'USE DATABASE <name>' first.")
             else:
                 try:
                     _, _, table_name = command.split(" ", 2)
-                    print(table_manager.drop_table(selected_db, table_name))
+                    self.print(self.table_manager.drop_table(self.selected_db, table_name))
                 except ValueError:
-                    print("Error: Invalid syntax. Usage: DROP TABLE <name>")
+                    self.print("Error: Invalid syntax. Usage: DROP TABLE <name>")
+        elif command.startswith("CREATE INDEX") or command.startswith("DROP INDEX"):
+            if not self.selected_db:
+                self.print("Error: No database selected. Use 'USE DATABASE <name>' first.")
+            else:
+                creating = command.startswith("CREATE INDEX")
+                match = re.fullmatch(
+                    r"(?:CREATE|DROP) INDEX\s+(\w+)\s*\(\s*(\w+)\s*\)(?:\s+USING\s+(\w+))?", command
+                )
+                if not match or (match.group(3) and not creating):
+                    self.print("Error: Invalid syntax. Usage: CREATE INDEX <table>(<column>) [USING <type>]"
+                          if creating else "Error: Invalid syntax. Usage: DROP INDEX <table>(<column>)")
+                elif creating:
+                    table_name, column_name, index_type = match.groups()
+                    self.print(self.table_manager.create_index(self.selected_db, table_name, column_name, index_type or "hash"))
+                else:
+                    table_name, column_name, _ = match.groups()
+                    self.print(self.table_manager.drop_index(self.selected_db, table_name, column_name))
         elif command.startswith("LIST TABLES"):
-            if not selected_db:
-                print("Error: No database selected. Use 'USE DATABASE <name>' first.")
+            if not self.selected_db:
+                self.print("Error: No database selected. Use 'USE DATABASE <name>' first.")
             else:
-                print("Tables in database:")
-                print(table_manager.list_tables(selected_db))
+                self.print("Tables in database:")
+                self.print(self.table_manager.list_tables(self.selected_db))
         elif command.startswith("INSERT INTO"):
-            if not selected_db:
-                print("Error: No database selected. Use 'USE DATABASE <name>' first.")
+            if not self.selected_db:
+                self.print("Error: No database selected. Use 'USE DATABASE <name>' first.")
             else:
                 try:
                     _, _, table_name = command.split(" ", 2)
-                    print("Enter values for the table columns, separated by commas.")
-                    values = input("Values: ").strip().split(",")
-                    print(table_operations.insert_into_table(selected_db, table_name, values))
+                    self.print("Enter values for the table columns, separated by commas.")
+                    self.print("For several rows use (...), (...) tuples or '<<END' followed by one row per line.")
+                    rows = read_insert_rows(self.input("Values: ").strip(), self.input)
+                    if len(rows) == 1:
+                        self.print(self.table_operations.insert_into_table(self.selected_db, table_name, rows[0]))
+                    else:
+                        self.print(self.table_operations.insert_many(self.selected_db, table_name, rows))
                 except ValueError:
-                    print("Error: Invalid syntax. Usage: INSERT INTO <name>")
+                    self.print("Error: Invalid syntax. Usage: INSERT INTO <name>")
         elif command.startswith("UPDATE"):
-            if not selected_db:
-                print("Error: No database selected. Use 'USE DATABASE <name>' first.")
+            if not self.selected_db:
+                self.print("Error: No database selected. Use 'USE DATABASE <name>' first.")
             else:
                 try:
                     _, table_name = command.split(" ", 1)
-                    print("Enter updates in the format 'column=value', separated by commas:")
-                    updates = input("Updates: ").strip()
-                    print("Enter condition (or press Enter to update all rows):")
-                    condition = input("Condition: ").strip()
+                    self.print("Enter updates in the format 'column=value', separated by commas:")
+                    updates = self.input("Updates: ").strip()
+                    self.print("Enter condition (or press Enter to update all rows):")
+                    condition = self.input("Condition: ").strip()
                     condition = condition if condition else None
-                    print(table_operations.update_table(selected_db, table_name, updates, condition))
+                    self.print(self.table_operations.update_table(self.selected_db, table_name, updates, condition))
                 except ValueError:
-                    print("Error: Invalid syntax. Usage: UPDATE <table>")
+                    self.print("Error: Invalid syntax. Usage: UPDATE <table>")
         elif command.startswith("DELETE FROM"):
-            if not selected_db:
-                print("Error: No database selected. Use 'USE DATABASE <name>' first.")
+            if not self.selected_db:
+                self.print("Error: No database selected. Use 'USE DATABASE <name>' first.")
             else:
                 try:
                     _, _, table_name = command.split(" ", 2)
-                    print("Enter condition (or press Enter to delete all rows):")
-                    condition = input("Condition: ").strip()
+                    self.print("Enter condition (or press Enter to delete all rows):")
+                    condition = self.input("Condition: ").strip()
                     condition = condition if condition else None
-                    print(table_operations.delete_from_table(selected_db, table_name, condition))
+                    self.print(self.table_operations.delete_from_table(self.selected_db, table_name, condition))
                 except ValueError:
-                    print("Error: Invalid syntax. Usage: DELETE FROM <name>")
+                    self.print("Error: Invalid syntax. Usage: DELETE FROM <name>")
         elif command.startswith("SELECT FROM"):
-            if not selected_db:
-                print("Error: No database selected. Use 'USE DATABASE <name>' first.")
+            if not self.selected_db:
+                self.print("Error: No database selected. Use 'USE DATABASE <name>' first.")
             else:
                 try:
                     _, _, table_name = command.split(" ", 2)
-                    print("Enter columns to select (comma-separated or * for all):")
-                    columns = input("Columns: ").strip()
+                    match = re.fullmatch(r"(\w+)(?:\s+LIMIT\s+(\d+))?(?:\s+OFFSET\s+(\d+))?", table_name.strip())
+                    if not match:
+                        raise ValueError
+                    table_name, limit, offset = match.group(1), match.group(2), int(match.group(3) or 0)
+                    self.print("Enter columns to select (comma-separated or * for all):")
+                    columns = self.input("Columns: ").strip()
                     columns = columns if columns else "*"
-                    print("Enter condition (or press Enter for no condition):")
-                    condition = input("Condition: ").strip()
+                    self.print("Enter condition (or press Enter for no condition):")
+                    condition = self.input("Condition: ").strip()
                     condition = condition if condition else None
-                    print("Enter column to sort by (or press Enter for no sorting):")
-                    order_by = input("Order by: ").strip()
+                    self.print("Enter column to sort by (or press Enter for no sorting):")
+                    order_by = self.input("Order by: ").strip()
                     order_by = order_by if order_by else None
                     if order_by:
-                        print("Enter sort order (asc/desc):")
-                        sort_order = input("Sort order: ").strip().lower()
+                        self.print("Enter sort order (asc/desc):")
+                        sort_order = self.input("Sort order: ").strip().lower()
                     else:
                         sort_order = "asc"
-                    print(
-                        query_tables.select_from_table(
-                            selected_db, table_name, columns, condition, order_by, sort_order
+                    if limit is None:
+                        self.print(
+                            self.query_tables.select_from_table(
+                                self.selected_db, table_name, columns, condition, order_by, sort_order, offset=offset
+                            )
                         )
-                    )
+                    else:
+                        # A LIMIT pages through the result; NEXT fetches the following page
+                        self.page_token, error = self.query_tables.open_cursor(
+                            self.selected_db, table_name, columns, condition, order_by, sort_order, int(limit), offset
+                        )
+                        if error:
+                            self.print(error)
+                        else:
+                            self.page_token = print_page(self.query_tables, self.page_token, self.print)
                 except ValueError:
-                    print("Error: Invalid syntax. Usage: SELECT FROM <name>")
-        elif command.startswith("EXPORT TABLE"):
-            if not selected_db:
-                print("Error: No database selected. Use 'USE DATABASE <name>' first.")
+                    self.print("Error: Invalid syntax. Usage: SELECT FROM <name> [LIMIT <n>] [OFFSET <n>]")
+        elif command.upper() == "BEGIN":
+            if not self.selected_db:
+                self.print("Error: No database selected. Use 'USE DATABASE <name>' first.")
+            elif self.transaction:
+                self.print("Error: A transaction is already open. COMMIT or ROLLBACK it first.")
+            else:
+                self.transaction = self.table_operations.storage.begin(self.selected_db)
+                self.print(f"Transaction started in database '{self.selected_db}'.")
+        elif command.upper() == "COMMIT":
+            if not self.transaction:
+                self.print("Error: No transaction is open. Use BEGIN first.")
             else:
+                transaction, self.transaction = self.transaction, None
                 try:
-                    _, _, table_name, _, format_type = command.split(" ", 4)
-                    output_file = input("Enter output file name (with extension): ").strip()
-                    if format_type.lower() == "csv":
-                        print(export_functionality.export_table_to_csv(selected_db, table_name, output_file))
-                    elif format_type.lower() == "json":
-                        print(export_functionality.export_table_to_json(selected_db, table_name, output_file))
-                    else:
-                        print("Error: Unsupported format. Use 'csv' or 'json'.")
-                except ValueError:
-                    print("Error: Invalid syntax. Usage: EXPORT TABLE <name> TO <format>")
+                    count = self.table_operations.storage.commit(transaction)
+                    self.print(f"Transaction committed ({count} change(s) saved).")
+                except Exception as e:
+                    self.print(str(e))
+        elif command.upper() == "ROLLBACK":
+            if not self.transaction:
+                self.print("Error: No transaction is open. Use BEGIN first.")
+            else:
+                self.transaction.rollback()
+                self.transaction = None
+                self.print("Transaction rolled back. No changes were saved.")
+        elif command.lower() == "next":
+            if not self.page_token:
+                self.print("Error: No more pages. Run 'SELECT FROM <name> LIMIT <n>' first.")
+            else:
+                self.page_token = print_page(self.query_tables, self.page_token, self.print)
+        elif command.startswith("EXPORT TABLE"):
+            if not self.selected_db:
+                self.print("Error: No database selected. Use 'USE DATABASE <name>' first.")
+            else:
+                match = re.fullmatch(
+                    r"EXPORT TABLE\s+(\w+)\s+TO\s+(\w+)(\s+GZIP)?(?:\s+COLUMNS\s+(.+?))?"
+                    r"(?:\s+WHERE\s+(.+?))?(?:\s+ORDER BY\s+(\w+)(?:\s+(ASC|DESC|asc|desc))?)?",
+                    command,
+                )
+                if not match:
+                    self.print("Error: Invalid syntax. Usage: EXPORT TABLE <name> TO <format> [GZIP] "
+                          "[COLUMNS <columns>] [WHERE <condition>] [ORDER BY <column> [ASC|DESC]]")
+                    return True
+                table_name, format_type, compress, columns, condition, order_by, sort_order = match.groups()
+                query = dict(
+                    compress=bool(compress), columns=columns or "*", condition=condition,
+                    order_by=order_by, sort_order=sort_order or "asc",
+                )
+                format_type = format_type.lower()
+                if format_type not in ("csv", "json", "ndjson"):
+                    self.print("Error: Unsupported format. Use 'csv', 'json' or 'ndjson'.")
+                    return True
+                output_file = self.input("Enter output file name (with extension): ").strip()
+                if format_type == "csv":
+                    self.print(self.export_functionality.export_table_to_csv(self.selected_db, table_name, output_file, **query))
+                else:
+                    self.print(self.export_functionality.export_table_to_json(
+                        self.selected_db, table_name, output_file, ndjson=format_type == "ndjson", **query
+                    ))
         elif command.startswith("EXPORT DATABASE"):
             try:
                 _, _, db_name, _, file_format = command.split(" ", 4)
+                compress = file_format.upper().endswith(" GZIP")
+                if compress:
+                    file_format = file_format[: -len(" GZIP")].strip()
                 if file_format.lower() != "json":
-                    print("Error: Only JSON format is supported for database export.")
+                    self.print("Error: Only JSON format is supported for database export.")
                 else:
-                    output_file = input("Enter output file name (with .json extension): ").strip()
-                    print(export_functionality.export_database_to_json(db_name, output_file))
+                    output_file = self.input("Enter output file name (with .json extension): ").strip()
+                    self.print(self.export_functionality.export_database_to_json(db_name, output_file, compress))
             except ValueError:
-                print("Error: Invalid syntax. Usage: EXPORT DATABASE <name> TO JSON")
+                self.print("Error: Invalid syntax. Usage: EXPORT DATABASE <name> TO JSON [GZIP]")
         elif command.startswith("IMPORT TABLE"):
-            if not selected_db:
-                print("Error: No database selected. Use 'USE DATABASE <name>' first.")
+            if not self.selected_db:
+                self.print("Error: No database selected. Use 'USE DATABASE <name>' first.")
             else:
-                try:
-                    _, _, table_name, _, file_path = command.split(" ", 4)
-                    file_type = file_path.split(".")[-1].lower()
-                    if file_type == "json":
-                        print(export_functionality.import_table_from_json(selected_db, table_name, file_path))
-                    elif file_type == "csv":
-                        print(export_functionality.import_table_from_csv(selected_db, table_name, file_path))
+                match = re.fullmatch(
+                    r"IMPORT TABLE\s+(\w+)\s+FROM\s+(\S+)(\s+APPEND)?(?:\s+SCHEMA\s+(.+))?", command
+                )
+                if not match:
+                    self.print("Error: Invalid syntax. Usage: IMPORT TABLE <name> FROM <file> [APPEND] [SCHEMA col:type, ...]")
+                    return True
+                table_name, file_path, append, schema = match.groups()
+                file_type = file_path[: -len(".gz")] if file_path.endswith(".gz") else file_path
+                file_type = file_type.split(".")[-1].lower()
+                if file_type == "json":
+                    if append or schema:
+                        self.print("Error: APPEND and SCHEMA are only supported for CSV imports.")
                     else:
-                        print("Error: Unsupported file type. Use '.json' or '.csv'.")
-                except ValueError:
-                    print("Error: Invalid syntax. Usage: IMPORT TABLE <name> FROM <file>")
+                        self.print(self.export_functionality.import_table_from_json(self.selected_db, table_name, file_path))
+                elif file_type == "csv":
+                    self.print(self.export_functionality.import_table_from_csv(
+                        self.selected_db, table_name, file_path, schema=schema, append=bool(append),
+                        progress=lambda rows, rate: self.print(f"  {rows} rows read ({rate:,.0f} rows/sec)...")
+                    ))
+                else:
+                    self.print("Error: Unsupported file type. Use '.json' or '.csv'.")
         else:
-            print("Error: Unknown command. Type 'help' for available commands.")
+            self.print("Error: Unknown command. Type 'help' for available commands.")
+        return True
+
+
+def main():
+    session = CommandSession()
+
+    print("Welcome to EarthDB CLI!")
+    print("Type 'help' for available commands.")
+
+    while True:
+        if not session.execute(input(session.prompt())):
+            break
 
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:2] == ["serve"]:
+        import server
+        server.main(sys.argv[2:])
+    elif sys.argv[1:] or not sys.stdin.isatty():
+        # A script file or piped statements run in batch mode
+        import batch
+        sys.exit(batch.main(sys.argv[1:]))
+    else:
+        main()
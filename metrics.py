@@ -0,0 +1,192 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bounds of the latency histogram buckets, in milliseconds; slower calls go in a last bucket
+LATENCY_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Profile of the command being run with PROFILE or EXPLAIN, if any
+active_profile = ContextVar("active_profile", default=None)
+
+
+class Histogram:
+    """Counts latencies in fixed buckets, so recording one costs a binary search and an increment."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, milliseconds):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, milliseconds)] += 1
+        self.count += 1
+        self.total_ms += milliseconds
+        self.max_ms = max(self.max_ms, milliseconds)
+
+    def percentile(self, fraction):
+        """Return the upper bound of the bucket holding the given fraction of the calls (the maximum past the last bound)."""
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total_ms / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": self.max_ms,
+        }
+
+
+class Metrics:
+    """Process-wide counters and latency histograms, shared by the CLI, GUI and server.
+
+    Counters are named like 'bytes.read' or 'access.index', histograms like
+    'command.SELECT' or 'statement.UPDATE'. snapshot() returns them as a dict and
+    report() as text; the CLI, GUI and server all show the same numbers.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, seconds):
+        """Record how long one operation of a type took."""
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds * 1000)
+
+    @contextmanager
+    def timed(self, name):
+        """Record the time a with block takes in the histogram name."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def snapshot(self):
+        """Return {'uptime_s', 'counters', 'latency'} with every counter and histogram summary."""
+        with self.lock:
+            return {
+                "uptime_s": time.time() - self.started,
+                "counters": dict(sorted(self.counters.items())),
+                "latency": {name: histogram.summary() for name, histogram in sorted(self.histograms.items())},
+            }
+
+    def report(self):
+        """Format the metrics as the text the METRICS command prints."""
+        snapshot = self.snapshot()
+        lines = [f"Metrics since {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started))}"
+                 f" ({snapshot['uptime_s']:.0f} s):"]
+        if not snapshot["counters"] and not snapshot["latency"]:
+            lines.append("  Nothing recorded yet.")
+        if snapshot["counters"]:
+            lines.append("Counters:")
+            width = max(len(name) for name in snapshot["counters"])
+            lines.extend(f"  {name:<{width}}  {value}" for name, value in snapshot["counters"].items())
+        if snapshot["latency"]:
+            width = max(len(name) for name in snapshot["latency"])
+            lines.append("Latency (ms):")
+            lines.append(f"  {'':<{width}}  {'count':>8} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+            for name, summary in snapshot["latency"].items():
+                lines.append(
+                    f"  {name:<{width}}  {summary['count']:>8} {summary['mean_ms']:>9.3f} {summary['p50_ms']:>9.3f}"
+                    f" {summary['p95_ms']:>9.3f} {summary['p99_ms']:>9.3f} {summary['max_ms']:>9.3f}"
+                )
+        return "\n".join(lines)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.started = time.time()
+
+
+# Shared by every component in the process
+metrics = Metrics()
+
+
+class Profile:
+    """What one command did: access paths chosen, time per phase, bytes and rows touched."""
+
+    COUNTERS = ("rows.scanned", "rows.matched", "rows.returned", "bytes.read", "bytes.written")
+
+    def __init__(self):
+        self.access_paths = []
+        self.phases = {}  # Phase name -> seconds, in the order phases first ran
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+
+    def report(self, total_seconds):
+        """Format the profile as the text PROFILE and EXPLAIN print."""
+        lines = ["Access path: " + ("; ".join(self.access_paths) if self.access_paths else "none (no table scanned)")]
+        if self.phases:
+            lines.append("Phases:")
+            width = max(len(name) for name in self.phases)
+            lines.extend(f"  {name:<{width}}  {seconds * 1000:10.3f} ms" for name, seconds in self.phases.items())
+        counters = self.counters
+        lines.append(
+            f"Rows: {counters['rows.scanned']} scanned, {counters['rows.matched']} matched,"
+            f" {counters['rows.returned']} returned"
+        )
+        lines.append(f"Bytes: {counters['bytes.read']} read, {counters['bytes.written']} written")
+        lines.append(f"Total: {total_seconds * 1000:.3f} ms")
+        return "\n".join(lines)
+
+
+@contextmanager
+def profiling():
+    """Collect a Profile of everything run in the with block (in this thread)."""
+    profile = Profile()
+    token = active_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        active_profile.reset(token)
+
+
+@contextmanager
+def phase(name):
+    """Time a phase of the command being profiled; costs next to nothing when none is."""
+    profile = active_profile.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.phases[name] = profile.phases.get(name, 0.0) + time.perf_counter() - started
+
+
+def count(name, amount=1):
+    """Add to a process-wide counter, and to the profile of the command being profiled."""
+    metrics.increment(name, amount)
+    profile = active_profile.get()
+    if profile is not None and name in profile.counters:
+        profile.counters[name] += amount
+
+
+def access_path(kind, description):
+    """Record how a table was read: counted as 'access.<kind>' and described in the profile."""
+    metrics.increment("access." + kind)
+    profile = active_profile.get()
+    if profile is not None:
+        profile.access_paths.append(description)
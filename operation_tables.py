@@ -1,155 +1,236 @@
-import os
-import json
-import operator
 from query_tables import QueryTables  # Import QueryTables for condition parsing and evaluation
+from storage import DatabaseStorage
+from metrics import access_path, count, phase
+
+
+def to_boolean(value):
+    """Convert a value to a boolean the way the CLI always has: 'true' and '1' are true."""
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ["true", "1"]
+
+
+# Converters from input values to each supported column type
+CONVERTERS = {
+    "integer": int,
+    "float": float,
+    "boolean": to_boolean,
+    "string": str,
+}
+
 
 class TableOperations:
     def __init__(self, db_path="earthdb_data"):
         self.db_path = db_path
+        self.storage = DatabaseStorage(db_path)
+        self.query_tables = QueryTables(db_path)
 
-    def load_database(self, db_name):
-        """Load the JSON file of the specified database."""
-        db_file = os.path.join(self.db_path, f"{db_name}.json")
-        if not os.path.exists(db_file):
-            raise Exception(f"Error: Database '{db_name}' does not exist!")
-        with open(db_file, "r") as f:
-            return json.load(f), db_file
+    def transaction(self, db_name):
+        """Run the statements of a with block as one transaction on a database.
 
-    def save_database(self, db_data, db_file):
-        """Save changes to the database JSON file."""
-        with open(db_file, "w") as f:
-            json.dump(db_data, f, indent=4)
+            with table_operations.transaction("testdb"):
+                table_operations.insert_into_table("testdb", "users", [1, "John", 25.5, True])
+                table_operations.update_table("testdb", "users", "age=26", "id = 1")
 
-    def insert_into_table(self, db_name, table_name, data):
-        """Insert data into a specified table."""
-        db_data, db_file = self.load_database(db_name)
-        if table_name not in db_data["tables"]:
-            return f"Error: Table '{table_name}' does not exist in database '{db_name}'!"
-
-        table = db_data["tables"][table_name]
-        columns = table["columns"]
+        The block sees its own changes, which are saved together with one write at its end
+        and discarded if it raises.
+        """
+        return self.storage.transaction(db_name)
 
-        # Validate the input data
-        if len(data) != len(columns):
-            return f"Error: Mismatch in column count. Table '{table_name}' expects {len(columns)} columns."
+    def log_mutation(self, db_name, record):
+        """Append a row mutation to the database log instead of rewriting the table file."""
+        self.storage.log(db_name, record)
 
-        row = {}
-        for (column_name, column_type), value in zip(columns.items(), data):
-            # Type validation
+    def insert_into_table(self, db_name, table_name, data):
+        """Insert data into a specified table."""
+        with self.storage.locked(db_name, exclusive=True):
+            catalog = self.storage.load_catalog(db_name)
+            if table_name not in catalog["tables"]:
+                return f"Error: Table '{table_name}' does not exist in database '{db_name}'!"
+
+            # Only the schema is needed; the table's rows are not loaded for an insert
+            columns = catalog["tables"][table_name]["columns"]
+
+            # Validate and convert the input data
+            with phase("convert"):
+                rows, error = self.coerce_rows(table_name, columns, [data])
+            if error:
+                return error
+
+            # Add the row to the table
+            self.log_mutation(db_name, {"op": "insert", "table": table_name, "rows": rows})
+            return f"Data inserted successfully into table '{table_name}'."
+
+    def insert_many(self, db_name, table_name, rows):
+        """Insert many rows with a single write.
+
+        Each row is a sequence of values in column order or a dict keyed by column name.
+        Either every row is inserted or, if any value is invalid, none are.
+        """
+        with self.storage.locked(db_name, exclusive=True):
+            catalog = self.storage.load_catalog(db_name)
+            if table_name not in catalog["tables"]:
+                return f"Error: Table '{table_name}' does not exist in database '{db_name}'!"
+            columns = catalog["tables"][table_name]["columns"]
+
+            with phase("convert"):
+                rows, error = self.coerce_rows(table_name, columns, rows)
+            if error:
+                return error
+            if not rows:
+                return f"No rows to insert into table '{table_name}'."
+
+            # One log record for the whole batch
+            self.log_mutation(db_name, {"op": "insert", "table": table_name, "rows": rows})
+            return f"{len(rows)} row(s) inserted into table '{table_name}'."
+
+    def coerce_rows(self, table_name, columns, rows):
+        """Validate rows and convert their values to the column types, one column at a time.
+
+        Returns (rows as dicts, None), or (None, error message) for the first invalid row.
+        """
+        names = list(columns)
+        values = []
+        for row in rows:
+            if isinstance(row, dict):
+                missing = next((name for name in names if name not in row), None)
+                if missing is not None:
+                    return None, f"Error: Missing value for column '{missing}'."
+                row = [row[name] for name in names]
+            if len(row) != len(names):
+                return None, f"Error: Mismatch in column count. Table '{table_name}' expects {len(columns)} columns."
+            values.append(row)
+        if not values:
+            return [], None
+
+        # Convert whole columns with map() instead of branching on the type for every value
+        converted = []
+        for name, column_values in zip(names, zip(*values)):
+            column_type = columns[name]
+            if column_type not in CONVERTERS:
+                return None, f"Error: Unsupported column type '{column_type}'."
+            converter = CONVERTERS[column_type]
             try:
-                if column_type == "integer":
-                    row[column_name] = int(value)
-                elif column_type == "float":
-                    row[column_name] = float(value)
-                elif column_type == "boolean":
-                    row[column_name] = value.lower() in ["true", "1"]
-                elif column_type == "string":
-                    row[column_name] = str(value)
-                else:
-                    return f"Error: Unsupported column type '{column_type}'."
-            except ValueError:
-                return f"Error: Invalid value '{value}' for column '{column_name}' (expected {column_type})."
-
-        # Add the row to the table
-        table["rows"].append(row)
-        self.save_database(db_data, db_file)
-        return f"Data inserted successfully into table '{table_name}'."
+                converted.append(list(map(converter, column_values)))
+            except (ValueError, TypeError):
+                for value in column_values:
+                    try:
+                        converter(value)
+                    except (ValueError, TypeError):
+                        return None, f"Error: Invalid value '{value}' for column '{name}' (expected {column_type})."
+        return [dict(zip(names, row_values)) for row_values in zip(*converted)], None
 
     def delete_from_table(self, db_name, table_name, condition=None):
         """Deletes rows from a specified table based on a condition."""
-        db_data, db_file = self.load_database(db_name)
-        if table_name not in db_data["tables"]:
-            return f"Error: Table '{table_name}' does not exist in database '{db_name}'!"
-
-        table = db_data["tables"][table_name]
-        rows = table["rows"]
-        columns = table["columns"]
-
-        if not rows:
-            return f"No data found in table '{table_name}' to delete."
-
-        # If no condition is provided, clear all rows
-        if not condition:
-            table["rows"] = []
-            self.save_database(db_data, db_file)
-            return f"All rows deleted from table '{table_name}'."
-
-        # Parse and apply the condition
-        key, op, value = QueryTables().parse_condition(condition)
-        if key not in columns:
-            return f"Error: Column '{key}' does not exist in table '{table_name}'."
-        col_type = columns[key]
-
-        # Filter rows to keep only those that don't match the condition
-        original_row_count = len(rows)
-        table["rows"] = [
-            row for row in rows
-            if not QueryTables().evaluate_condition(row, key, op, value, col_type)
-        ]
-
-        deleted_row_count = original_row_count - len(table["rows"])
-        self.save_database(db_data, db_file)
-        return f"{deleted_row_count} row(s) deleted from table '{table_name}'."
+        with self.storage.locked(db_name, exclusive=True):
+            if table_name not in self.storage.load_catalog(db_name)["tables"]:
+                return f"Error: Table '{table_name}' does not exist in database '{db_name}'!"
+
+            table = self.storage.load_table(db_name, table_name)
+            rows = table["rows"]
+            columns = table["columns"]
+
+            if not rows:
+                return f"No data found in table '{table_name}' to delete."
+
+            # Parse and compile the condition once
+            predicate = None
+            if condition:
+                predicate, error = self.query_tables.compile_condition(condition, columns, table_name)
+                if error:
+                    return error
+            return self.delete_where(db_name, table_name, predicate)
+
+    def delete_where(self, db_name, table_name, predicate=None):
+        """Delete the rows matching a bound Predicate (every row if None)."""
+        with self.storage.locked(db_name, exclusive=True):
+            if table_name not in self.storage.load_catalog(db_name)["tables"]:
+                return f"Error: Table '{table_name}' does not exist in database '{db_name}'!"
+            with phase("load"):
+                table = self.storage.load_table(db_name, table_name)
+            if not table["rows"]:
+                return f"No data found in table '{table_name}' to delete."
+
+            # If no condition is provided, clear all rows
+            if predicate is None:
+                access_path("scan", "every row (no condition)")
+                count("rows.matched", len(table["rows"]))
+                self.log_mutation(db_name, {"op": "delete", "table": table_name, "positions": None})
+                return f"All rows deleted from table '{table_name}'."
+
+            # Find the positions of the rows that match the condition
+            with phase("filter"):
+                positions = self.query_tables.match_positions(table, predicate)
+
+            if positions:
+                self.log_mutation(db_name, {"op": "delete", "table": table_name, "positions": positions})
+            return f"{len(positions)} row(s) deleted from table '{table_name}'."
 
 
     def update_table(self, db_name, table_name, updates, condition=None):
         """Update rows in a specified table based on a condition."""
-        db_data, db_file = self.load_database(db_name)
-        if table_name not in db_data["tables"]:
-            return f"Error: Table '{table_name}' does not exist in database '{db_name}'!"
-
-        table = db_data["tables"][table_name]
-        rows = table["rows"]
-        columns = table["columns"]
-
-        if not rows:
-            return f"No data found in table '{table_name}' to update."
-
-        # Parse updates
-        updates = [update.strip() for update in updates.split(",")]
-        update_map = {}
-        for update in updates:
-            try:
-                column, value = update.split("=", 1)
-                column = column.strip()
-                value = value.strip()
-                if column not in columns:
-                    return f"Error: Column '{column}' does not exist in table '{table_name}'."
-                col_type = columns[column]
-
-                # Convert the value to the appropriate type
-                if col_type == "integer":
-                    value = int(value)
-                elif col_type == "float":
-                    value = float(value)
-                elif col_type == "boolean":
-                    value = value.lower() in ["true", "1"]
-                elif col_type == "string":
-                    value = str(value)
-                update_map[column] = value
-            except ValueError:
-                return f"Error: Invalid update format '{update}'. Use 'column=value'."
-
-        # Parse and apply the condition
-        if condition:
-            key, op, value = QueryTables().parse_condition(condition)
-            if key not in columns:
-                return f"Error: Column '{key}' does not exist in table '{table_name}'."
-            col_type = columns[key]
-            rows_to_update = [
-                row for row in rows
-                if QueryTables().evaluate_condition(row, key, op, value, col_type)
-            ]
-        else:
-            rows_to_update = rows  # If no condition, update all rows
-
-        # Apply updates
-        updated_count = 0
-        for row in rows_to_update:
-            for column, new_value in update_map.items():
-                row[column] = new_value
-            updated_count += 1
-
-        # Save the updated database
-        self.save_database(db_data, db_file)
-        return f"{updated_count} row(s) updated in table '{table_name}'."
+        with self.storage.locked(db_name, exclusive=True):
+            if table_name not in self.storage.load_catalog(db_name)["tables"]:
+                return f"Error: Table '{table_name}' does not exist in database '{db_name}'!"
+
+            table = self.storage.load_table(db_name, table_name)
+            rows = table["rows"]
+            columns = table["columns"]
+
+            if not rows:
+                return f"No data found in table '{table_name}' to update."
+
+            # Parse updates
+            updates = [update.strip() for update in updates.split(",")]
+            update_map = {}
+            for update in updates:
+                try:
+                    column, value = update.split("=", 1)
+                    column = column.strip()
+                    value = value.strip()
+                    if column not in columns:
+                        return f"Error: Column '{column}' does not exist in table '{table_name}'."
+                    col_type = columns[column]
+                    if col_type not in CONVERTERS:
+                        return f"Error: Unsupported column type '{col_type}'."
+
+                    # Convert the value to the appropriate type
+                    update_map[column] = CONVERTERS[col_type](value)
+                except ValueError:
+                    return f"Error: Invalid update format '{update}'. Use 'column=value'."
+
+            # Parse the condition
+            predicate = None
+            if condition:
+                predicate, error = self.query_tables.compile_condition(condition, columns, table_name)
+                if error:
+                    return error
+            return self.update_where(db_name, table_name, update_map, predicate)
+
+    def update_where(self, db_name, table_name, update_map, predicate=None):
+        """Set columns to values already converted to their types in the rows matching a bound Predicate (every row if None)."""
+        with self.storage.locked(db_name, exclusive=True):
+            if table_name not in self.storage.load_catalog(db_name)["tables"]:
+                return f"Error: Table '{table_name}' does not exist in database '{db_name}'!"
+            with phase("load"):
+                table = self.storage.load_table(db_name, table_name)
+            if not table["rows"]:
+                return f"No data found in table '{table_name}' to update."
+
+            if predicate is not None:
+                with phase("filter"):
+                    positions = self.query_tables.match_positions(table, predicate)
+                updated_count = len(positions)
+            else:
+                positions = None  # If no condition, update all rows
+                updated_count = len(table["rows"])
+                access_path("scan", "every row (no condition)")
+                count("rows.matched", updated_count)
+
+            # Log the updates
+            if updated_count:
+                self.log_mutation(
+                    db_name,
+                    {"op": "update", "table": table_name, "positions": positions, "values": update_map},
+                )
+            return f"{updated_count} row(s) updated in table '{table_name}'."
@@ -0,0 +1,240 @@
+import os
+import json
+import mmap
+import heapq
+import itertools
+import threading
+import multiprocessing
+from operator import itemgetter
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from columnar import ColumnarRows, read_table_file, scan_columns
+from predicates import Predicate
+from aggregates import Aggregator
+
+DEFAULT_MIN_ROWS = 100000  # Below this, sending the chunks to the workers costs more than it saves
+MAPPED_FILES = 4  # Columnar files each worker keeps mapped between scans
+
+mapped_tables = OrderedDict()  # In a worker: rows file path -> ColumnarRows, least recently used first
+
+
+def table_source(table):
+    """Return the source the workers can scan a loaded table from, or None.
+
+    Only columnar tables whose rows file holds all their rows have one: parsing a row
+    table's JSON again in the workers costs more than scanning the rows already loaded.
+    """
+    rows = table["rows"]
+    if not table.get("file") or not isinstance(rows, ColumnarRows):
+        return None
+    return table["file"], "columnar", table["columns"], len(rows)
+
+
+def line_start(data, offset):
+    """Return the offset of the first line starting at or after offset."""
+    if offset <= 0 or offset >= len(data):
+        return max(0, min(offset, len(data)))
+    newline = data.find(b"\n", offset - 1)
+    return len(data) if newline < 0 else newline + 1
+
+
+def mapped_table(path):
+    """Return a columnar rows file mapped in this worker, reusing it for later scans.
+
+    Rows files are never modified in place, so a mapping stays valid for as long as its
+    path is used, and every worker reads the same pages of the OS page cache.
+    """
+    rows = mapped_tables.pop(path, None)
+    if rows is None:
+        rows = read_table_file(path)
+    mapped_tables[path] = rows
+    while len(mapped_tables) > MAPPED_FILES:
+        mapped_tables.popitem(last=False)
+    return rows
+
+
+def read_chunk(source, start, stop):
+    """Return (rows, positions of the chunk's rows in them) for one chunk of a rows file.
+
+    Columnar chunks are row ranges of the mapped file. Row file chunks are byte ranges:
+    a chunk holds the lines starting inside it, so only they are parsed.
+    """
+    path, storage_format = source[0], source[1]
+    if storage_format == "columnar":
+        return mapped_table(path), range(start, stop)
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    with data:
+        lines = data[line_start(data, start):line_start(data, stop)].decode("utf-8").split("\n")
+    rows = [json.loads(line) for line in lines if line.strip()]
+    return rows, range(len(rows))
+
+
+def filter_chunk(source, start, stop, condition):
+    """Return (rows, matching positions, number of rows in the chunk) for one chunk.
+
+    condition is the tree of a bound Predicate (None matches every row), so the worker
+    neither parses it nor converts its values again.
+    """
+    rows, positions = read_chunk(source, start, stop)
+    count = len(positions)
+    if condition:
+        predicate = Predicate.bound(condition)
+        if isinstance(rows, ColumnarRows):
+            positions = scan_columns(rows, predicate.tree, positions)
+        else:
+            matches = predicate.matches
+            positions = [position for position in positions if matches(rows[position])]
+    return rows, positions, count
+
+
+def getter(rows, column):
+    """Return a function reading one column of the row at a position."""
+    if isinstance(rows, ColumnarRows):
+        return rows.column(column).get
+    return lambda position: rows[position][column]
+
+
+def scan_chunk(source, start, stop, condition, order_by=None, descending=False, top=None):
+    """Filter one chunk in a worker; return (number of rows in the chunk, matching positions within it).
+
+    With order_by the positions come sorted as (value, position) pairs, only the first
+    top of them if top is given.
+    """
+    rows, positions, count = filter_chunk(source, start, stop, condition)
+    base = start if isinstance(rows, ColumnarRows) else 0
+    if not order_by:
+        return count, [position - base for position in positions]
+    key = getter(rows, order_by)
+    if top is not None and top < len(positions):
+        select = heapq.nlargest if descending else heapq.nsmallest
+        positions = select(top, positions, key=key)
+    else:
+        positions = sorted(positions, key=key, reverse=descending)
+    return count, [(key(position), position - base) for position in positions]
+
+
+def aggregate_chunk(source, start, stop, condition, items, group_by):
+    """Aggregate the matching rows of one chunk in a worker; return the Aggregator's groups."""
+    rows, positions, _ = filter_chunk(source, start, stop, condition)
+    aggregator = Aggregator(items, group_by)
+    count = len(positions)
+
+    def values(column):
+        if column is None:
+            return itertools.repeat(1, count)  # COUNT(*) counts every row
+        return map(getter(rows, column), positions)
+
+    columns = [column for _, column in aggregator.aggregates]
+    keys = zip(*map(values, group_by)) if group_by else itertools.repeat((), count)
+    aggregator.consume(zip(keys, zip(*map(values, columns)) if columns else itertools.repeat((), count)))
+    return aggregator.groups
+
+
+class ScanPool:
+    """Runs full scans of large tables on several cores with a pool of worker processes.
+
+    The rows file is split into one chunk per worker. Each worker reads its chunk from the
+    file itself (columnar files are memory-mapped, so the workers share the page cache),
+    filters it and sorts or aggregates what matched; only the results come back to be
+    merged. Tables smaller than min_rows, or with changes not yet written to their rows
+    file, are scanned serially as before; so are row tables already loaded in memory.
+    """
+
+    def __init__(self, workers=None, min_rows=DEFAULT_MIN_ROWS):
+        self.workers = workers or os.cpu_count() or 1
+        self.min_rows = min_rows
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def set_workers(self, workers):
+        """Change the number of worker processes; 1 turns parallel scans off."""
+        with self.lock:
+            self.workers = max(1, workers)
+            self.shutdown()
+
+    def set_min_rows(self, min_rows):
+        """Change the table size below which scans stay serial."""
+        self.min_rows = min_rows
+
+    def available(self, source):
+        """Check whether a table is worth scanning in parallel."""
+        return source is not None and self.workers > 1 and source[3] >= max(self.min_rows, self.workers)
+
+    def shutdown(self):
+        """Stop the worker processes; they are started again by the next parallel scan."""
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def chunks(self, source):
+        """Split a table into one (start, stop) range per worker: rows for columnar files, bytes otherwise."""
+        size = source[3] if source[1] == "columnar" else os.path.getsize(source[0])
+        bounds = [size * part // self.workers for part in range(self.workers + 1)]
+        return list(zip(bounds, bounds[1:]))
+
+    def run(self, function, source, *args):
+        """Run function(source, start, stop, *args) for every chunk; return the results in chunk order.
+
+        Returns None if the pool failed, e.g. because the rows file was replaced meanwhile,
+        so the caller can fall back to a serial scan.
+        """
+        with self.lock:
+            if self.executor is None:
+                # Spawned workers do not inherit the parent's threads or cached databases
+                self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            executor = self.executor
+        try:
+            futures = [executor.submit(function, source, start, stop, *args) for start, stop in self.chunks(source)]
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            with self.lock:
+                if self.executor is executor:
+                    self.executor = None
+            return None
+        except OSError:
+            return None
+
+    def offsets(self, results):
+        """Return the position of the first row of every chunk, from the row count each chunk reported."""
+        return itertools.accumulate((count for count, _ in results[:-1]), initial=0)
+
+    def match_positions(self, source, condition):
+        """Return the sorted positions of the rows matching a condition, or None."""
+        results = self.run(scan_chunk, source, condition)
+        if results is None:
+            return None
+        positions = []
+        for offset, (_, matched) in zip(self.offsets(results), results):
+            positions.extend(offset + position for position in matched)
+        return positions
+
+    def sort_positions(self, source, condition, order_by, descending=False, top=None):
+        """Return the positions of the matching rows (all with no condition) ordered by a column, or None.
+
+        Each worker sorts its own chunk and the sorted chunks are merged; ties keep table
+        order, exactly like sorted().
+        """
+        results = self.run(scan_chunk, source, condition, order_by, descending, top)
+        if results is None:
+            return None
+        chunks = [
+            [(value, offset + position) for value, position in pairs]
+            for offset, (_, pairs) in zip(self.offsets(results), results)
+        ]
+        merged = heapq.merge(*chunks, key=itemgetter(0), reverse=descending)
+        return [position for _, position in itertools.islice(merged, top)]
+
+    def aggregate(self, source, condition, items, group_by):
+        """Aggregate the matching rows chunk by chunk; return the merged Aggregator, or None."""
+        results = self.run(aggregate_chunk, source, condition, items, group_by)
+        if results is None:
+            return None
+        aggregator = Aggregator(items, group_by)
+        for groups in results:
+            aggregator.merge(groups)
+        return aggregator
+
+
+scan_pool = ScanPool()
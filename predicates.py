@@ -0,0 +1,225 @@
+import re
+import operator
+from functools import reduce
+
+OPERATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<>": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+  | (?P<op>!=|<>|<=|>=|=|<|>)
+  | (?P<paren>[()])
+  | (?P<param>\?)
+  | (?P<word>[^\s()=!<>'"?]+)
+  | (?P<space>\s+)
+""", re.VERBOSE)
+
+KEYWORDS = {"AND", "OR", "NOT"}
+
+
+def tokenize(text):
+    """Split a condition into (kind, value, start, end) tokens, skipping whitespace."""
+    tokens = []
+    position = 0
+    while position < len(text):
+        match = TOKEN_PATTERN.match(text, position)
+        if not match:
+            raise ValueError(f"Invalid condition: unexpected character '{text[position]}' at position {position}.")
+        kind = match.lastgroup
+        if kind != "space":
+            value = match.group()
+            if kind == "word" and value.upper() in KEYWORDS:
+                kind, value = "keyword", value.upper()
+            tokens.append((kind, value, match.start(), match.end()))
+        position = match.end()
+    return tokens
+
+
+class Parameter:
+    """A '?' placeholder for a value supplied each time a prepared statement runs."""
+
+    def __init__(self, index):
+        self.index = index  # Position among the statement's parameters
+
+    def __repr__(self):
+        return f"Parameter({self.index})"
+
+
+def unquote(text):
+    """Strip the quotes around a string literal."""
+    quote = text[0]
+    return text[1:-1].replace("\\" + quote, quote)
+
+
+class ConditionParser:
+    """Recursive-descent parser producing a condition tree.
+
+    Grammar:
+      condition  := or_expr
+      or_expr    := and_expr ("OR" and_expr)*
+      and_expr   := not_expr ("AND" not_expr)*
+      not_expr   := "NOT" not_expr | "(" or_expr ")" | comparison
+      comparison := column operator literal
+
+    Nodes are tuples: ("compare", column, op, literal), ("and", [nodes]), ("or", [nodes])
+    and ("not", node). An unquoted literal runs until the next AND/OR/")", so
+    'name = John Doe' compares against 'John Doe' as before.
+
+    With first_parameter set, a literal written as a lone '?' becomes a Parameter,
+    numbered from first_parameter in order of appearance.
+    """
+
+    def __init__(self, text, first_parameter=None):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.position = 0
+        self.next_parameter = first_parameter
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError("Invalid condition: condition is empty.")
+        tree = self.parse_or()
+        if self.position < len(self.tokens):
+            raise ValueError(f"Invalid condition: unexpected '{self.tokens[self.position][1]}'.")
+        return tree
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None, len(self.text), len(self.text))
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek()[:2] == ("keyword", "OR"):
+            self.position += 1
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else ("or", children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.peek()[:2] == ("keyword", "AND"):
+            self.position += 1
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else ("and", children)
+
+    def parse_not(self):
+        kind, value, _, _ = self.peek()
+        if (kind, value) == ("keyword", "NOT"):
+            self.position += 1
+            return ("not", self.parse_not())
+        if (kind, value) == ("paren", "("):
+            self.position += 1
+            tree = self.parse_or()
+            if self.peek()[:2] != ("paren", ")"):
+                raise ValueError("Invalid condition: missing closing parenthesis.")
+            self.position += 1
+            return tree
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        kind, column, _, _ = self.peek()
+        if kind != "word":
+            raise ValueError("Invalid condition format. Expected 'column operator value'.")
+        self.position += 1
+
+        kind, op, _, _ = self.peek()
+        if kind != "op":
+            raise ValueError("Invalid condition format. Supported operators: =, !=, <, <=, >, >=")
+        self.position += 1
+
+        # The literal is every token up to the next AND/OR or closing parenthesis
+        first = self.position
+        while self.position < len(self.tokens):
+            kind, value, _, _ = self.tokens[self.position]
+            if kind == "keyword" and value in ("AND", "OR") or (kind, value) == ("paren", ")") or kind == "op":
+                break
+            self.position += 1
+        if self.position == first:
+            raise ValueError(f"Invalid condition: missing value after '{column} {op}'.")
+
+        literal_tokens = self.tokens[first:self.position]
+        if len(literal_tokens) == 1 and literal_tokens[0][0] == "param" and self.next_parameter is not None:
+            literal = Parameter(self.next_parameter)
+            self.next_parameter += 1
+        elif len(literal_tokens) == 1 and literal_tokens[0][0] == "string":
+            literal = unquote(literal_tokens[0][1])
+        else:
+            literal = self.text[literal_tokens[0][2]:literal_tokens[-1][3]]
+        return ("compare", column, OPERATORS[op], literal)
+
+
+def convert_literal(value, col_type):
+    """Convert a literal from a condition to the column's type."""
+    if col_type == "integer":
+        return int(value)
+    elif col_type == "float":
+        return float(value)
+    elif col_type == "boolean":
+        return value if isinstance(value, bool) else str(value).lower() in ["true", "1"]
+    return str(value)
+
+
+class Predicate:
+    """A condition parsed once and compiled into a row-matching function.
+
+    Literals are converted to the column types a single time in bind(), and AND/OR
+    short-circuit, so evaluating a row costs a few function calls and comparisons.
+    """
+
+    def __init__(self, condition, tree=None):
+        self.condition = condition
+        self.tree = ConditionParser(condition).parse() if tree is None else tree
+        self.columns = self.referenced_columns(self.tree)
+        self.matches = None
+
+    @classmethod
+    def bound(cls, tree):
+        """Return a predicate for a tree that bind() already converted, e.g. one sent to a worker process."""
+        predicate = cls(None, tree)
+        predicate.matches = predicate.build(tree)
+        return predicate
+
+    def referenced_columns(self, node):
+        if node[0] == "compare":
+            return [node[1]]
+        if node[0] == "not":
+            return self.referenced_columns(node[1])
+        columns = []
+        for child in node[1]:
+            columns.extend(column for column in self.referenced_columns(child) if column not in columns)
+        return columns
+
+    def bind(self, column_types, parameters=()):
+        """Convert every literal (and '?' parameter) to its column's type and build the matching function."""
+        self.tree = self.convert(self.tree, column_types, parameters)
+        self.matches = self.build(self.tree)
+        return self
+
+    def convert(self, node, column_types, parameters=()):
+        if node[0] == "compare":
+            _, column, op, literal = node
+            if isinstance(literal, Parameter):
+                literal = parameters[literal.index]
+            return ("compare", column, op, convert_literal(literal, column_types[column]))
+        if node[0] == "not":
+            return ("not", self.convert(node[1], column_types, parameters))
+        return (node[0], [self.convert(child, column_types, parameters) for child in node[1]])
+
+    def build(self, node):
+        kind = node[0]
+        if kind == "compare":
+            _, column, op, value = node
+            return lambda row: op(row[column], value)
+        if kind == "not":
+            inner = self.build(node[1])
+            return lambda row: not inner(row)
+
+        parts = [self.build(child) for child in node[1]]
+        if kind == "and":
+            return reduce(lambda left, right: lambda row: left(row) and right(row), parts)
+        return reduce(lambda left, right: lambda row: left(row) or right(row), parts)
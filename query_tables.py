@@ -1,93 +1,552 @@
-import os
-import json
-import operator
+import heapq
+import bisect
+import secrets
+import itertools
+from collections import OrderedDict
+from storage import DatabaseStorage
+from predicates import Predicate, ConditionParser, convert_literal
+from columnar import ColumnarRows, scan_columns
+from aggregates import Aggregator, parse_select_list
+import vectorized
+from parallel import scan_pool, table_source
+from metrics import access_path, count, phase
+
+MAX_OPEN_CURSORS = 32  # Oldest paginated queries are forgotten past this many
+
 
 class QueryTables:
     def __init__(self, db_path="earthdb_data"):
         self.db_path = db_path
-
-    def load_database(self, db_name):
-        """Load the JSON file of the specified database."""
-        db_file = os.path.join(self.db_path, f"{db_name}.json")
-        if not os.path.exists(db_file):
-            raise Exception(f"Error: Database '{db_name}' does not exist!")
-        with open(db_file, "r") as f:
-            return json.load(f)
+        self.storage = DatabaseStorage(db_path)
+        self.cursors = OrderedDict()  # page token -> QueryCursor, least recently used first
 
     def parse_condition(self, condition):
-        """Parse a condition string into components for evaluation."""
-        operators = {
-            "=": operator.eq,
-            "!=": operator.ne,
-            "<": operator.lt,
-            "<=": operator.le,
-            ">": operator.gt,
-            ">=": operator.ge,
-        }
-        for op in operators:
-            if op in condition:
-                left, right = condition.split(op, 1)
-                return left.strip(), operators[op], right.strip()
-        raise ValueError("Invalid condition format. Supported operators: =, !=, <, <=, >, >=")
+        """Parse a single 'column operator value' condition into (column, operator function, value)."""
+        tree = ConditionParser(condition).parse()
+        if tree[0] != "compare":
+            raise ValueError("Invalid condition format. Expected 'column operator value'.")
+        _, column, op, value = tree
+        return column, op, value
+
+    def convert_value(self, value, col_type):
+        """Convert a literal from a condition to the column's type."""
+        return convert_literal(value, col_type)
 
     def evaluate_condition(self, row, key, op, value, col_type):
         """Evaluate a single condition on a row."""
-        # Convert value to the appropriate type
-        if col_type == "integer":
-            value = int(value)
-        elif col_type == "float":
-            value = float(value)
-        elif col_type == "boolean":
-            value = value.lower() in ["true", "1"]
-        elif col_type == "string":
-            value = str(value)
-
-        return op(row[key], value)
+        return op(row[key], self.convert_value(value, col_type))
 
-    def select_from_table(
-        self, db_name, table_name, columns="*", condition=None, order_by=None, sort_order="asc"
-    ):
-        """Query data from a table with support for conditions, sorting, and column selection."""
-        db_data = self.load_database(db_name)
-        if table_name not in db_data["tables"]:
-            return f"Error: Table '{table_name}' does not exist in database '{db_name}'!"
+    def compile_condition(self, condition, all_columns, table_name):
+        """Parse a condition once into a Predicate bound to the table's column types.
+
+        Returns (predicate, None), or (None, error message) if a column does not exist.
+        """
+        predicate = Predicate(condition)
+        for key in predicate.columns:
+            if key not in all_columns:
+                return None, f"Error: Column '{key}' does not exist in table '{table_name}'."
+        return predicate.bind(all_columns), None
+
+    def index_candidates(self, table, node):
+        """Return sorted positions of the rows a condition node can match, or None without a usable index.
 
-        table = db_data["tables"][table_name]
+        The candidates are exact for a single comparison and a superset for AND/OR trees.
+        """
+        kind = node[0]
+        if kind == "compare":
+            index = table["indexes"].get(node[1])
+            if index is None:
+                return None
+            return index.lookup(node[2], node[3], len(table["rows"]))
+        if kind == "and":
+            # Any indexed comparison narrows an AND; use the one matching the fewest rows
+            candidates = [self.index_candidates(table, child) for child in node[1]]
+            candidates = [positions for positions in candidates if positions is not None]
+            return min(candidates, key=len) if candidates else None
+        if kind == "or":
+            # An OR can only use indexes if every branch can
+            candidates = set()
+            for child in node[1]:
+                positions = self.index_candidates(table, child)
+                if positions is None:
+                    return None
+                candidates.update(positions)
+            return sorted(candidates)
+        return None
+
+    def match_positions(self, table, predicate, stop=None):
+        """Return the positions of the rows matching a predicate, using indexes where possible.
+
+        With stop, a row-by-row scan ends once that many rows matched (e.g. for a LIMIT).
+        """
         rows = table["rows"]
-        all_columns = table["columns"]
+        matches = predicate.matches
+        candidates = self.index_candidates(table, predicate.tree)
+        if candidates is not None and predicate.tree[0] == "compare":
+            column = predicate.tree[1]
+            description = f"{table['indexes'][column].kind} index lookup on {column}"
+            return self.scanned("index", description, len(candidates), candidates)
+        if candidates is None and vectorized.available(rows):
+            positions = vectorized.match_positions(table, predicate.tree)
+            if positions is not None:
+                return self.scanned("numpy", "NumPy scan", len(rows), positions)
+        if candidates is None and stop is None and scan_pool.available(table_source(table)):
+            positions = scan_pool.match_positions(table_source(table), predicate.tree)
+            if positions is not None:
+                return self.scanned("parallel", f"parallel scan ({scan_pool.workers} workers)", len(rows), positions)
+        if candidates is not None:
+            kind, description = "index", "index candidates, then filter"
+        else:
+            kind, description = "scan", "full scan"
+        if isinstance(rows, ColumnarRows):
+            positions = scan_columns(rows, predicate.tree, candidates)
+            return self.scanned(kind, description, len(rows) if candidates is None else len(candidates), positions)
+        if candidates is None:
+            positions = (position for position, row in enumerate(rows) if matches(row))
+        else:
+            positions = (position for position in candidates if matches(rows[position]))
+        positions = list(itertools.islice(positions, stop))
 
-        if not rows:
-            return f"No data found in table '{table_name}'."
+        # A scan that reached stop did not look past the last match
+        scanned = len(rows) if candidates is None else len(candidates)
+        if stop is not None and positions and len(positions) == stop:
+            scanned = positions[-1] + 1 if candidates is None else bisect.bisect_right(candidates, positions[-1])
+        return self.scanned(kind, description, scanned, positions)
+
+    def scanned(self, kind, description, scanned, positions):
+        """Record how rows were found and how many were looked at for the metrics; return positions."""
+        access_path(kind, description)
+        count("rows.scanned", scanned)
+        count("rows.matched", len(positions))
+        return positions
+
+    def ordered_scan(self, table, predicate, order_by, descending):
+        """Return matching positions in sort order via an ordered index on the sort column, or None."""
+        index = table["indexes"].get(order_by)
+        if getattr(index, "kind", None) != "ordered":
+            return None
+        tree = predicate.tree
+        comparisons = [tree] if tree[0] == "compare" else (tree[1] if tree[0] == "and" else [])
+        for node in comparisons:
+            if node[0] == "compare" and node[1] == order_by:
+                positions = index.ordered_positions(index.scan(node[2], node[3]), descending)
+                scanned = len(positions)
+                if tree is not node:
+                    rows = table["rows"]
+                    positions = [position for position in positions if predicate.matches(rows[position])]
+                return self.scanned("index", f"ordered index range scan on {order_by}", scanned, positions)
+        return None
+
+    def sorted_positions(self, table, positions, order_by, descending=False, top=None):
+        """Return row positions ordered by a column, reading the order from an ordered index when one exists.
+
+        With top, only the first top positions are needed; they are picked with a bounded
+        heap in O(N log top) instead of sorting every position.
+        """
+        rows = table["rows"]
+        index = table["indexes"].get(order_by)
+        # Walking the index visits every row, so it only pays off when most rows matched
+        if getattr(index, "kind", None) == "ordered" and (positions is None or len(positions) * 4 >= len(rows)):
+            access_path("sort_index", f"ORDER BY {order_by} read from its ordered index")
+            ordered = index.ordered_positions(descending=descending)
+            if positions is None:
+                return ordered
+            matched = set(positions)
+            return [position for position in ordered if position in matched]
+
+        if vectorized.available(rows):
+            ordered = vectorized.sort_positions(table, positions, order_by, descending)
+            if ordered is not None:
+                access_path("sort_numpy", f"ORDER BY {order_by} sorted with NumPy")
+                return ordered if top is None else ordered[:top]
+
+        if positions is None:
+            positions = range(len(rows))
+        if isinstance(rows, ColumnarRows):
+            key = rows.column(order_by).get
+        else:
+            key = lambda position: rows[position][order_by]
+        if top is not None and top < len(positions):
+            # nsmallest/nlargest keep ties in table order, exactly like sorted()
+            select = heapq.nlargest if descending else heapq.nsmallest
+            access_path("sort_heap", f"ORDER BY {order_by} with a heap of the first {top} rows")
+            return select(top, positions, key=key)
+        access_path("sort", f"ORDER BY {order_by} sorted in full")
+        return sorted(positions, key=key, reverse=descending)
+
+    def prepare_query(self, db_name, table_name, columns="*", condition=None, order_by=None):
+        """Validate a query; return (selected columns, bound predicate or None, None) or (None, None, error)."""
+        catalog = self.storage.load_catalog(db_name)
+        if table_name not in catalog["tables"]:
+            return None, None, f"Error: Table '{table_name}' does not exist in database '{db_name}'!"
+        all_columns = catalog["tables"][table_name]["columns"]
 
         # Filter columns if specific columns are requested
         if columns != "*":
             columns = [col.strip() for col in columns.split(",")]
             for col in columns:
                 if col not in all_columns:
-                    return f"Error: Column '{col}' does not exist in table '{table_name}'."
+                    return None, None, f"Error: Column '{col}' does not exist in table '{table_name}'."
         else:
-            columns = all_columns.keys()
+            columns = list(all_columns)
 
-        # Apply condition
+        predicate = None
         if condition:
-            key, op, value = self.parse_condition(condition)
-            if key not in all_columns:
-                return f"Error: Column '{key}' does not exist in table '{table_name}'."
-            col_type = all_columns[key]
-            rows = [row for row in rows if self.evaluate_condition(row, key, op, value, col_type)]
+            predicate, error = self.compile_condition(condition, all_columns, table_name)
+            if error:
+                return None, None, error
+        if order_by and order_by not in all_columns:
+            return None, None, f"Error: Column '{order_by}' does not exist in table '{table_name}'."
+        return columns, predicate, None
+
+    def filter_positions(self, table, predicate, order_by=None, descending=False, stop=None):
+        """Return (matching positions or None for every row, whether they are already in sort order).
+
+        With order_by, stop is the number of sorted positions needed, if not all of them.
+        """
+        if predicate and order_by:
+            # A range scan over the sort column already returns the rows in order
+            positions = self.ordered_scan(table, predicate, order_by, descending)
+            if positions is not None:
+                return positions, True
+        if order_by and self.parallel_sort(table, predicate, order_by):
+            positions = scan_pool.sort_positions(
+                table_source(table), predicate.tree if predicate else None, order_by, descending, stop
+            )
+            if positions is not None:
+                description = f"parallel scan and ORDER BY {order_by} ({scan_pool.workers} workers)"
+                return self.scanned("parallel", description, len(table["rows"]), positions), True
+        if not predicate:
+            rows = len(table["rows"])
+            access_path("scan", "every row (no condition)")
+            count("rows.scanned", rows if order_by or stop is None else min(rows, stop))
+            return None, False
+        return self.match_positions(table, predicate, None if order_by else stop), False
+
+    def parallel_sort(self, table, predicate, order_by):
+        """Check whether filtering and sorting a table in worker processes beats the serial paths.
+
+        Indexes on the condition or the sort column, and NumPy sorting, are cheaper still.
+        """
+        if not scan_pool.available(table_source(table)):
+            return False
+        if getattr(table["indexes"].get(order_by), "kind", None) == "ordered":
+            return False
+        if predicate and self.index_candidates(table, predicate.tree) is not None:
+            return False
+        return not (vectorized.available(table["rows"]) and vectorized.column_array(table, order_by) is not None)
+
+    def project(self, rows, positions, columns):
+        """Return the rows at positions (every row if None) as dicts to print or export."""
+        if isinstance(rows, ColumnarRows):
+            # Only the selected columns of the matching rows are turned into Python values
+            return rows.select(positions, columns)
+        if positions is None:
+            return rows
+        return [rows[position] for position in positions]
+
+    def query_rows(
+        self, db_name, table_name, columns="*", condition=None, order_by=None, sort_order="asc",
+        stream=False, limit=None, offset=0
+    ):
+        """Run a query and return (columns, rows, None), or (None, None, error message).
+
+        With stream=True and no sorting, rows are read one at a time from the table's rows
+        file instead of loading the table, so memory use does not grow with the table.
+        limit and offset select a window of the result; ORDER BY with a limit only keeps
+        the first offset + limit rows in a heap instead of sorting the whole result.
+        """
+        columns, predicate, error = self.prepare_query(db_name, table_name, columns, condition, order_by)
+        if error:
+            return None, None, error
+        return self.select_rows(db_name, table_name, columns, predicate, order_by, sort_order, stream, limit, offset)
+
+    def select_rows(
+        self, db_name, table_name, columns, predicate=None, order_by=None, sort_order="asc",
+        stream=False, limit=None, offset=0
+    ):
+        """Run a query validated by prepare_query (or a prepared statement); return (columns, rows, None)."""
+        stop = None if limit is None else offset + limit
+
+        if stream and not order_by:
+            access_path("stream", "streamed scan of the rows file")
+            rows = self.storage.iter_rows(db_name, table_name)
+            rows = filter(predicate.matches, rows) if predicate else rows
+            return columns, itertools.islice(rows, offset, stop), None
+
+        with phase("load"):
+            table = self.storage.load_table(db_name, table_name)
+        descending = sort_order.lower() == "desc"
+        with phase("filter"):
+            positions, presorted = self.filter_positions(table, predicate, order_by, descending, stop)
 
         # Sort rows
-        if order_by:
-            if order_by not in all_columns:
-                return f"Error: Column '{order_by}' does not exist in table '{table_name}'."
-            rows = sorted(
-                rows,
-                key=lambda row: row[order_by],
-                reverse=(sort_order.lower() == "desc"),
+        if order_by and not presorted:
+            with phase("sort"):
+                positions = self.sorted_positions(table, positions, order_by, descending, stop)
+
+        if offset or limit is not None:
+            positions = (range(len(table["rows"])) if positions is None else positions)[offset:stop]
+        with phase("project"):
+            rows = self.project(table["rows"], positions, columns)
+        count("rows.returned", len(rows))
+        return columns, rows, None
+
+    def open_cursor(
+        self, db_name, table_name, columns="*", condition=None, order_by=None, sort_order="asc",
+        page_size=50, offset=0
+    ):
+        """Start a paginated query; return (page token, None) or (None, error message)."""
+        columns, predicate, error = self.prepare_query(db_name, table_name, columns, condition, order_by)
+        if error:
+            return None, error
+        cursor = QueryCursor(self, db_name, table_name, columns, condition, order_by, sort_order, page_size)
+        cursor.offset = offset
+        token = secrets.token_hex(8)
+        self.cursors[token] = cursor
+        while len(self.cursors) > MAX_OPEN_CURSORS:
+            self.cursors.popitem(last=False)
+        return token, None
+
+    def fetch_page(self, token):
+        """Return (columns, rows of the next page, error) of an open cursor; rows is empty at the end."""
+        cursor = self.cursors.get(token)
+        if cursor is None:
+            return None, None, "Error: Unknown or expired page token."
+        self.cursors.move_to_end(token)
+        columns, rows, error = cursor.fetch()
+        if error or cursor.exhausted:
+            self.cursors.pop(token, None)
+        return columns, rows, error
+
+    def fetch_window(self, token, offset, count):
+        """Return (columns, rows offset .. offset + count, error) of an open cursor.
+
+        Unlike fetch_page this does not move the cursor or close it at the end, so a view
+        can fetch any part of the result in any order.
+        """
+        cursor = self.cursors.get(token)
+        if cursor is None:
+            return None, None, "Error: Unknown or expired page token."
+        self.cursors.move_to_end(token)
+        error = cursor.refresh()
+        if error:
+            self.cursors.pop(token, None)
+            return None, None, error
+        return cursor.columns, cursor.window(offset, count), None
+
+    def count_matches(self, token):
+        """Return (number of rows an open cursor's query matches, error) without building any row."""
+        cursor = self.cursors.get(token)
+        if cursor is None:
+            return None, "Error: Unknown or expired page token."
+        error = cursor.refresh()
+        if error:
+            self.cursors.pop(token, None)
+            return None, error
+        return len(cursor.matched), None
+
+    def close_cursor(self, token):
+        """Forget an open cursor."""
+        self.cursors.pop(token, None)
+
+    def format_rows(self, columns, rows):
+        """Format rows as the comma-separated text the CLI prints."""
+        with phase("format"):
+            output = [", ".join(columns)]
+            for row in rows:
+                output.append(", ".join(str(row[col]) for col in columns))
+            return "\n".join(output)
+
+    def select_from_table(
+        self, db_name, table_name, columns="*", condition=None, order_by=None, sort_order="asc",
+        limit=None, offset=0
+    ):
+        """Query data from a table with support for conditions, sorting, column selection and LIMIT/OFFSET."""
+        if table_name not in self.storage.load_catalog(db_name)["tables"]:
+            return f"Error: Table '{table_name}' does not exist in database '{db_name}'!"
+
+        if not self.storage.load_table(db_name, table_name)["rows"]:
+            return f"No data found in table '{table_name}'."
+
+        columns, rows, error = self.query_rows(
+            db_name, table_name, columns, condition, order_by, sort_order, limit=limit, offset=offset
+        )
+        if error:
+            return error
+        return self.format_rows(columns, rows)
+
+    def aggregate_rows(self, db_name, table_name, select_list, condition=None, group_by=None):
+        """Compute COUNT/SUM/AVG/MIN/MAX over the matching rows in one pass.
+
+        select_list is e.g. 'name, COUNT(*), AVG(age)' and group_by a comma-separated list
+        of columns. Returns (labels, one tuple per group, None) or (None, None, error).
+        """
+        catalog = self.storage.load_catalog(db_name)
+        if table_name not in catalog["tables"]:
+            return None, None, f"Error: Table '{table_name}' does not exist in database '{db_name}'!"
+        entry = catalog["tables"][table_name]
+        column_types = entry["columns"]
+
+        group_by = [column.strip() for column in group_by.split(",")] if group_by else []
+        for column in group_by:
+            if column not in column_types:
+                return None, None, f"Error: Column '{column}' does not exist in table '{table_name}'."
+        try:
+            items = parse_select_list(select_list, column_types, group_by)
+        except ValueError as e:
+            return None, None, f"Error: {e}"
+        labels = [label for label, _, _ in items]
+
+        predicate = None
+        if condition:
+            predicate, error = self.compile_condition(condition, column_types, table_name)
+            if error:
+                return None, None, error
+        results = self.aggregate_items(db_name, table_name, items, predicate, group_by)
+        count("rows.returned", len(results))
+        return labels, results, None
+
+    def aggregate_items(self, db_name, table_name, items, predicate=None, group_by=()):
+        """Compute parsed aggregate items over the rows matching a bound predicate; return one tuple per group."""
+        entry = self.storage.load_catalog(db_name)["tables"][table_name]
+
+        # COUNT(*) alone needs no values: the catalog knows the table size, and a condition
+        # only needs the matching positions (from an index where there is one)
+        if not group_by and all(function == "COUNT" and column is None for _, function, column in items):
+            if predicate:
+                with phase("load"):
+                    table = self.storage.load_table(db_name, table_name)
+                with phase("filter"):
+                    matched = len(self.match_positions(table, predicate))
+            else:
+                access_path("metadata", "row count from the catalog")
+                matched = self.storage.count_rows(db_name, table_name)
+            return [tuple(matched for _ in items)]
+
+        # Large tables are aggregated chunk by chunk in worker processes, unless an index
+        # on the condition can narrow the rows down first or a row table is already loaded
+        source = self.storage.table_source(db_name, table_name)
+        indexed = predicate and any(column in entry.get("indexes", {}) for column in predicate.columns)
+        loaded = entry.get("format") != "columnar" and table_name in self.storage.load_state(db_name)["tables"]
+        if scan_pool.available(source) and not indexed and not loaded:
+            with phase("aggregate"):
+                aggregator = scan_pool.aggregate(source, predicate.tree if predicate else None, items, group_by)
+            if aggregator is not None:
+                access_path("parallel", f"parallel scan and aggregate ({scan_pool.workers} workers)")
+                count("rows.scanned", source[3])
+                return aggregator.results()
+
+        aggregator = Aggregator(items, group_by)
+        columns = [column for _, column in aggregator.aggregates]
+        if entry.get("format") == "columnar":
+            records = self.columnar_records(db_name, table_name, predicate, group_by, columns)
+        else:
+            access_path("scan", "full scan" + (" (loaded rows)" if loaded else " of the rows file"))
+            count("rows.scanned", self.storage.count_rows(db_name, table_name))
+            rows = self.storage.iter_rows(db_name, table_name)
+            if predicate:
+                rows = filter(predicate.matches, rows)
+            records = (
+                (tuple(row[column] for column in group_by), tuple(1 if column is None else row[column] for column in columns))
+                for row in rows
             )
+        with phase("aggregate"):
+            aggregator.consume(records)
+        return aggregator.results()
+
+    def columnar_records(self, db_name, table_name, predicate, group_by, columns):
+        """Yield (group key, values) for matching rows of a columnar table, reading only the needed columns."""
+        with phase("load"):
+            table = self.storage.load_table(db_name, table_name)
+        rows = table["rows"]
+        with phase("filter"):
+            positions, _ = self.filter_positions(table, predicate)
+        matched = len(rows) if positions is None else len(positions)
+
+        def values(column):
+            if column is None:
+                return itertools.repeat(1, matched)  # COUNT(*) counts every row
+            if positions is None:
+                return rows.column_values(column)
+            return map(rows.column(column).get, positions)
+
+        keys = zip(*map(values, group_by)) if group_by else itertools.repeat((), matched)
+        return zip(keys, zip(*map(values, columns)) if columns else itertools.repeat((), matched))
 
-        # Format output
-        output = [", ".join(columns)]
-        for row in rows:
-            output.append(", ".join(str(row[col]) for col in columns))
+    def aggregate(self, db_name, table_name, select_list, condition=None, group_by=None):
+        """Run an aggregate query and format its result like select_from_table."""
+        labels, results, error = self.aggregate_rows(db_name, table_name, select_list, condition, group_by)
+        if error:
+            return error
+        output = [", ".join(labels)]
+        output.extend(", ".join(str(value) for value in result) for result in results)
         return "\n".join(output)
+
+
+class QueryCursor:
+    """Pages through the result of a query without running it again for every page.
+
+    The matching positions are found once, and sorted only as far as the pages fetched so
+    far need: the first page uses a bounded heap, later pages sort the rest once. If the
+    database changes between pages, the query runs again and continues at the same offset.
+    """
+
+    def __init__(self, query_tables, db_name, table_name, columns, condition, order_by, sort_order, page_size):
+        self.query_tables = query_tables
+        self.storage = query_tables.storage
+        self.db_name = db_name
+        self.table_name = table_name
+        self.columns = columns
+        self.condition = condition
+        self.order_by = order_by
+        self.descending = sort_order.lower() == "desc"
+        self.page_size = page_size
+        self.offset = 0
+        self.version = None  # Version of the database when the positions were computed
+        self.exhausted = False
+
+    def run(self):
+        """Evaluate the query's condition against the current table."""
+        query_tables = self.query_tables
+        columns, predicate, error = query_tables.prepare_query(
+            self.db_name, self.table_name, ",".join(self.columns), self.condition, self.order_by
+        )
+        if error:
+            return error
+        self.version = self.storage.version(self.db_name)
+        self.table = self.storage.load_table(self.db_name, self.table_name)
+        self.matched, presorted = query_tables.filter_positions(
+            self.table, predicate, self.order_by, self.descending
+        )
+        if self.matched is None:
+            self.matched = range(len(self.table["rows"]))
+        self.ordered = self.matched if presorted or not self.order_by else []  # Positions in result order
+        return None
+
+    def refresh(self):
+        """Run the query again if the database changed since it last ran; return an error or None."""
+        if self.version != self.storage.version(self.db_name):
+            return self.run()
+        return None
+
+    def window(self, offset, count):
+        """Return the rows at offset .. offset + count of the result."""
+        stop = offset + count
+        if len(self.ordered) < min(stop, len(self.matched)):
+            # The first page only needs the top rows; any later page sorts everything once
+            top = None if self.ordered else stop
+            self.ordered = self.query_tables.sorted_positions(
+                self.table, self.matched, self.order_by, self.descending, top
+            )
+        return self.query_tables.project(self.table["rows"], self.ordered[offset:stop], self.columns)
+
+    def fetch(self):
+        """Return (columns, rows of the next page, error)."""
+        error = self.refresh()
+        if error:
+            return None, None, error
+        rows = self.window(self.offset, self.page_size)
+        self.offset += len(rows)
+        self.exhausted = self.offset >= len(self.matched)
+        return self.columns, rows, None
@@ -0,0 +1,223 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from main import CommandSession
+from client import DEFAULT_HOST, DEFAULT_PORT
+from metrics import metrics
+
+DEFAULT_WORKERS = 8  # Threads running commands; reads share them, writes take turns
+MAX_REQUEST_BYTES = 64 * 1024 * 1024  # Longest request line accepted, e.g. a large batch INSERT
+
+# Commands that never change a database; every other command is run as a write. USE
+# DATABASE is a write, since opening a database in the old single-file format migrates it
+READ_COMMANDS = (
+    "SELECT", "LIST", "NEXT", "EXIT DATABASE", "EXPORT", "HELP", "BEGIN", "ROLLBACK",
+    "EXPLAIN", "METRICS",
+)
+
+
+def is_read(command):
+    """Check whether a command only reads, so it can run alongside other reads."""
+    command = command.strip()
+    if command.upper().startswith("PROFILE "):
+        command = command[len("PROFILE "):].strip()  # As read-only as the profiled command
+    return command.upper().startswith(READ_COMMANDS) or command.lower() == "exit"
+
+
+class ReadWriteLock:
+    """Lets any number of readers in at once, or a single writer.
+
+    A waiting writer keeps new readers out, so a steady stream of reads cannot starve it.
+    """
+
+    def __init__(self):
+        self.readers = 0
+        self.writer_active = False
+        self.waiting_writers = 0
+        self.condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def reading(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: not self.writer_active and not self.waiting_writers)
+            self.readers += 1
+        try:
+            yield
+        finally:
+            async with self.condition:
+                self.readers -= 1
+                self.condition.notify_all()
+
+    @asynccontextmanager
+    async def writing(self):
+        async with self.condition:
+            self.waiting_writers += 1
+            await self.condition.wait_for(lambda: not self.writer_active and not self.readers)
+            self.waiting_writers -= 1
+            self.writer_active = True
+        try:
+            yield
+        finally:
+            async with self.condition:
+                self.writer_active = False
+                self.condition.notify_all()
+
+
+class EarthDBServer:
+    """Serves the CLI command set over TCP or a Unix socket, keeping databases loaded in memory.
+
+    The protocol is one JSON object per line. A request is
+      {"id": 1, "command": "SELECT FROM users", "inputs": ["*", "age > 20", ""], "database": "test"}
+    where inputs answer the command's prompts in order and database (optional) selects
+    a database first. The response is {"id": 1, "ok": true, "output": "<printed text>"}.
+
+    A request can instead carry a statement with '?' placeholders and their values:
+      {"id": 2, "statement": "SELECT name FROM users WHERE id = ?", "parameters": [42], "database": "test"}
+    answered with {"id": 2, "ok": true, "columns": ["name"], "rows": [["John"]]} for a SELECT,
+    or with "output" as above. Statements are prepared once for the whole server.
+
+    Each connection has its own session (selected database, open pages). Requests on one
+    connection are answered in order, so a client can pipeline them; different
+    connections run in parallel, reads alongside each other and writes one at a time.
+
+    Reads of different databases run fully in parallel. Reads of one database take turns
+    only while its tables are loaded into memory (or its log replayed), and then filter,
+    sort and format the loaded rows side by side (one thread at a time for Python code,
+    as usual).
+    """
+
+    def __init__(self, db_path="earthdb_data", workers=DEFAULT_WORKERS):
+        self.db_path = db_path
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="earthdb")
+        self.lock = None  # Created on the server's event loop
+        self.server = None
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+        """Start listening on a Unix socket if socket_path is given, otherwise on host:port."""
+        self.lock = ReadWriteLock()
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)  # Left behind by a server that did not shut down cleanly
+            self.server = await asyncio.start_unix_server(self.handle, path=socket_path, limit=MAX_REQUEST_BYTES)
+        else:
+            self.server = await asyncio.start_server(self.handle, host, port, limit=MAX_REQUEST_BYTES)
+        return self.server
+
+    async def serve_forever(self, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+        server = await self.start(host, port, socket_path)
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader, writer):
+        """Answer the requests of one connection until it closes or sends EXIT."""
+        session = CommandSession(db_path=self.db_path)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    writer.write(self.encode({"ok": False, "output": "Error: Request too large."}))
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                response, keep_open = await self.respond(session, line)
+                writer.write(self.encode(response))
+                await writer.drain()
+                if not keep_open:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, session, line):
+        """Run one request line; return (response, whether the connection stays open)."""
+        try:
+            request = json.loads(line)
+            if "statement" in request:
+                command = request["statement"]
+                arguments = list(request.get("parameters", ()))
+                if not isinstance(command, str):
+                    raise TypeError
+            else:
+                command = request["command"]
+                arguments = [str(answer) for answer in request.get("inputs", ())]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return {"ok": False, "output": "Error: Invalid request. Send one JSON object per line with a 'command' or 'statement'."}, True
+
+        started = time.perf_counter()
+        try:
+            return await self.run_request(session, request, command, arguments)
+        finally:
+            # Includes the wait for the lock, unlike the command and statement latencies
+            metrics.observe("server.request", time.perf_counter() - started)
+
+    async def run_request(self, session, request, command, arguments):
+        """Run a request's command (with its inputs) or statement (with its parameters) under the read or write lock."""
+        lock = self.lock.reading() if is_read(command) else self.lock.writing()
+        async with lock:
+            loop = asyncio.get_running_loop()
+            if "statement" in request:
+                response = await loop.run_in_executor(
+                    self.executor, self.run_statement, session, command, arguments, request.get("database")
+                )
+                return dict(response, id=request.get("id")), True
+            ok, output, keep_open = await loop.run_in_executor(
+                self.executor, self.execute, session, command, arguments, request.get("database")
+            )
+        return {"id": request.get("id"), "ok": ok, "output": output}, keep_open
+
+    def execute(self, session, command, inputs, database):
+        """Run a command in a worker thread; return (ok, printed output, keep the connection open)."""
+        if database is not None:
+            session.selected_db = database
+        try:
+            output, keep_open = session.run_scripted(command, inputs)
+        except EOFError as e:
+            return False, f"Error: Incomplete request, {e}.", True
+        except Exception as e:
+            return False, str(e) if str(e).startswith("Error:") else f"Error: {e}", True
+        return True, output, keep_open
+
+    def run_statement(self, session, statement, parameters, database):
+        """Run a parsed statement in a worker thread; return the response without its id."""
+        if database is not None:
+            session.selected_db = database
+        try:
+            columns, rows, message = session.run_statement(statement, parameters)
+        except Exception as e:
+            return {"ok": False, "output": str(e) if str(e).startswith("Error:") else f"Error: {e}"}
+        if columns is None:
+            return {"ok": not message.startswith("Error"), "output": message}
+        return {"ok": True, "columns": columns, "rows": [[row[column] for column in columns] for row in rows]}
+
+    def encode(self, response):
+        return (json.dumps(response) + "\n").encode("utf-8")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="main.py serve", description="Serve EarthDB commands to local clients.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--socket", help="listen on this Unix socket path instead of TCP")
+    parser.add_argument("--data", default="earthdb_data", help="data directory (default: earthdb_data)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="threads running commands")
+    args = parser.parse_args(argv)
+
+    server = EarthDBServer(args.data, args.workers)
+    print(f"EarthDB server listening on {args.socket or f'{args.host}:{args.port}'} (Ctrl+C to stop).")
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        print("EarthDB server stopped.")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,656 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+from predicates import ConditionParser, Parameter, Predicate, convert_literal, unquote
+from aggregates import AGGREGATE_PATTERN, parse_select_list
+from query_tables import QueryTables
+from joins import HashJoin, JoinSide, plan_join
+from operation_tables import TableOperations
+from metrics import metrics, count, phase
+
+MAX_PREPARED_STATEMENTS = 256  # Least recently used statements are parsed again past this many
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+  | (?P<op>!=|<>|<=|>=|=|<|>)
+  | (?P<punct>[(),*;?])
+  | (?P<word>[^\s(),*;?=!<>'"]+)
+  | (?P<space>\s+)
+""", re.VERBOSE)
+
+NAME_PATTERN = re.compile(r"\w+")
+COLUMN_PATTERN = re.compile(r"\w+(?:\.\w+)?")  # A column, optionally qualified by its table: 'o.amount'
+
+# Words that end a table name in FROM and JOIN rather than give it an alias
+TABLE_FOLLOWERS = {"WHERE", "GROUP", "ORDER", "LIMIT", "OFFSET", "JOIN", "INNER", "LEFT", "ON"}
+
+# Statements the CLI runs on one line; the same commands without these clauses prompt
+SINGLE_LINE_PATTERN = re.compile(
+    r"SELECT\s+(?!FROM\b)\S|INSERT\s+INTO\s+\w+\s*(?:\(|VALUES\b)|UPDATE\s+\w+\s+SET\b|DELETE\s+FROM\s+\w+\s+WHERE\b",
+    re.IGNORECASE,
+)
+
+
+def is_statement(text):
+    """Check whether text starts with one of the keywords of a parsed statement."""
+    return text.lstrip()[:6].upper() in ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+
+def is_single_line(command):
+    """Check whether a CLI command is a complete single-line SELECT/INSERT/UPDATE/DELETE."""
+    return SINGLE_LINE_PATTERN.match(command.strip()) is not None
+
+
+def tokenize(text):
+    """Split a statement into (kind, value, start, end) tokens, skipping whitespace."""
+    tokens = []
+    position = 0
+    while position < len(text):
+        match = TOKEN_PATTERN.match(text, position)
+        if not match:
+            raise ValueError(f"Invalid statement: unterminated string at position {position}.")
+        if match.lastgroup != "space":
+            tokens.append((match.lastgroup, match.group(), match.start(), match.end()))
+        position = match.end()
+    return tokens
+
+
+class Select:
+    def __init__(self, table, items, condition, group_by, order_by, descending, limit, offset, alias=None, join=None):
+        self.table = table
+        self.alias = alias
+        self.join = join  # Join or None
+        self.items = items  # Selected columns and aggregates as written, ['*'] for every column
+        self.condition = condition  # (text, tree) or None
+        self.group_by = group_by
+        self.order_by = order_by
+        self.descending = descending
+        self.limit = limit  # int, Parameter or None
+        self.offset = offset
+        self.aggregate = bool(group_by) or any(AGGREGATE_PATTERN.fullmatch(item) for item in items)
+
+
+class Join:
+    def __init__(self, table, alias, kind, left_column, right_column):
+        self.table = table
+        self.alias = alias
+        self.kind = kind  # "inner" or "left"
+        self.left_column = left_column  # The columns compared by ON, as written
+        self.right_column = right_column
+
+
+class Insert:
+    def __init__(self, table, columns, rows):
+        self.table = table
+        self.columns = columns  # Column names given before VALUES, or None for every column in order
+        self.rows = rows  # Lists of values: strings or Parameters
+
+
+class Update:
+    def __init__(self, table, assignments, condition):
+        self.table = table
+        self.assignments = assignments  # (column, value string or Parameter) pairs
+        self.condition = condition
+
+
+class Delete:
+    def __init__(self, table, condition):
+        self.table = table
+        self.condition = condition
+
+
+class StatementParser:
+    """Recursive-descent parser turning a statement into a Select, Insert, Update or Delete.
+
+    Grammar (keywords in any case, '?' wherever a value may go):
+      SELECT [* | item, ...] FROM table [[AS] alias]
+             [[INNER | LEFT [OUTER]] JOIN table [[AS] alias] ON column = column]
+             [WHERE condition] [GROUP BY column, ...]
+             [ORDER BY column|aggregate [ASC|DESC]] [LIMIT n] [OFFSET n]
+      INSERT INTO table [(column, ...)] VALUES (value, ...), ...   (or one row without parentheses)
+      UPDATE table SET column = value, ... [WHERE condition]
+      DELETE FROM table [WHERE condition]
+    Conditions are parsed by predicates.ConditionParser. Unquoted values run up to the
+    next ',' or ')', like the values typed at the CLI's prompts. Columns may be qualified
+    by their table or its alias ('o.amount'), which a JOIN needs for names both tables have.
+    """
+
+    CLAUSES = {"GROUP": "BY", "ORDER": "BY", "LIMIT": None, "OFFSET": None}
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = tokenize(text)
+        if self.tokens and self.tokens[-1][:2] == ("punct", ";"):
+            self.tokens.pop()
+        self.position = 0
+        self.parameter_count = 0
+
+    def parse(self):
+        keyword = self.keyword()
+        parse = {"SELECT": self.parse_select, "INSERT": self.parse_insert,
+                 "UPDATE": self.parse_update, "DELETE": self.parse_delete}.get(keyword)
+        if parse is None:
+            raise ValueError("Invalid statement: expected SELECT, INSERT, UPDATE or DELETE.")
+        self.position += 1
+        statement = parse()
+        if self.position < len(self.tokens):
+            raise ValueError(f"Invalid statement: unexpected '{self.tokens[self.position][1]}'.")
+        return statement
+
+    def peek(self, offset=0):
+        position = self.position + offset
+        return self.tokens[position] if position < len(self.tokens) else (None, None, len(self.text), len(self.text))
+
+    def keyword(self, offset=0):
+        kind, value, _, _ = self.peek(offset)
+        return value.upper() if kind == "word" else None
+
+    def accept(self, *keywords):
+        """Consume the keywords if they come next; return whether they did."""
+        if all(self.keyword(i) == keyword for i, keyword in enumerate(keywords)):
+            self.position += len(keywords)
+            return True
+        return False
+
+    def expect(self, *keywords):
+        if not self.accept(*keywords):
+            found = self.peek()[1]
+            raise ValueError(f"Invalid statement: expected {' '.join(keywords)}" + (f", found '{found}'." if found else "."))
+
+    def expect_punct(self, value):
+        if self.peek()[:2] != ("punct", value):
+            raise ValueError(f"Invalid statement: expected '{value}'.")
+        self.position += 1
+
+    def name(self, what="table"):
+        kind, value, _, _ = self.peek()
+        pattern = COLUMN_PATTERN if what == "column" else NAME_PATTERN
+        if kind != "word" or not pattern.fullmatch(value):
+            raise ValueError(f"Invalid statement: expected a {what} name.")
+        self.position += 1
+        return value
+
+    def names(self, what="column"):
+        names = [self.name(what)]
+        while self.peek()[:2] == ("punct", ","):
+            self.position += 1
+            names.append(self.name(what))
+        return names
+
+    def parameter(self):
+        parameter = Parameter(self.parameter_count)
+        self.parameter_count += 1
+        return parameter
+
+    def item(self):
+        """Parse a selected column or an aggregate like COUNT(*); return it as written."""
+        name = self.name("column")
+        if self.peek()[:2] != ("punct", "("):
+            return name
+        self.position += 1
+        kind, argument, _, _ = self.peek()
+        if kind == "punct" and argument == "*" or kind == "word":
+            self.position += 1
+        else:
+            raise ValueError(f"Invalid statement: expected a column or * in {name}().")
+        self.expect_punct(")")
+        return f"{name}({argument})"
+
+    def parse_select(self):
+        items = ["*"]
+        if self.peek()[:2] == ("punct", "*"):
+            self.position += 1
+        elif self.keyword() != "FROM":
+            items = [self.item()]
+            while self.peek()[:2] == ("punct", ","):
+                self.position += 1
+                items.append(self.item())
+        self.expect("FROM")
+        table = self.name()
+        alias = self.alias()
+        join = self.parse_join()
+        condition = self.parse_where()
+
+        group_by = []
+        if self.accept("GROUP", "BY"):
+            group_by = self.names()
+        order_by, descending = None, False
+        if self.accept("ORDER", "BY"):
+            order_by = self.item()
+            if self.keyword() in ("ASC", "DESC"):
+                descending = self.keyword() == "DESC"
+                self.position += 1
+        limit = self.count() if self.accept("LIMIT") else None
+        offset = self.count() if self.accept("OFFSET") else 0
+        return Select(table, items, condition, group_by, order_by, descending, limit, offset, alias, join)
+
+    def alias(self):
+        """Parse the optional alias after a table name; return it or None."""
+        if self.accept("AS"):
+            return self.name("alias")
+        kind, value, _, _ = self.peek()
+        if kind == "word" and value.upper() not in TABLE_FOLLOWERS and NAME_PATTERN.fullmatch(value):
+            self.position += 1
+            return value
+        return None
+
+    def parse_join(self):
+        """Parse an optional JOIN clause; return a Join or None."""
+        if self.accept("JOIN") or self.accept("INNER", "JOIN"):
+            kind = "inner"
+        elif self.accept("LEFT", "JOIN") or self.accept("LEFT", "OUTER", "JOIN"):
+            kind = "left"
+        else:
+            return None
+        table = self.name()
+        alias = self.alias()
+        self.expect("ON")
+        left = self.name("column")
+        if self.peek()[:2] != ("op", "="):
+            raise ValueError("Invalid statement: JOIN ... ON takes one equality, e.g. ON o.customer_id = c.id.")
+        self.position += 1
+        right = self.name("column")
+        if self.keyword() in ("AND", "OR"):
+            raise ValueError("Invalid statement: JOIN ... ON takes one equality; put other conditions in WHERE.")
+        return Join(table, alias, kind, left, right)
+
+    def count(self):
+        kind, value, _, _ = self.peek()
+        self.position += 1
+        if (kind, value) == ("punct", "?"):
+            return self.parameter()
+        if kind == "word" and value.isdigit():
+            return int(value)
+        raise ValueError("Invalid statement: LIMIT and OFFSET take a whole number.")
+
+    def parse_where(self):
+        """Parse an optional WHERE clause; return (text, tree) or None."""
+        if not self.accept("WHERE"):
+            return None
+        first = self.position
+        depth = 0
+        while self.position < len(self.tokens):
+            kind, value, _, _ = self.peek()
+            if kind == "punct":
+                depth += {"(": 1, ")": -1}.get(value, 0)
+            elif depth == 0 and kind == "word" and value.upper() in self.CLAUSES:
+                follower = self.CLAUSES[value.upper()]
+                next_kind, next_value, _, _ = self.peek(1)
+                if follower and (next_value or "").upper() == follower or (
+                    not follower and (next_value == "?" or (next_kind == "word" and next_value.isdigit()))
+                ):
+                    break
+            self.position += 1
+        if self.position == first:
+            raise ValueError("Invalid statement: missing condition after WHERE.")
+        text = self.text[self.tokens[first][2]:self.tokens[self.position - 1][3]]
+        parser = ConditionParser(text, first_parameter=self.parameter_count)
+        tree = parser.parse()
+        self.parameter_count = parser.next_parameter
+        return text, tree
+
+    def value(self, ends):
+        """Parse one value up to a token in ends (at the same parenthesis depth) or the end."""
+        first = self.position
+        depth = 0
+        while self.position < len(self.tokens):
+            kind, value, _, _ = self.peek()
+            if depth == 0 and ((kind == "punct" and value in ends) or (kind == "word" and value.upper() in ends)):
+                break
+            if kind == "punct" and value in "()":
+                depth += 1 if value == "(" else -1
+            self.position += 1
+        tokens = self.tokens[first:self.position]
+        if not tokens:
+            raise ValueError("Invalid statement: missing value.")
+        if len(tokens) == 1 and tokens[0][:2] == ("punct", "?"):
+            return self.parameter()
+        if len(tokens) == 1 and tokens[0][0] == "string":
+            return unquote(tokens[0][1])
+        return self.text[tokens[0][2]:tokens[-1][3]]
+
+    def row(self, ends):
+        values = [self.value(ends)]
+        while self.peek()[:2] == ("punct", ","):
+            self.position += 1
+            values.append(self.value(ends))
+        return values
+
+    def parse_insert(self):
+        self.expect("INTO")
+        table = self.name()
+        columns = None
+        if self.peek()[:2] == ("punct", "("):
+            self.position += 1
+            columns = self.names()
+            self.expect_punct(")")
+        self.expect("VALUES")
+        if self.peek()[:2] != ("punct", "("):
+            return Insert(table, columns, [self.row((",",))])
+        rows = []
+        while True:
+            self.expect_punct("(")
+            rows.append(self.row((",", ")")))
+            self.expect_punct(")")
+            if self.peek()[:2] != ("punct", ","):
+                return Insert(table, columns, rows)
+            self.position += 1
+
+    def parse_update(self):
+        table = self.name()
+        self.expect("SET")
+        assignments = []
+        while True:
+            column = self.name("column")
+            if self.peek()[:2] != ("op", "="):
+                raise ValueError(f"Invalid statement: expected '=' after '{column}'.")
+            self.position += 1
+            assignments.append((column, self.value((",", "WHERE"))))
+            if self.peek()[:2] != ("punct", ","):
+                break
+            self.position += 1
+        return Update(table, assignments, self.parse_where())
+
+    def parse_delete(self):
+        self.expect("FROM")
+        return Delete(self.name(), self.parse_where())
+
+
+class PreparedStatement:
+    """A statement parsed once, and validated once per database and table schema.
+
+    Each run only fills in the '?' parameters: with none, the compiled condition itself
+    is reused as well.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        parser = StatementParser(text)
+        self.statement = parser.parse()
+        self.parameter_count = parser.parameter_count
+        self.plans = {}  # Database directory -> (column types the plan was validated against, plan)
+
+    def plan(self, storage, db_name):
+        """Return (plan, None) for running the statement in a database, or (None, error)."""
+        statement = self.statement
+        catalog = storage.load_catalog(db_name)
+        join = getattr(statement, "join", None)
+        schemas = []
+        for table in [statement.table] + ([join.table] if join else []):
+            entry = catalog["tables"].get(table)
+            if entry is None:
+                return None, f"Error: Table '{table}' does not exist in database '{db_name}'!"
+            schemas.append(entry["columns"])
+        key = storage.cache_key(db_name)
+        cached = self.plans.get(key)
+        # A schema change replaces the columns dict, so the plan is validated again
+        if cached is not None and all(old is new for old, new in zip(cached[0], schemas)):
+            return cached[1], None
+        with phase("plan"):
+            plan, error = self.validate(*schemas)
+        if error:
+            return None, error
+        self.plans[key] = (schemas, plan)
+        return plan, None
+
+    def validate(self, column_types, join_column_types=None):
+        statement = self.statement
+        table = statement.table
+        plan = {"column_types": column_types, "predicate": None, "condition": None}
+        if join_column_types is not None:
+            # Each table's conditions are bound when the join runs
+            sides = [
+                JoinSide(table, statement.alias, column_types),
+                JoinSide(statement.join.table, statement.join.alias, join_column_types),
+            ]
+            join_plan, error = plan_join(statement, sides)
+            if error:
+                return None, error
+            plan.update(join_plan)
+            return plan, None
+
+        condition = getattr(statement, "condition", None)
+        if condition:
+            text, tree = condition
+            predicate = Predicate(text, tree)
+            for column in predicate.columns:
+                if column not in column_types:
+                    return None, f"Error: Column '{column}' does not exist in table '{table}'."
+            if self.parameter_count and has_parameters(tree):
+                plan["condition"] = condition  # Bound again with the parameters of every run
+            else:
+                try:
+                    plan["predicate"] = predicate.bind(column_types)
+                except (ValueError, TypeError) as e:
+                    return None, f"Error: Invalid value in the condition: {e}"
+
+        if isinstance(statement, Select):
+            return self.validate_select(statement, column_types, plan)
+        if isinstance(statement, Insert):
+            columns = statement.columns or list(column_types)
+            for column in columns:
+                if column not in column_types:
+                    return None, f"Error: Column '{column}' does not exist in table '{table}'."
+            # Columns have no default value, so every one needs a value
+            missing = [column for column in column_types if column not in columns]
+            if missing:
+                return None, f"Error: No value for column(s) {', '.join(missing)}; list every column of table '{table}'."
+            for row in statement.rows:
+                if len(row) != len(columns):
+                    return None, f"Error: Mismatch in column count. Table '{table}' expects {len(columns)} columns."
+            plan["columns"] = columns
+        elif isinstance(statement, Update):
+            values = []
+            for column, value in statement.assignments:
+                if column not in column_types:
+                    return None, f"Error: Column '{column}' does not exist in table '{table}'."
+                if not isinstance(value, Parameter):
+                    value, error = convert_value(value, column, column_types)
+                    if error:
+                        return None, error
+                values.append((column, value))
+            plan["values"] = values
+        return plan, None
+
+    def validate_select(self, statement, column_types, plan):
+        table = statement.table
+        for column in statement.group_by:
+            if column not in column_types:
+                return None, f"Error: Column '{column}' does not exist in table '{table}'."
+        if statement.aggregate:
+            try:
+                items = parse_select_list(", ".join(statement.items), column_types, statement.group_by)
+            except ValueError as e:
+                return None, f"Error: {e}"
+            labels = [label for label, _, _ in items]
+            if statement.order_by and statement.order_by not in labels:
+                return None, f"Error: Column '{statement.order_by}' is not part of the result."
+            plan.update(items=items, columns=labels)
+            return plan, None
+
+        columns = list(column_types) if statement.items == ["*"] else statement.items
+        for column in columns + ([statement.order_by] if statement.order_by else []):
+            if column not in column_types:
+                return None, f"Error: Column '{column}' does not exist in table '{table}'."
+        plan["columns"] = columns
+        return plan, None
+
+
+def has_parameters(node):
+    """Check whether a condition tree holds any '?' parameter."""
+    if node[0] == "compare":
+        return isinstance(node[3], Parameter)
+    if node[0] == "not":
+        return has_parameters(node[1])
+    return any(has_parameters(child) for child in node[1])
+
+
+def convert_value(value, column, column_types):
+    """Convert a value to its column's type; return (value, None) or (None, error)."""
+    try:
+        return convert_literal(value, column_types[column]), None
+    except (ValueError, TypeError):
+        return None, f"Error: Invalid value '{value}' for column '{column}' (expected {column_types[column]})."
+
+
+class StatementCache:
+    """Prepared statements shared by the whole process, keyed by their text."""
+
+    def __init__(self, max_statements=MAX_PREPARED_STATEMENTS):
+        self.max_statements = max_statements
+        self.statements = OrderedDict()  # Text -> PreparedStatement, least recently used first
+        self.lock = threading.Lock()
+
+    def get(self, text):
+        """Return the prepared statement for a text, parsing it if it is not cached.
+
+        Raises ValueError for a statement that does not parse.
+        """
+        with self.lock:
+            statement = self.statements.get(text)
+            if statement is not None:
+                self.statements.move_to_end(text)
+                count("statements.cached")
+                return statement
+        count("statements.parsed")
+        with phase("parse"):
+            statement = PreparedStatement(text)
+        with self.lock:
+            self.statements[text] = statement
+            while len(self.statements) > self.max_statements:
+                self.statements.popitem(last=False)
+        return statement
+
+    def clear(self):
+        with self.lock:
+            self.statements.clear()
+
+
+# Shared by every executor in the process
+statement_cache = StatementCache()
+
+
+class StatementExecutor:
+    """Runs SELECT, INSERT, UPDATE and DELETE statements, with '?' placeholders for values.
+
+        executor = StatementExecutor()
+        columns, rows, message = executor.execute("testdb", "SELECT name FROM users WHERE id = ?", [42])
+
+    Statements are parsed and validated the first time their text is seen; running the
+    same text again, with any parameters, skips both. execute() returns
+    (columns, rows, None) for a SELECT and (None, None, message) otherwise, where message
+    is an error or the result of an INSERT, UPDATE or DELETE.
+    """
+
+    def __init__(self, db_path="earthdb_data", query_tables=None, table_operations=None, cache=None):
+        self.db_path = db_path
+        self.query_tables = query_tables or QueryTables(db_path)
+        self.table_operations = table_operations or TableOperations(db_path)
+        self.storage = self.query_tables.storage
+        self.cache = cache if cache is not None else statement_cache
+
+    def prepare(self, text):
+        """Parse a statement (or take it from the cache); return (PreparedStatement, None) or (None, error)."""
+        try:
+            return self.cache.get(text.strip()), None
+        except ValueError as e:
+            return None, f"Error: {e}"
+
+    def execute(self, db_name, statement, parameters=()):
+        """Run a statement (text or PreparedStatement) with values for its '?' placeholders."""
+        started = time.perf_counter()
+        columns, rows, message = self.run(db_name, statement, parameters)
+        text = statement.text if isinstance(statement, PreparedStatement) else statement
+        kind = text.split(None, 1)[0].upper() if is_statement(text) else "INVALID"
+        metrics.observe("statement." + kind, time.perf_counter() - started)
+        if columns is None and message.startswith("Error"):
+            count("errors")
+        return columns, rows, message
+
+    def run(self, db_name, statement, parameters):
+        if not isinstance(statement, PreparedStatement):
+            statement, error = self.prepare(statement)
+            if error:
+                return None, None, error
+        parameters = list(parameters)
+        if len(parameters) != statement.parameter_count:
+            return None, None, (
+                f"Error: The statement has {statement.parameter_count} '?' placeholder(s) "
+                f"but {len(parameters)} value(s) were given."
+            )
+        plan, error = statement.plan(self.storage, db_name)
+        if error:
+            return None, None, error
+
+        predicate = plan["predicate"]
+        if plan["condition"]:
+            text, tree = plan["condition"]
+            try:
+                with phase("bind"):
+                    predicate = Predicate(text, tree).bind(plan["column_types"], parameters)
+            except (ValueError, TypeError) as e:
+                return None, None, f"Error: Invalid parameter value: {e}"
+
+        ast = statement.statement
+        table_name = ast.table
+        if isinstance(ast, Select):
+            return self.select(db_name, ast, plan, predicate, parameters)
+        if isinstance(ast, Insert):
+            rows = [
+                [parameters[value.index] if isinstance(value, Parameter) else value for value in row]
+                for row in ast.rows
+            ]
+            if ast.columns:
+                rows = [dict(zip(plan["columns"], row)) for row in rows]
+            if len(rows) == 1:
+                return None, None, self.table_operations.insert_into_table(db_name, table_name, rows[0])
+            return None, None, self.table_operations.insert_many(db_name, table_name, rows)
+        if isinstance(ast, Update):
+            values = {}
+            for column, value in plan["values"]:
+                if isinstance(value, Parameter):
+                    value, error = convert_value(parameters[value.index], column, plan["column_types"])
+                    if error:
+                        return None, None, error
+                values[column] = value
+            return None, None, self.table_operations.update_where(db_name, table_name, values, predicate)
+        return None, None, self.table_operations.delete_where(db_name, table_name, predicate)
+
+    def select(self, db_name, ast, plan, predicate, parameters):
+        limit, offset = ast.limit, ast.offset
+        try:
+            if isinstance(limit, Parameter):
+                limit = int(parameters[limit.index])
+            if isinstance(offset, Parameter):
+                offset = int(parameters[offset.index])
+        except (ValueError, TypeError):
+            return None, None, "Error: LIMIT and OFFSET take a whole number."
+        if (limit is not None and limit < 0) or offset < 0:
+            return None, None, "Error: LIMIT and OFFSET take a whole number."
+        sort_order = "desc" if ast.descending else "asc"
+
+        if ast.join:
+            join = HashJoin(self.query_tables, db_name, plan)
+            try:
+                with phase("bind"):
+                    filters, residual = join.bind(parameters)
+            except (ValueError, TypeError) as e:
+                return None, None, f"Error: Invalid parameter value: {e}"
+            if not ast.aggregate:
+                return join.select(filters, residual, ast.descending, limit, offset)
+            results = join.aggregate(filters, residual)
+        elif not ast.aggregate:
+            return self.query_tables.select_rows(
+                db_name, ast.table, plan["columns"], predicate, ast.order_by, sort_order, limit=limit, offset=offset
+            )
+        else:
+            results = self.query_tables.aggregate_items(db_name, ast.table, plan["items"], predicate, ast.group_by)
+
+        labels = plan["columns"]
+        if ast.order_by:
+            i = labels.index(ast.order_by)
+            results.sort(key=lambda result: (result[i] is not None, result[i]), reverse=ast.descending)
+        results = results[offset:None if limit is None else offset + limit]
+        count("rows.returned", len(results))
+        return labels, [dict(zip(labels, result)) for result in results], None
@@ -0,0 +1,874 @@
+import os
+import json
+import shutil
+from contextlib import contextmanager
+from contextvars import ContextVar
+from database_cache import database_cache
+from write_ahead_log import write_ahead_log
+from indexes import create_index
+from columnar import ColumnarRows, read_table_file, write_table_file
+from locks import file_lock, thread_lock
+from metrics import count, phase
+
+CATALOG_FILE = "catalog.json"
+LOG_FILE = "wal.log"
+
+# Transaction of the running command, seen by every storage instance it uses
+active_transaction = ContextVar("active_transaction", default=None)
+
+
+class Transaction:
+    """Row changes to one database, held back until they are committed together.
+
+    Statements in the transaction see its changes through private copies of the tables
+    they changed; no one else sees them until commit writes every record to the log at
+    once. Rolling back simply drops the transaction, since nothing was written.
+    """
+
+    def __init__(self, key, db_name, base_lsn):
+        self.key = key
+        self.db_name = db_name
+        self.base_lsn = base_lsn  # Last lsn of the database at BEGIN
+        self.records = []
+        self.changed = set()  # Names of the tables the records change
+        self.tables = {}  # Table name -> private copy with the records applied
+
+    def add(self, record):
+        self.records.append(record)
+        self.changed.add(record["table"])
+
+    def savepoint(self):
+        """Return a transaction that starts with this one's changes; its own are dropped with it.
+
+        Private table copies are not shared: the savepoint builds its own on first use.
+        """
+        savepoint = Transaction(self.key, self.db_name, self.base_lsn)
+        savepoint.records = list(self.records)
+        savepoint.changed = set(self.changed)
+        return savepoint
+
+    def rollback(self):
+        self.records = []
+        self.changed = set()
+        self.tables = {}
+
+
+@contextmanager
+def in_transaction(transaction):
+    """Run a block with a transaction (or None) as the active one."""
+    token = active_transaction.set(transaction)
+    try:
+        yield transaction
+    finally:
+        active_transaction.reset(token)
+
+
+class DatabaseStorage:
+    """Stores each database as a directory with a small catalog and one rows file per table.
+
+    Layout of '<storage_path>/<db>/':
+      catalog.json         - columns of every table, its current rows file and log positions
+      <table>.<lsn>.jsonl  - one JSON row per line; never modified once written
+      <table>.<lsn>.col    - the same for a columnar table: one typed buffer per column
+      <table>.<column>.<lsn>.idx.json - a persisted index over one column
+      wal.log              - row mutations not yet folded into the rows files
+
+    Operations only read and write the tables they touch. Rows files are replaced by
+    writing a new file and then atomically replacing the catalog that points to it.
+
+    Processes sharing a data directory coordinate through '<storage_path>/<db>.lock':
+    reads hold a shared lock, so they run side by side, and changes hold an exclusive
+    one, so every change starts from the latest catalog and log and none is lost.
+    """
+
+    def __init__(self, storage_path="earthdb_data", cache=None, wal=None):
+        self.storage_path = storage_path
+        self.cache = cache if cache is not None else database_cache
+        self.wal = wal if wal is not None else write_ahead_log
+
+    def database_dir(self, db_name):
+        """Return the directory holding a database."""
+        return os.path.join(self.storage_path, db_name)
+
+    def catalog_file(self, db_name):
+        return os.path.join(self.database_dir(db_name), CATALOG_FILE)
+
+    def log_file(self, db_name):
+        return os.path.join(self.database_dir(db_name), LOG_FILE)
+
+    def legacy_file(self, db_name):
+        """Return the path of a database stored in the old single-file format."""
+        return os.path.join(self.storage_path, f"{db_name}.json")
+
+    def lock_file(self, db_name):
+        return os.path.join(self.storage_path, f"{db_name}.lock")
+
+    def cache_key(self, db_name):
+        return os.path.abspath(self.database_dir(db_name))
+
+    def acquire_lock(self, db_name, exclusive=False):
+        """Take the database's lock: shared to read it, exclusive to change it."""
+        # Threads using the same database take turns, since its file lock and cached state
+        # are shared by the whole process; other databases are not held up
+        lock = thread_lock(self.cache_key(db_name))
+        lock.acquire()
+        try:
+            file_lock(self.lock_file(db_name)).acquire(exclusive)
+        except BaseException:
+            lock.release()
+            raise
+
+    def release_lock(self, db_name):
+        file_lock(self.lock_file(db_name)).release()
+        thread_lock(self.cache_key(db_name)).release()
+
+    @contextmanager
+    def locked(self, db_name, exclusive=False):
+        """Hold the database's lock for a block; a read-modify-write holds it exclusively throughout."""
+        self.acquire_lock(db_name, exclusive)
+        try:
+            yield
+        finally:
+            self.release_lock(db_name)
+
+    def open_transaction(self, db_name):
+        """Return the active transaction if it is on this database, else None."""
+        transaction = active_transaction.get()
+        if transaction is not None and transaction.key == self.cache_key(db_name):
+            return transaction
+        return None
+
+    def check_no_transaction(self, db_name):
+        """Refuse a schema change while a transaction is open on the database."""
+        if self.open_transaction(db_name) is not None:
+            raise Exception(f"Error: Cannot change the schema of database '{db_name}' inside a transaction. COMMIT or ROLLBACK first.")
+
+    def database_exists(self, db_name):
+        return os.path.exists(self.catalog_file(db_name)) or os.path.exists(self.legacy_file(db_name))
+
+    def list_databases(self):
+        """Return the names of all databases, in either storage format."""
+        databases = set()
+        for entry in os.listdir(self.storage_path):
+            if entry.endswith(".json"):
+                databases.add(entry[: -len(".json")])
+            elif os.path.exists(os.path.join(self.storage_path, entry, CATALOG_FILE)):
+                databases.add(entry)
+        return sorted(databases)
+
+    def create_database(self, db_name):
+        """Create an empty database directory and catalog."""
+        with self.locked(db_name, exclusive=True):
+            os.makedirs(self.database_dir(db_name), exist_ok=True)
+            self.write_json(self.catalog_file(db_name), {"lsn": 0, "tables": {}})
+
+    def delete_database(self, db_name):
+        """Remove a database and everything stored for it (the lock file stays for other processes)."""
+        self.check_no_transaction(db_name)
+        with self.locked(db_name, exclusive=True):
+            self.cache.invalidate(self.cache_key(db_name))
+            if os.path.isdir(self.database_dir(db_name)):
+                shutil.rmtree(self.database_dir(db_name))
+            legacy_file = self.legacy_file(db_name)
+            if os.path.exists(legacy_file):
+                os.remove(legacy_file)
+            self.wal.remove(os.path.splitext(legacy_file)[0] + ".wal")
+
+    def migrate_database(self, db_name):
+        """Convert a single-file database ('<db>.json' plus '<db>.wal') to the catalog layout.
+
+        The original file is kept next to the new directory as '<db>.json.bak'.
+        """
+        with self.locked(db_name, exclusive=True):
+            legacy_file = self.legacy_file(db_name)
+            if not os.path.exists(legacy_file):
+                return  # Another process migrated it while we waited for the lock
+            legacy_log = os.path.splitext(legacy_file)[0] + ".wal"
+            with open(legacy_file, "r") as f:
+                db_data = json.load(f)
+            for record in self.wal.read(legacy_log):
+                table = db_data["tables"].get(record["table"])
+                if table is not None and record["lsn"] > db_data.get("lsn", 0):
+                    self.wal.apply(table, record)
+
+            os.makedirs(self.database_dir(db_name), exist_ok=True)
+            catalog = {"lsn": 1, "tables": {}}
+            for table_name, table in db_data["tables"].items():
+                catalog["tables"][table_name] = {"columns": table["columns"], "file": None, "lsn": 1, "indexes": {}}
+                self.write_table_files(db_name, catalog, table_name, table, 1)
+            self.write_json(self.catalog_file(db_name), catalog)
+
+            os.replace(legacy_file, legacy_file + ".bak")
+            self.wal.remove(legacy_log)
+
+    def signature(self, db_name):
+        """Return the mtime, size and inode of the catalog and log; rows files never change in place.
+
+        The inode changes on every atomic replace, even within the same mtime tick.
+        """
+        signature = []
+        for path in (self.catalog_file(db_name), self.log_file(db_name)):
+            try:
+                stat = os.stat(path)
+                signature.extend((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+            except FileNotFoundError:
+                signature.extend((None, 0, None))
+        return tuple(signature)
+
+    def load_state(self, db_name):
+        """Return the cached catalog, pending log records and loaded tables of a database."""
+        if not os.path.exists(self.catalog_file(db_name)):
+            if not os.path.exists(self.legacy_file(db_name)):
+                raise Exception(f"Error: Database '{db_name}' does not exist!")
+            self.migrate_database(db_name)
+
+        key = self.cache_key(db_name)
+        with self.locked(db_name):
+            state = self.cache.get(key, self.signature(db_name))
+            if state is not None:
+                count("cache.hits")
+                return state
+            count("cache.misses")
+
+            with open(self.catalog_file(db_name), "r") as f:
+                catalog = json.load(f)
+            log = self.wal.read(self.log_file(db_name))
+            signature = self.signature(db_name)
+            state = {
+                "catalog": catalog,
+                "log": log,
+                "last_lsn": max([catalog["lsn"]] + [record["lsn"] for record in log]),
+                "tables": {},
+                "size": signature[1] + signature[4],
+            }
+            count("bytes.read", signature[1])  # The catalog; wal.read counts the log
+            self.cache.put(key, signature, state["size"], state)
+            return state
+
+    def load_catalog(self, db_name):
+        """Return the catalog of a database: table names and their columns."""
+        return self.load_state(db_name)["catalog"]
+
+    def load_table(self, db_name, table_name):
+        """Return a table as {'columns', 'rows', 'indexes'}, reading only its own files.
+
+        Inside a transaction that changed the table, its private copy is returned instead.
+        """
+        transaction = self.open_transaction(db_name)
+        if transaction is not None and table_name in transaction.changed:
+            return self.transaction_table(transaction, db_name, table_name)
+        return self.load_committed_table(db_name, table_name)
+
+    def load_committed_table(self, db_name, table_name):
+        """Return a table with every committed change, as every session sees it."""
+        with self.locked(db_name):
+            state = self.load_state(db_name)
+            table = state["tables"].get(table_name)
+            if table is not None:
+                return table
+
+            entry = state["catalog"]["tables"][table_name]
+            rows_file = os.path.join(self.database_dir(db_name), entry["file"])
+            if entry.get("format") == "columnar":
+                rows = read_table_file(rows_file)
+            else:
+                with open(rows_file, "r") as f:
+                    rows = [json.loads(line) for line in f if line.strip()]
+            table = {"columns": entry["columns"], "rows": rows, "indexes": {}, "file": rows_file}
+            size = os.path.getsize(rows_file)
+            state["size"] += size
+            count("bytes.read", size)
+            count("tables.loaded")
+
+            # Indexes are persisted for the rows file; fall back to rebuilding a missing one
+            for column, definition in entry.get("indexes", {}).items():
+                index = self.read_index(db_name, column, definition)
+                if index is None:
+                    index = create_index(definition["type"], column)
+                    index.build(rows)
+                table["indexes"][column] = index
+
+            for record in state["log"]:
+                if record["table"] == table_name and record["lsn"] > entry["lsn"]:
+                    self.apply(table, record)
+
+            state["tables"][table_name] = table
+            self.cache.resize(self.cache_key(db_name), state["size"])
+            return table
+
+    def transaction_table(self, transaction, db_name, table_name):
+        """Return a transaction's private copy of a table, copying the committed table on first use.
+
+        The copy shares the row dicts and read-only column buffers of the committed table
+        until the transaction changes them, so copying costs little more than its indexes.
+        """
+        table = transaction.tables.get(table_name)
+        if table is None:
+            committed = self.load_committed_table(db_name, table_name)
+            rows = committed["rows"]
+            table = {
+                "columns": committed["columns"],
+                "rows": rows.copy() if isinstance(rows, ColumnarRows) else list(rows),
+                "indexes": {column: index.copy() for column, index in committed["indexes"].items()},
+            }
+            for record in transaction.records:
+                if record["table"] == table_name:
+                    self.apply_private(table, record)
+            transaction.tables[table_name] = table
+        return table
+
+    def apply_private(self, table, record):
+        """Apply a record to a transaction's copy of a table, copying the row dicts it updates."""
+        rows = table["rows"]
+        if record["op"] == "update" and not isinstance(rows, ColumnarRows):
+            positions = record["positions"]
+            for position in range(len(rows)) if positions is None else positions:
+                rows[position] = dict(rows[position])
+        self.apply(table, record)
+
+    def iter_rows(self, db_name, table_name):
+        """Yield a table's rows one at a time without loading the table into memory.
+
+        A table that is already loaded, columnar, changed by the open transaction, or has
+        logged changes not yet in its rows file, is read from memory instead.
+        """
+        with self.locked(db_name):
+            state = self.load_state(db_name)
+            columnar = state["catalog"]["tables"][table_name].get("format") == "columnar"
+            transaction = self.open_transaction(db_name)
+            changed = transaction is not None and table_name in transaction.changed
+            if table_name in state["tables"] or columnar or changed or self.has_pending_records(state, table_name):
+                rows = self.load_table(db_name, table_name)["rows"]
+                handle = None
+            else:
+                # Rows files are never modified, and an open handle survives their removal
+                entry = state["catalog"]["tables"][table_name]
+                handle = open(os.path.join(self.database_dir(db_name), entry["file"]), "r")
+                count("bytes.read", os.fstat(handle.fileno()).st_size)
+
+        if handle is None:
+            yield from rows
+            return
+        with handle:
+            for line in handle:
+                if line.strip():
+                    yield json.loads(line)
+
+    def count_rows(self, db_name, table_name):
+        """Return the number of rows in a table from the catalog and log, without reading its rows."""
+        with self.locked(db_name):
+            state = self.load_state(db_name)
+            table = state["tables"].get(table_name)
+            entry = state["catalog"]["tables"][table_name]
+            transaction = self.open_transaction(db_name)
+            if table is not None or "row_count" not in entry or (transaction and table_name in transaction.changed):
+                return len(self.load_table(db_name, table_name)["rows"])
+
+            count = entry["row_count"]
+            for record in state["log"]:
+                if record["table"] != table_name or record["lsn"] <= entry["lsn"]:
+                    continue
+                if record["op"] == "insert":
+                    count += len(record["rows"])
+                elif record["op"] == "delete":
+                    count = 0 if record["positions"] is None else count - len(record["positions"])
+            return count
+
+    def table_source(self, db_name, table_name):
+        """Return (rows file, format, columns, row count) if the rows file holds every row of the table, else None.
+
+        Worker processes scan the file directly instead of receiving the rows.
+        """
+        with self.locked(db_name):
+            state = self.load_state(db_name)
+            entry = state["catalog"]["tables"][table_name]
+            if not entry.get("file") or "row_count" not in entry or self.has_pending_records(state, table_name):
+                return None
+            transaction = self.open_transaction(db_name)
+            if transaction is not None and table_name in transaction.changed:
+                return None
+            path = os.path.join(self.database_dir(db_name), entry["file"])
+            return path, entry.get("format", "rows"), entry["columns"], entry["row_count"]
+
+    def read_index(self, db_name, column, definition):
+        """Load a persisted index, or return None if its file is missing."""
+        if not definition["file"]:
+            return None
+        index_file = os.path.join(self.database_dir(db_name), definition["file"])
+        if not os.path.exists(index_file):
+            return None
+        index = create_index(definition["type"], column)
+        with open(index_file, "r") as f:
+            index.load_json(json.load(f))
+        count("bytes.read", os.path.getsize(index_file))
+        return index
+
+    def has_pending_records(self, state, table_name):
+        """Check whether the log holds changes not yet folded into a table's rows file."""
+        entry = state["catalog"]["tables"].get(table_name)
+        return entry is not None and any(
+            record["table"] == table_name and record["lsn"] > entry["lsn"] for record in state["log"]
+        )
+
+    def apply(self, table, record):
+        """Apply a log record to a loaded table and keep its indexes current."""
+        rows = table["rows"]
+        indexes = table["indexes"]
+        op = record["op"]
+        positions = record.get("positions")
+        table.pop("vectors", None)  # NumPy copies of the columns are rebuilt on the next scan
+        table.pop("file", None)  # The rows file no longer holds the table's current rows
+
+        if op == "update" and positions is not None:
+            changed = [index for column, index in indexes.items() if column in record["values"]]
+            for index in changed:
+                for position in positions:
+                    index.discard(rows[position][index.column], position)
+            self.wal.apply(table, record)
+            for index in changed:
+                for position in positions:
+                    index.add(rows[position][index.column], position)
+            return
+
+        start = len(rows)
+        self.wal.apply(table, record)
+        for column, index in indexes.items():
+            if op == "insert":
+                for position, row in enumerate(record["rows"], start):
+                    index.add(row[column], position)
+            elif op == "delete" and positions is not None:
+                # Deletes shift every following position down
+                index.compact(sorted(positions))
+            elif op == "delete" or column in record.get("values", ()):
+                index.build(table["rows"])
+
+    def log(self, db_name, record):
+        """Append a row mutation to the database log and apply it to the loaded table.
+
+        The record is durable before it is applied in memory. Once the log grows past its
+        threshold, it is folded back into the table files. Inside a transaction the record
+        is only kept by the transaction until it commits.
+        """
+        transaction = self.open_transaction(db_name)
+        if transaction is not None:
+            transaction.add(record)
+            if record["table"] in transaction.tables:
+                self.apply_private(transaction.tables[record["table"]], record)
+            return
+
+        with self.locked(db_name, exclusive=True), phase("log"):
+            state = self.load_state(db_name)
+            record["lsn"] = state["last_lsn"] + 1
+            log_size = self.wal.append(self.log_file(db_name), record)
+            state["last_lsn"] = record["lsn"]
+            state["log"].append(record)
+            table = state["tables"].get(record["table"])
+            if table is not None:
+                self.apply(table, record)
+            self.cache.refresh(self.cache_key(db_name), self.signature(db_name))
+
+            if log_size > self.wal.checkpoint_bytes:
+                self.checkpoint(db_name)
+
+    def checkpoint(self, db_name):
+        """Fold the log into new files for the tables it touches, then empty it."""
+        count("checkpoints")
+        with self.locked(db_name, exclusive=True), phase("checkpoint"):
+            state = self.load_state(db_name)
+            catalog = state["catalog"]
+            pending = {
+                record["table"] for record in state["log"] if self.has_pending_records(state, record["table"])
+            }
+            old_files = []
+            for table_name in pending:
+                table = self.load_table(db_name, table_name)
+                old_files.extend(self.write_table_files(db_name, catalog, table_name, table, state["last_lsn"]))
+
+            catalog["lsn"] = state["last_lsn"]
+            self.write_json(self.catalog_file(db_name), catalog)
+            self.wal.truncate(self.log_file(db_name))
+            state["log"] = []
+            self.remove_unused_files(db_name, catalog, old_files)
+            self.cache.refresh(self.cache_key(db_name), self.signature(db_name))
+
+    def begin(self, db_name):
+        """Start a transaction on a database; run commands in it with in_transaction()."""
+        with self.locked(db_name):
+            return Transaction(self.cache_key(db_name), db_name, self.load_state(db_name)["last_lsn"])
+
+    def commit(self, transaction):
+        """Write a transaction's records to the log with one durable append; return how many there were.
+
+        Changes made by another session since BEGIN would invalidate the row positions the
+        records refer to, so then nothing is written and an error is raised.
+        """
+        db_name = transaction.db_name
+        records, tables = transaction.records, transaction.tables
+        transaction.rollback()
+        if not records:
+            return 0
+
+        with self.locked(db_name, exclusive=True), phase("commit"):
+            state = self.load_state(db_name)
+            if state["last_lsn"] != transaction.base_lsn or any(
+                record["table"] not in state["catalog"]["tables"] for record in records
+            ):
+                raise Exception(f"Error: Database '{db_name}' was changed by another session during the transaction. Its changes were rolled back.")
+
+            for lsn, record in enumerate(records, state["last_lsn"] + 1):
+                record["lsn"] = lsn
+            log_size = self.wal.append_many(self.log_file(db_name), records)
+            state["last_lsn"] = records[-1]["lsn"]
+            state["log"].extend(records)
+
+            # The private copies already hold the changes; other loaded tables apply them now
+            for record in records:
+                table = state["tables"].get(record["table"])
+                if table is not None and record["table"] not in tables:
+                    self.apply(table, record)
+            for table_name, table in tables.items():
+                if table_name in state["tables"]:
+                    state["tables"][table_name] = table
+            self.cache.refresh(self.cache_key(db_name), self.signature(db_name))
+
+            if log_size > self.wal.checkpoint_bytes:
+                self.checkpoint(db_name)
+        count("transactions.committed")
+        return len(records)
+
+    @contextmanager
+    def transaction(self, db_name):
+        """Run a block as one transaction: committed at its end, rolled back if it raises."""
+        transaction = self.begin(db_name)
+        try:
+            with in_transaction(transaction):
+                yield transaction
+        except BaseException:
+            transaction.rollback()
+            raise
+        self.commit(transaction)
+
+    def version(self, db_name):
+        """Return a value that changes with every change to a database visible here."""
+        transaction = self.open_transaction(db_name)
+        return self.load_state(db_name)["last_lsn"], len(transaction.records) if transaction else 0
+
+    def open_table_writer(self, db_name, table_name, columns, append=False, storage_format=None):
+        """Start streaming rows into a new or replaced table (or onto an existing one with append)."""
+        self.check_no_transaction(db_name)
+        return TableWriter(self, db_name, table_name, columns, append, storage_format)
+
+    def write_table(self, db_name, table_name, columns, rows, storage_format=None):
+        """Create or replace a whole table, rebuilding the indexes it keeps.
+
+        storage_format is 'rows' or 'columnar'; None keeps the format of the table being replaced.
+        """
+        self.check_no_transaction(db_name)
+        with self.locked(db_name, exclusive=True):
+            state = self.load_state(db_name)
+            catalog = state["catalog"]
+            old_entry = catalog["tables"].get(table_name, {})
+            storage_format = storage_format or old_entry.get("format", "rows")
+            if storage_format == "columnar" and not isinstance(rows, ColumnarRows):
+                table_rows = ColumnarRows(columns)
+                table_rows.extend(rows)
+                rows = table_rows
+            catalog["tables"][table_name] = {
+                "columns": columns,
+                "format": storage_format,
+                "file": old_entry.get("file"),
+                "lsn": state["last_lsn"],
+                "indexes": {
+                    column: definition for column, definition in old_entry.get("indexes", {}).items()
+                    if column in columns
+                },
+            }
+
+            table = {"columns": columns, "rows": rows, "indexes": {}}
+            for column, definition in catalog["tables"][table_name]["indexes"].items():
+                table["indexes"][column] = create_index(definition["type"], column)
+                table["indexes"][column].build(rows)
+            self.commit_table(db_name, state, table_name, table, [
+                definition["file"] for column, definition in old_entry.get("indexes", {}).items()
+                if column not in columns
+            ])
+
+    def drop_table(self, db_name, table_name):
+        """Remove a table from the catalog and delete its files."""
+        self.check_no_transaction(db_name)
+        with self.locked(db_name, exclusive=True):
+            state = self.load_state(db_name)
+            catalog = state["catalog"]
+            entry = catalog["tables"].pop(table_name)
+            self.write_json(self.catalog_file(db_name), catalog)
+            self.remove_unused_files(db_name, catalog, self.entry_files(entry))
+
+            state["tables"].pop(table_name, None)
+            self.cache.refresh(self.cache_key(db_name), self.signature(db_name))
+
+    def create_index(self, db_name, table_name, column, kind="hash"):
+        """Build an index over a column and persist it next to the table's rows file."""
+        self.check_no_transaction(db_name)
+        with self.locked(db_name, exclusive=True):
+            state = self.load_state(db_name)
+            table = self.load_table(db_name, table_name)
+            index = create_index(kind, column)
+            index.build(table["rows"])
+            table["indexes"][column] = index
+            state["catalog"]["tables"][table_name].setdefault("indexes", {})[column] = {"type": kind, "file": None}
+            self.commit_table(db_name, state, table_name, table)
+
+    def drop_index(self, db_name, table_name, column):
+        """Remove the index over a column and delete its file."""
+        self.check_no_transaction(db_name)
+        with self.locked(db_name, exclusive=True):
+            state = self.load_state(db_name)
+            table = self.load_table(db_name, table_name)
+            definition = state["catalog"]["tables"][table_name]["indexes"].pop(column)
+            table["indexes"].pop(column, None)
+            self.commit_table(db_name, state, table_name, table, [definition["file"]])
+
+    def commit_table(self, db_name, state, table_name, table, old_files=()):
+        """Write a table's files at a fresh lsn, then atomically point the catalog at them.
+
+        The new files already contain every logged change to the table, so the lsn is
+        advanced past all of them and they are never replayed again.
+        """
+        catalog = state["catalog"]
+        state["last_lsn"] += 1
+        catalog["lsn"] = state["last_lsn"]
+        old_files = list(old_files)
+        old_files.extend(self.write_table_files(db_name, catalog, table_name, table, state["last_lsn"]))
+        self.write_json(self.catalog_file(db_name), catalog)
+        self.remove_unused_files(db_name, catalog, old_files)
+
+        state["tables"][table_name] = table
+        self.cache.refresh(self.cache_key(db_name), self.signature(db_name))
+
+    def write_table_files(self, db_name, catalog, table_name, table, lsn):
+        """Write a table's rows and indexes to new files and return the files they replace."""
+        entry = catalog["tables"][table_name]
+        old_files = self.entry_files(entry)
+        entry["file"] = self.rows_file_name(entry, table_name, lsn)
+        entry["lsn"] = lsn
+        entry["row_count"] = len(table["rows"])
+
+        rows_file = os.path.join(self.database_dir(db_name), entry["file"])
+        if entry.get("format") == "columnar":
+            write_table_file(rows_file + ".tmp", entry["columns"], table["rows"])
+        else:
+            with open(rows_file + ".tmp", "w") as f:
+                for row in table["rows"]:
+                    f.write(json.dumps(row, separators=(",", ":")))
+                    f.write("\n")
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(rows_file + ".tmp", rows_file)
+        count("bytes.written", os.path.getsize(rows_file))
+        table["file"] = rows_file
+
+        for column, index in table.get("indexes", {}).items():
+            self.write_index_file(db_name, entry, table_name, index, lsn)
+        return old_files
+
+    def rows_file_name(self, entry, table_name, lsn):
+        """Return the name of the rows file a table written at lsn is stored in."""
+        extension = "col" if entry.get("format") == "columnar" else "jsonl"
+        return f"{table_name}.{lsn}.{extension}"
+
+    def write_index_file(self, db_name, entry, table_name, index, lsn):
+        """Persist an index for the rows file written at lsn and point the catalog entry at it."""
+        definition = entry["indexes"][index.column]
+        definition["file"] = f"{table_name}.{index.column}.{lsn}.idx.json"
+        index_file = os.path.join(self.database_dir(db_name), definition["file"])
+        with open(index_file + ".tmp", "w") as f:
+            json.dump(index.to_json(), f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+            count("bytes.written", f.tell())
+        os.replace(index_file + ".tmp", index_file)
+
+    def entry_files(self, entry):
+        """Return the rows file and index files a catalog entry points to."""
+        files = [entry.get("file")]
+        files.extend(definition["file"] for definition in entry.get("indexes", {}).values())
+        return [file for file in files if file]
+
+    def remove_unused_files(self, db_name, catalog, files):
+        """Delete table files that the catalog no longer points to."""
+        current = set()
+        for entry in catalog["tables"].values():
+            current.update(self.entry_files(entry))
+        for file in files:
+            path = os.path.join(self.database_dir(db_name), file) if file else None
+            if path and file not in current and os.path.exists(path):
+                os.remove(path)
+
+    def write_json(self, path, data):
+        """Atomically replace a JSON file: write to a temporary file, fsync, then rename."""
+        with open(path + ".tmp", "w") as f:
+            json.dump(data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+            count("bytes.written", f.tell())
+        os.replace(path + ".tmp", path)
+
+
+class TableWriter:
+    """Streams rows into a new rows file for one table, keeping its indexes current.
+
+    Memory use is bounded by the rows passed to each write_rows() call plus the indexes;
+    a columnar table is collected in its compact in-memory form and written on commit().
+    Nothing is visible to readers until commit() atomically switches the catalog over;
+    abort() discards the partial file and leaves the table as it was. The writer holds
+    the database's exclusive lock from start to commit() or abort().
+    """
+
+    def __init__(self, storage, db_name, table_name, columns, append=False, storage_format=None):
+        self.storage = storage
+        self.db_name = db_name
+        self.table_name = table_name
+        self.columns = columns
+        self.row_count = 0
+        self.indexes = {}
+
+        storage.acquire_lock(db_name, exclusive=True)
+        self.holds_lock = True
+        try:
+            self.start(append, storage_format)
+        except BaseException:
+            self.release()
+            raise
+
+    def start(self, append, storage_format):
+        """Reserve an lsn for the new rows file, open it and copy the existing rows when appending."""
+        storage, db_name, table_name, columns = self.storage, self.db_name, self.table_name, self.columns
+        state = storage.load_state(db_name)
+        entry = state["catalog"]["tables"].get(table_name)
+        if append and entry is not None and storage.has_pending_records(state, table_name):
+            # Appending copies the rows file, so it must hold every logged change first
+            storage.checkpoint(db_name)
+            state = storage.load_state(db_name)
+            entry = state["catalog"]["tables"][table_name]
+        state["last_lsn"] += 1  # No other writer can take this lsn while the lock is held
+        self.lsn = state["last_lsn"]
+
+        self.format = storage_format or (entry or {}).get("format", "rows")
+        self.file = storage.rows_file_name({"format": self.format}, table_name, self.lsn)
+        self.path = os.path.join(storage.database_dir(db_name), self.file)
+        if self.format == "columnar":
+            self.handle = None
+            self.rows = ColumnarRows(columns)
+        else:
+            self.handle = open(self.path + ".tmp", "w")
+
+        # Indexes the table keeps; appending starts from the persisted ones when available
+        rebuild = []
+        definitions = entry.get("indexes", {}) if entry is not None else {}
+        for column, definition in definitions.items():
+            if column not in columns:
+                continue
+            index = storage.read_index(db_name, column, definition) if append else None
+            if index is None:
+                index = create_index(definition["type"], column)
+                rebuild.append(index)
+            self.indexes[column] = index
+
+        if append and entry is not None:
+            self.copy_rows(os.path.join(storage.database_dir(db_name), entry["file"]), entry, rebuild)
+
+    def copy_rows(self, rows_file, entry, rebuild):
+        """Copy the existing rows into the new file, adding them to the indexes being rebuilt."""
+        if entry.get("format") == "columnar":
+            rows = read_table_file(rows_file)
+            if self.handle is None:
+                # Same format: take the columns over as they are
+                self.rows = rows
+                self.row_count = len(rows)
+                for index in rebuild:
+                    index.build(rows)
+            else:
+                self.write_rows(rows[:], rebuild)
+            return
+        if self.handle is None:
+            with open(rows_file, "r") as f:
+                self.write_rows([json.loads(line) for line in f if line.strip()], rebuild)
+            return
+        with open(rows_file, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                self.handle.write(line)
+                if rebuild:
+                    row = json.loads(line)
+                    for index in rebuild:
+                        index.add(row[index.column], self.row_count)
+                self.row_count += 1
+
+    def write_rows(self, rows, indexes=None):
+        """Append a chunk of rows (dicts already converted to the column types)."""
+        if self.handle is None:
+            self.rows.extend(rows)
+        else:
+            self.handle.write("".join(json.dumps(row, separators=(",", ":")) + "\n" for row in rows))
+        for index in (self.indexes.values() if indexes is None else indexes):
+            column = index.column
+            for position, row in enumerate(rows, self.row_count):
+                index.add(row[column], position)
+        self.row_count += len(rows)
+
+    def commit(self):
+        """Make the new rows file the table's current data."""
+        try:
+            self.publish()
+        finally:
+            self.release()
+
+    def publish(self):
+        if self.handle is None:
+            write_table_file(self.path + ".tmp", self.columns, self.rows)
+        else:
+            self.handle.flush()
+            os.fsync(self.handle.fileno())
+            self.handle.close()
+        os.replace(self.path + ".tmp", self.path)
+        count("bytes.written", os.path.getsize(self.path))
+
+        storage = self.storage
+        state = storage.load_state(self.db_name)
+        catalog = state["catalog"]
+        old_entry = catalog["tables"].get(self.table_name, {})
+        entry = {
+            "columns": self.columns,
+            "format": self.format,
+            "file": self.file,
+            "lsn": self.lsn,
+            "row_count": self.row_count,
+            "indexes": {column: {"type": index.kind, "file": None} for column, index in self.indexes.items()},
+        }
+        catalog["tables"][self.table_name] = entry
+        for index in self.indexes.values():
+            storage.write_index_file(self.db_name, entry, self.table_name, index, self.lsn)
+        catalog["lsn"] = max(catalog["lsn"], self.lsn)
+        storage.write_json(storage.catalog_file(self.db_name), catalog)
+        storage.remove_unused_files(self.db_name, catalog, storage.entry_files(old_entry))
+
+        # The rows are read back from the new file the next time the table is used
+        state["tables"].pop(self.table_name, None)
+        storage.cache.refresh(storage.cache_key(self.db_name), storage.signature(self.db_name))
+
+    def abort(self):
+        """Discard everything written so far."""
+        try:
+            if self.handle is not None:
+                self.handle.close()
+            if os.path.exists(self.path + ".tmp"):
+                os.remove(self.path + ".tmp")
+        finally:
+            self.release()
+
+    def release(self):
+        """Let other processes read and change the database again."""
+        if self.holds_lock:
+            self.holds_lock = False
+            self.storage.release_lock(self.db_name)
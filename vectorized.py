@@ -0,0 +1,116 @@
+import operator
+from functools import reduce
+from columnar import ColumnarRows
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional; without it every scan stays in pure Python
+    numpy = None
+
+VECTORIZE_MIN_ROWS = 2048  # Below this, building NumPy arrays costs more than it saves
+
+# NumPy dtypes of the column types that can be vectorized, and the dtype kinds accepted for each
+DTYPES = {"integer": "int64", "float": "float64", "boolean": "bool"}
+KINDS = {"integer": "i", "float": "if", "boolean": "b"}
+
+
+def available(rows):
+    """Check whether the vectorized path should be used for a table of this size."""
+    return numpy is not None and len(rows) >= VECTORIZE_MIN_ROWS
+
+
+def column_array(table, column):
+    """Return a numeric or boolean column as a NumPy array, or None if it cannot be vectorized.
+
+    Columnar tables are wrapped without copying. For row tables the array is built once
+    and kept in the table until the next change to it.
+    """
+    rows = table["rows"]
+    col_type = table["columns"][column]
+    if col_type not in DTYPES:
+        return None
+
+    if isinstance(rows, ColumnarRows):
+        data = rows.column(column)
+        if data.encoding != "array":
+            return None
+        values = numpy.frombuffer(data.data, dtype=numpy.int8 if col_type == "boolean" else DTYPES[col_type])
+        return values.view(bool) if col_type == "boolean" else values
+
+    vectors = table.setdefault("vectors", {})
+    if column not in vectors:
+        # A column holding values of another type (e.g. imported from JSON) is not vectorized
+        values = numpy.array([row[column] for row in rows])
+        vectors[column] = values.astype(DTYPES[col_type]) if values.dtype.kind in KINDS[col_type] else None
+    return vectors[column]
+
+
+def scan_mask(table, column, op, value):
+    """Evaluate one comparison in pure Python and return it as a boolean mask."""
+    rows = table["rows"]
+    mask = numpy.zeros(len(rows), dtype=bool)
+    if isinstance(rows, ColumnarRows):
+        positions = rows.column(column).scan(op, value)
+    else:
+        positions = [position for position, row in enumerate(rows) if op(row[column], value)]
+    mask[positions] = True
+    return mask
+
+
+def condition_mask(table, node):
+    """Return a boolean mask of the rows matching a condition tree.
+
+    Comparisons on numeric and boolean columns run as array operations; the others are
+    scanned in Python. AND, OR and NOT combine the masks with &, | and ~.
+    """
+    kind = node[0]
+    if kind == "compare":
+        _, column, op, value = node
+        values = column_array(table, column)
+        if values is not None:
+            try:
+                return numpy.asarray(op(values, value), dtype=bool)
+            except (TypeError, OverflowError):
+                pass
+        return scan_mask(table, column, op, value)
+    if kind == "not":
+        return ~condition_mask(table, node[1])
+    masks = [condition_mask(table, child) for child in node[1]]
+    return reduce(operator.and_ if kind == "and" else operator.or_, masks)
+
+
+def vectorizable(table, node):
+    """Check whether any comparison in a condition tree is on a column that can be vectorized."""
+    if node[0] == "compare":
+        return column_array(table, node[1]) is not None
+    if node[0] == "not":
+        return vectorizable(table, node[1])
+    return any(vectorizable(table, child) for child in node[1])
+
+
+def match_positions(table, tree):
+    """Return the sorted positions matching a condition tree, or None if nothing in it can be vectorized."""
+    if not vectorizable(table, tree):
+        return None
+    return numpy.flatnonzero(condition_mask(table, tree)).tolist()
+
+
+def sort_positions(table, positions, column, descending=False):
+    """Return positions (every row if None) ordered by a column with a stable argsort, or None.
+
+    Equal values keep their table order in both directions, like sorted().
+    """
+    if positions is not None and len(positions) < VECTORIZE_MIN_ROWS:
+        return None  # A few matches sort faster in Python than building the column array
+    values = column_array(table, column)
+    if values is None:
+        return None
+    if positions is not None:
+        positions = numpy.asarray(positions, dtype=numpy.int64)
+        values = values[positions]
+    if descending:
+        # Sorting the reversed column and reversing the result puts ties back in table order
+        order = len(values) - 1 - numpy.argsort(values[::-1], kind="stable")[::-1]
+    else:
+        order = numpy.argsort(values, kind="stable")
+    return (order if positions is None else positions[order]).tolist()
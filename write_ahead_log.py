@@ -0,0 +1,122 @@
+import os
+import json
+from columnar import ColumnarRows
+from metrics import count
+
+DEFAULT_CHECKPOINT_BYTES = 4 * 1024 * 1024  # Fold the log into the table files past this size
+
+
+class WriteAheadLog:
+    """Append-only log of row mutations, one JSON record per line.
+
+    Every record carries a log sequence number (lsn) and the name of the table it changes.
+    Each table remembers the lsn of the last record folded into its rows file, so replay
+    after a crash never applies a record twice.
+    """
+
+    def __init__(self, checkpoint_bytes=DEFAULT_CHECKPOINT_BYTES):
+        self.checkpoint_bytes = checkpoint_bytes
+
+    def append(self, log_file, record):
+        """Durably append one record and return the new size of the log."""
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        count("wal.records")
+        count("bytes.written", len(line))  # json.dumps escapes non-ASCII, so characters are bytes
+        with open(log_file, "a") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+            return f.tell()
+
+    def append_many(self, log_file, records):
+        """Durably append several records with one write and return the new size of the log.
+
+        Every record but the last is marked 'continued', so after a crash in the middle of
+        the write the reader drops them all: the records take effect together or not at all.
+        """
+        lines = [
+            json.dumps(dict(record, continued=True) if i < len(records) - 1 else record, separators=(",", ":"))
+            for i, record in enumerate(records)
+        ]
+        data = "\n".join(lines) + "\n"
+        count("wal.records", len(records))
+        count("bytes.written", len(data))
+        with open(log_file, "a") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            return f.tell()
+
+    def read(self, log_file):
+        """Return every complete record in the log, dropping a torn tail left by a crash."""
+        if not os.path.exists(log_file):
+            return []
+
+        with open(log_file, "rb") as f:
+            content = f.read()
+        count("bytes.read", len(content))
+
+        # A record is complete only once its newline is on disk, and a batch of records
+        # only once its last record is
+        records = []
+        batch = []
+        complete_length = 0
+        offset = 0
+        for line in content.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            if line.strip():
+                record = json.loads(line)
+                batch.append(record)
+                if record.get("continued"):
+                    continue
+                records.extend(batch)
+                batch = []
+            if not batch:
+                complete_length = offset
+        if complete_length < len(content):
+            with open(log_file, "r+b") as f:
+                f.truncate(complete_length)
+
+        return records
+
+    def apply(self, table, record):
+        """Apply a single insert, update or delete record to an in-memory table (row or columnar)."""
+        op = record["op"]
+        positions = record.get("positions")
+        rows = table["rows"]
+        if op == "insert":
+            rows.extend(record["rows"])
+        elif op == "update":
+            if isinstance(rows, ColumnarRows):
+                rows.update_rows(positions, record["values"])
+            else:
+                targets = rows if positions is None else (rows[position] for position in positions)
+                for row in targets:
+                    row.update(record["values"])
+        elif op == "delete":
+            if isinstance(rows, ColumnarRows):
+                rows.delete_rows(positions)
+            elif positions is None:
+                table["rows"] = []
+            else:
+                deleted = set(positions)
+                table["rows"] = [row for position, row in enumerate(table["rows"]) if position not in deleted]
+        else:
+            raise ValueError(f"Unknown log record operation '{op}'.")
+
+    def truncate(self, log_file):
+        """Empty the log once its records have been folded into the table files."""
+        if os.path.exists(log_file):
+            with open(log_file, "w"):
+                pass
+
+    def remove(self, log_file):
+        """Delete the log of a database that is being removed."""
+        if os.path.exists(log_file):
+            os.remove(log_file)
+
+
+# Shared by every storage instance in the process
+write_ahead_log = WriteAheadLog()